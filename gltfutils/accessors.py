@@ -0,0 +1,196 @@
+"""
+CPU-side access to the data of glTF accessors, as NumPy arrays.
+
+Arrays are zero-copy views of the (loaded or memory-mapped) buffer data, which respect the
+:code:`byteStride` of the accessor (GLTF 1.0) or bufferView (GLTF 2.0).  Sparse accessors are
+materialized into a new array (once, per :code:`Accessor`).  Both the GLTF 1.0 layout (dicts keyed by id)
+and the GLTF 2.0 layout (lists) are supported.
+"""
+import logging
+
+import numpy as np
+
+
+_logger = logging.getLogger(__name__)
+
+
+COMPONENT_TYPE_DTYPES = {
+    5120: np.dtype(np.int8),    # GL_BYTE
+    5121: np.dtype(np.uint8),   # GL_UNSIGNED_BYTE
+    5122: np.dtype('<i2'),      # GL_SHORT
+    5123: np.dtype('<u2'),      # GL_UNSIGNED_SHORT
+    5125: np.dtype('<u4'),      # GL_UNSIGNED_INT
+    5126: np.dtype('<f4'),      # GL_FLOAT
+    5131: np.dtype('<f2')       # GL_HALF_FLOAT (not a glTF component type, used for quantized attributes)
+}
+
+TYPE_SHAPES = {
+    'SCALAR': (),
+    'VEC2': (2,),
+    'VEC3': (3,),
+    'VEC4': (4,),
+    'MAT2': (2, 2),
+    'MAT3': (3, 3),
+    'MAT4': (4, 4)
+}
+
+
+def normalize_array(array):
+    """
+    Converts an array of normalized integer components to float32 (per the glTF / OpenGL normalization rules),
+    arrays of floats are returned as-is.
+    """
+    if array.dtype.kind == 'f':
+        return array
+    info = np.iinfo(array.dtype)
+    normalized = array.astype(np.float32)
+    normalized *= 1.0 / info.max
+    if info.min < 0:
+        np.maximum(normalized, -1.0, out=normalized)
+    return normalized
+
+
+def _get_buffer_data(gltf, buffer_name, uri_path):
+    buffer = gltf['buffers'][buffer_name]
+    if 'data' not in buffer:
+        if uri_path is None:
+            raise Exception('buffer %s has not been loaded' % buffer_name)
+        from gltfutils.gltfutils import get_buffer_data
+        get_buffer_data(buffer, uri_path)
+    return buffer['data']
+
+
+def _strided_view(gltf, bufferView_name, byteOffset, count, dtype, shape, byteStride, uri_path):
+    bufferView = gltf['bufferViews'][bufferView_name]
+    data = _get_buffer_data(gltf, bufferView['buffer'], uri_path)
+    itemsize = dtype.itemsize
+    if len(shape) == 2:
+        # matrices are stored column-major (indexed [column, row] here),
+        # with each column aligned to 4 bytes:
+        n = shape[0]
+        column_size = -(-n * itemsize // 4) * 4
+        element_strides = (column_size, itemsize)
+        element_size = (n - 1) * column_size + n * itemsize
+        packed_size = n * column_size
+    else:
+        element_strides = (itemsize,) * len(shape)
+        element_size = packed_size = int(np.prod(shape, dtype=int)) * itemsize
+    stride = byteStride or packed_size
+    if count == 0:
+        return np.empty((0,) + shape, dtype=dtype)
+    offset = bufferView.get('byteOffset', 0) + byteOffset
+    if byteOffset + (count - 1) * stride + element_size > bufferView['byteLength']:
+        raise Exception('accessor data (offset %d, count %d, stride %d) extends past the end of bufferView %s' %
+                        (byteOffset, count, stride, bufferView_name))
+    return np.ndarray((count,) + shape, dtype=dtype, buffer=data, offset=offset,
+                      strides=(stride,) + element_strides)
+
+
+class Accessor(object):
+    """
+    A view of the data of a glTF accessor.
+
+    :param gltf: the gltf dict
+    :param accessor_name: the id (GLTF 1.0) or index (GLTF 2.0) of the accessor
+    :param uri_path: path which relative buffer URIs are resolved against, if the buffer data has
+                     not already been loaded (attached to the buffers as their :code:`'data'` property)
+    """
+    def __init__(self, gltf, accessor_name, uri_path=None):
+        self.gltf = gltf
+        self.name = accessor_name
+        self.accessor = gltf['accessors'][accessor_name]
+        self.uri_path = uri_path
+        self._array = None
+
+    def __repr__(self):
+        return '<Accessor %s: %d x %s %s%s>' % (self.name, self.count, self.type, self.dtype,
+                                                ' (sparse)' if self.is_sparse else '')
+
+    @property
+    def count(self):
+        return self.accessor['count']
+
+    @property
+    def type(self):
+        return self.accessor['type']
+
+    @property
+    def dtype(self):
+        return COMPONENT_TYPE_DTYPES[self.accessor['componentType']]
+
+    @property
+    def shape(self):
+        """Shape of the array of the accessor's data: :code:`(count,)` followed by the shape of each element."""
+        element_shape = TYPE_SHAPES[self.type]
+        return (self.count,) + element_shape
+
+    @property
+    def normalized(self):
+        return self.accessor.get('normalized', False)
+
+    @property
+    def is_sparse(self):
+        return 'sparse' in self.accessor
+
+    @property
+    def byteStride(self):
+        accessor = self.accessor
+        if 'byteStride' in accessor: # GLTF 1.0
+            return accessor['byteStride']
+        if 'bufferView' in accessor:
+            return self.gltf['bufferViews'][accessor['bufferView']].get('byteStride', 0) # GLTF 2.0
+        return 0
+
+    @property
+    def array(self):
+        """
+        The data of the accessor as an :code:`ndarray` of shape :attr:`shape` and of the accessor's component type.
+        Unless the accessor is sparse, this is a (read-only if the buffer is) view of the buffer data.
+        Matrix elements are indexed [column, row].
+        """
+        if self._array is None:
+            self._array = self._read()
+        return self._array
+
+    def values(self):
+        """
+        The data of the accessor as an :code:`ndarray`, converted to float32 if the accessor is normalized.
+        """
+        if self.normalized:
+            return normalize_array(self.array)
+        return self.array
+
+    def _read(self):
+        accessor = self.accessor
+        shape = TYPE_SHAPES[self.type]
+        if 'bufferView' in accessor:
+            array = _strided_view(self.gltf, accessor['bufferView'], accessor.get('byteOffset', 0), self.count,
+                                  self.dtype, shape, self.byteStride, self.uri_path)
+        else:
+            # (GLTF 2.0) accessors without a bufferView are initialized with zeros:
+            array = np.zeros(self.shape, dtype=self.dtype)
+        if not self.is_sparse:
+            return array
+        if 'bufferView' in accessor:
+            array = array.copy()
+        sparse = accessor['sparse']
+        sparse_count = sparse['count']
+        indices = sparse['indices']
+        indices = _strided_view(self.gltf, indices['bufferView'], indices.get('byteOffset', 0), sparse_count,
+                                COMPONENT_TYPE_DTYPES[indices['componentType']], (), 0, self.uri_path)
+        values = sparse['values']
+        values = _strided_view(self.gltf, values['bufferView'], values.get('byteOffset', 0), sparse_count,
+                               self.dtype, shape, 0, self.uri_path)
+        array[indices] = values
+        _logger.debug('materialized sparse accessor %s (%d of %d elements substituted)',
+                      self.name, sparse_count, self.count)
+        return array
+
+
+def get_accessor_array(gltf, accessor_name, uri_path=None, normalize=False):
+    """
+    Returns the data of an accessor as an :code:`ndarray` (see :attr:`Accessor.array`),
+    converted to float32 if :code:`normalize` is True and the accessor is normalized.
+    """
+    accessor = Accessor(gltf, accessor_name, uri_path=uri_path)
+    return accessor.values() if normalize else accessor.array
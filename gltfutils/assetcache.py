@@ -0,0 +1,240 @@
+"""
+Persistent on-disk cache of decoded assets, keyed by a hash of their encoded content.
+
+Decoded textures are stored (along with their complete mip chains) as raw pixel data which is
+memory-mapped and handed straight to GL when the same image is loaded again, so that on a warm start
+images are neither decoded nor have their mipmaps regenerated.
+Linked shader program binaries are also stored, so that programs need not be recompiled, as are
+the optimized indices of meshes (see :mod:`gltfutils.meshopt`).
+
+The total size of the cache is capped; when it is exceeded, the least recently used entries are evicted.
+"""
+import os
+import os.path
+import struct
+import hashlib
+import tempfile
+from collections import namedtuple
+import logging
+
+import numpy as np
+
+from gltfutils.memutils import map_file
+from gltfutils.textureutils import ImageFormat, get_mip_level_sizes
+
+
+_logger = logging.getLogger(__name__)
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                                 'gltfview')
+DEFAULT_MAX_SIZE = 1024 * 2**20
+
+TEXTURE_EXT = '.tex'
+TEXTURE_MAGIC = b'GLTFVTEX'
+TEXTURE_HEADER = struct.Struct('<8s3I4I4I')
+PROGRAM_EXT = '.prog'
+PROGRAM_MAGIC = b'GLTFVPRG'
+PROGRAM_HEADER = struct.Struct('<8sI')
+INDICES_EXT = '.idx'
+INDICES_MAGIC = b'GLTFVIDX'
+INDICES_HEADER = struct.Struct('<8sI4f')
+_ENTRY_EXTS = (TEXTURE_EXT, PROGRAM_EXT, INDICES_EXT)
+
+# key of the PIL.Image info dict entry which holds the cache key of a decoded image:
+CACHE_KEY_INFO = 'gltfview.cache_key'
+
+
+class CachedTexture(namedtuple('CachedTexture', ['path', 'width', 'height', 'image_format', 'levels'])):
+    """
+    A texture read from the cache: :code:`levels` is the list of the (memory-mapped)
+    tightly packed pixel data of each level of its mip chain.
+    """
+    __slots__ = ()
+    def __reduce__(self):
+        # the memory-mapped data can not be pickled (i.e. returned from a process pool),
+        # so the entry is mapped again by the receiving process:
+        return read_texture, (self.path,)
+
+
+def content_hash(data):
+    """Returns the hex digest of the hash used to key cache entries for the given bytes-like object."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class AssetCache(object):
+    """
+    :param cache_dir: directory in which cache entries are stored (created if it does not exist)
+    :param max_size: maximum total size (in bytes) of all cache entries
+    """
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        if cache_dir is None:
+            cache_dir = DEFAULT_CACHE_DIR
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.evict()
+
+    def __repr__(self):
+        return 'AssetCache(%r, max_size=%d)' % (self.cache_dir, self.max_size)
+
+    def image_key(self, source, internal_format=None):
+        """
+        Returns the cache key of an encoded image,
+        given either its filename or its encoded bytes, and the internal format of the texture it is
+        uploaded to (if not that of the image, see :data:`gltfutils.textureutils.IMAGE_MODE_FORMATS`),
+        since the texture levels which are stored are read back from the texture.
+        """
+        if isinstance(source, str):
+            source = map_file(source)
+        key = content_hash(source)
+        if internal_format is not None:
+            key = content_hash(('%s:%d' % (key, internal_format)).encode())
+        return key
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def get_texture(self, key):
+        """
+        Returns the :code:`CachedTexture` stored under the given key,
+        or :code:`None` if there is no (valid) such entry.
+        """
+        path = self._path(key, TEXTURE_EXT)
+        try:
+            texture = read_texture(path)
+        except OSError:
+            return None
+        except Exception as err:
+            _logger.warning('removing invalid cache entry "%s": %s', path, err)
+            self._remove(path)
+            return None
+        self._touch(path)
+        _logger.debug('read cached texture "%s"', path)
+        return texture
+
+    def put_texture(self, key, width, height, image_format, levels):
+        """
+        Stores a texture with the given level 0 size, :code:`ImageFormat` and
+        list of tightly packed pixel data of each level of its mip chain.
+        """
+        header = TEXTURE_HEADER.pack(TEXTURE_MAGIC, width, height, len(levels),
+                                     image_format.format, image_format.type,
+                                     image_format.internal_format, image_format.bytes_per_pixel,
+                                     *(image_format.swizzle or (0, 0, 0, 0)))
+        self._write(self._path(key, TEXTURE_EXT), [header] + list(levels))
+
+    def get_program_binary(self, key):
+        """
+        Returns the tuple :code:`(binary_format, binary)` of the program binary stored under the given key,
+        or :code:`None` if there is no (valid) such entry.
+        """
+        path = self._path(key, PROGRAM_EXT)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < PROGRAM_HEADER.size or data[:len(PROGRAM_MAGIC)] != PROGRAM_MAGIC:
+            _logger.warning('removing invalid cache entry "%s"', path)
+            self._remove(path)
+            return None
+        _, binary_format = PROGRAM_HEADER.unpack_from(data)
+        self._touch(path)
+        return binary_format, data[PROGRAM_HEADER.size:]
+
+    def put_program_binary(self, key, binary_format, binary):
+        """Stores a program binary (as returned by :code:`glGetProgramBinary`) of the given format."""
+        self._write(self._path(key, PROGRAM_EXT), [PROGRAM_HEADER.pack(PROGRAM_MAGIC, binary_format), binary])
+
+    def get_optimized_indices(self, key):
+        """
+        Returns the tuple :code:`(indices, stats)` of the optimized indices (an array of uint32) stored under the
+        given key and the statistics stored with them, or :code:`None` if there is no (valid) such entry.
+        """
+        path = self._path(key, INDICES_EXT)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < INDICES_HEADER.size or data[:len(INDICES_MAGIC)] != INDICES_MAGIC or \
+           len(data) != INDICES_HEADER.size + 4 * INDICES_HEADER.unpack_from(data)[1]:
+            _logger.warning('removing invalid cache entry "%s"', path)
+            self._remove(path)
+            return None
+        _, count, *stats = INDICES_HEADER.unpack_from(data)
+        self._touch(path)
+        return np.frombuffer(data, dtype='<u4', count=count, offset=INDICES_HEADER.size), tuple(stats)
+
+    def put_optimized_indices(self, key, indices, stats):
+        """Stores optimized indices (an array of uint32) and 4 (float) statistics of them."""
+        indices = np.ascontiguousarray(indices, dtype='<u4')
+        self._write(self._path(key, INDICES_EXT), [INDICES_HEADER.pack(INDICES_MAGIC, len(indices), *stats),
+                                                   indices.tobytes()])
+
+    def _write(self, path, chunks):
+        # write to a temporary file which is then renamed, so that other viewers
+        # sharing the cache never see a partially written entry:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            _logger.warning('failed to write cache entry "%s": %s', path, err)
+            self._remove(tmp_path)
+            return
+        _logger.debug('wrote cache entry "%s"', path)
+        self.evict()
+
+    def _touch(self, path):
+        # the modification time of an entry records when it was last used:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes least recently used entries until the total size of the cache is within its maximum size."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(_ENTRY_EXTS):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+            _logger.debug('evicted cache entry "%s"', path)
+
+
+def read_texture(path):
+    """Reads the texture cache entry at the given path, returning a :code:`CachedTexture`."""
+    data = map_file(path)
+    if len(data) < TEXTURE_HEADER.size:
+        raise Exception('entry is too short (%d bytes)' % len(data))
+    magic, width, height, num_levels, format, type, internal_format, bytes_per_pixel, *swizzle = \
+        TEXTURE_HEADER.unpack_from(data)
+    if magic != TEXTURE_MAGIC:
+        raise Exception('entry has an invalid magic number: %s' % magic)
+    image_format = ImageFormat(format, type, internal_format, bytes_per_pixel,
+                               tuple(swizzle) if any(swizzle) else None)
+    levels = []
+    offset = TEXTURE_HEADER.size
+    for w, h in get_mip_level_sizes(width, height)[:num_levels]:
+        size = w * h * bytes_per_pixel
+        levels.append(data[offset:offset+size])
+        offset += size
+    if offset != len(data):
+        raise Exception('entry has the wrong length (%d bytes, expected %d)' % (len(data), offset))
+    return CachedTexture(path, width, height, image_format, levels)
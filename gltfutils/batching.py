@@ -0,0 +1,166 @@
+"""
+Static batching of the primitives of many nodes into merged vertex / index buffers.
+
+The (triangle-based) primitives of static nodes which have the same material and attribute layout
+(the same semantics and accessor types) are merged, at load time, into one vertex buffer and one index
+buffer per group: their vertices are transformed into world space by the world matrices of their nodes
+(positions by the world matrix, normals by its inverse transpose, tangents by its linear part), and
+triangle strips / fans are converted to triangle lists.  Each group is then drawn with a single
+:code:`glDrawElements` (with an identity model matrix), or, when only some of its nodes are visible,
+a single :code:`glMultiDrawElements` of the index ranges of those nodes.
+
+Since the vertices are transformed when the batches are built, the transforms of batched nodes
+must not change afterwards.
+
+As elsewhere in gltfutils, matrices are stored transposed (i.e. they transform row vectors).
+"""
+from ctypes import c_void_p, POINTER
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+from gltfutils.gltfutils import create_primitive_vertex_array
+from gltfutils.accessors import get_accessor_array
+from gltfutils.picking import triangulate
+from gltfutils.transforms import EXT_MESH_GPU_INSTANCING
+
+
+_logger = logging.getLogger(__name__)
+
+
+# the minimum number of primitives of a group for them to be batched:
+BATCH_MIN_PRIMITIVES = 2
+
+BATCHED_MODES = (gl.GL_TRIANGLES, gl.GL_TRIANGLE_STRIP, gl.GL_TRIANGLE_FAN)
+
+
+def find_static_batches(gltf, nodes, node_mask=None, min_primitives=BATCH_MIN_PRIMITIVES):
+    """
+    Returns a dict mapping each key :code:`(material, attribute layout)` to the list of :code:`(position, primitive)`
+    of the (triangle-based) primitives of the given nodes (for which :code:`node_mask` is True, if it is given)
+    with that material and attribute layout, for the groups of at least :code:`min_primitives` primitives.
+    Skinned nodes and nodes which use :code:`EXT_mesh_gpu_instancing` are not batched.
+    """
+    accessors = gltf['accessors']
+    groups = {}
+    for node_slot, node in enumerate(nodes):
+        if node_mask is not None and not node_mask[node_slot]:
+            continue
+        if 'skin' in node or EXT_MESH_GPU_INSTANCING in node.get('extensions', {}):
+            continue
+        for mesh_name in node.get('meshes', [node['mesh']] if 'mesh' in node else []):
+            for primitive in gltf['meshes'][mesh_name]['primitives']:
+                if primitive.get('mode', gl.GL_TRIANGLES) not in BATCHED_MODES or primitive.get('targets') or \
+                   'POSITION' not in primitive.get('attributes', {}):
+                    continue
+                layout = tuple(sorted((semantic, accessors[accessor_name]['type'])
+                                      for semantic, accessor_name in primitive['attributes'].items()))
+                groups.setdefault((primitive['material'], layout), []).append((node_slot, primitive))
+    return {key: members for key, members in groups.items() if len(members) >= min_primitives}
+
+
+def transform_vertices(semantic, data, world_matrix):
+    """
+    Returns the vertex data (an array of shape :code:`(V, n)`) of an attribute, transformed into world space
+    by a (transposed) world matrix if its semantic is POSITION, NORMAL or TANGENT.
+    """
+    linear = world_matrix[:3,:3]
+    if semantic == 'POSITION':
+        return data.dot(linear) + world_matrix[3,:3]
+    if semantic == 'NORMAL':
+        normals = data.dot(np.linalg.inv(linear).T)
+        return normals / np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:,None]
+    if semantic == 'TANGENT':
+        tangents = data.copy()
+        tangents[:,:3] = data[:,:3].dot(linear)
+        tangents[:,:3] /= np.maximum(np.linalg.norm(tangents[:,:3], axis=1), 1e-12)[:,None]
+        if tangents.shape[1] == 4 and np.linalg.det(linear) < 0:
+            tangents[:,3] *= -1
+        return tangents
+    return data
+
+
+class StaticBatch(object):
+    """
+    The merged vertex and index buffers of a group of primitives (see :func:`find_static_batches`),
+    with a vertex array object which binds them to the program of their material.
+
+    :param gltf: the gltf dict
+    :param material_name: id (GLTF 1.0) or index (GLTF 2.0) of the material of the primitives
+    :param members: list of :code:`(position, primitive)` of the primitives
+    :param world_matrices: the (transposed) world matrices of the nodes, by position
+    :param uri_path: path used to resolve the URIs of buffers which have not been loaded
+    """
+    def __init__(self, gltf, material_name, members, world_matrices, uri_path=None):
+        self.material_name = material_name
+        semantics = sorted(members[0][1]['attributes'].keys())
+        vertex_arrays = {semantic: [] for semantic in semantics}
+        index_arrays = []
+        num_vertices = 0
+        for node_slot, primitive in members:
+            world_matrix = world_matrices[node_slot].astype(np.float64)
+            for semantic in semantics:
+                data = get_accessor_array(gltf, primitive['attributes'][semantic], uri_path=uri_path, normalize=True)
+                data = data.reshape(len(data), -1).astype(np.float64)
+                vertex_arrays[semantic].append(transform_vertices(semantic, data, world_matrix).astype(np.float32))
+            count = len(vertex_arrays['POSITION'][-1])
+            if 'indices' in primitive:
+                indices = get_accessor_array(gltf, primitive['indices'], uri_path=uri_path)
+            else:
+                indices = np.arange(count)
+            triangles = triangulate(indices, primitive.get('mode', gl.GL_TRIANGLES)).astype(np.int64)
+            if np.linalg.det(world_matrix[:3,:3]) < 0:
+                # (mirroring transforms reverse the winding of the triangles)
+                triangles = triangles[:,::-1]
+            index_arrays.append(triangles.ravel() + num_vertices)
+            num_vertices += count
+        self.node_slots = np.array([node_slot for node_slot, _ in members], dtype=np.int64)
+        self.counts = np.array([len(indices) for indices in index_arrays], dtype=np.int32)
+        self.num_vertices = num_vertices
+        self.count = int(self.counts.sum())
+        index_dtype = np.uint16 if num_vertices <= 0xffff else np.uint32
+        self.index_type = gl.GL_UNSIGNED_SHORT if index_dtype == np.uint16 else gl.GL_UNSIGNED_INT
+        self.offsets = np.zeros(len(self.counts), dtype=np.intp)
+        self.offsets[1:] = np.cumsum(self.counts[:-1]) * np.dtype(index_dtype).itemsize
+        indices = np.concatenate(index_arrays).astype(index_dtype)
+        # the attributes of all primitives are stored one after another in a single vertex buffer:
+        vertex_data = [np.concatenate(vertex_arrays[semantic]) for semantic in semantics]
+        vertex_buffer = np.concatenate([data.ravel() for data in vertex_data])
+        self.buffer_ids = gl.glGenBuffers(2)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer_ids[0])
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, vertex_buffer.nbytes, vertex_buffer, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.buffer_ids[1])
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, 0)
+        # (the vertex array object is set up from accessors of the merged buffer)
+        accessors = {}
+        byte_offset = 0
+        for semantic, data in zip(semantics, vertex_data):
+            accessors[semantic] = {'bufferView': 0, 'byteOffset': byte_offset, 'componentType': gl.GL_FLOAT,
+                                   'count': len(data),
+                                   'type': gltf['accessors'][members[0][1]['attributes'][semantic]]['type']}
+            byte_offset += data.nbytes
+        batch_gltf = dict(gltf, accessors=accessors,
+                          bufferViews=[{'id': self.buffer_ids[0], 'target': gl.GL_ARRAY_BUFFER}])
+        self.vao = create_primitive_vertex_array({'attributes': {semantic: semantic for semantic in semantics}},
+                                                 material_name, batch_gltf)
+        gl.glBindVertexArray(self.vao)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.buffer_ids[1])
+        gl.glBindVertexArray(0)
+        _logger.debug('batched %d primitives of material %s: %d vertices, %d indices',
+                      len(members), material_name, num_vertices, self.count)
+
+    def draw(self, mask):
+        """
+        Renders (with the VAO of the batch bound) the primitives for which :code:`mask` (an array with an element
+        for each primitive of the batch, e.g. :code:`node_mask[batch.node_slots]`) is True.
+        """
+        if mask.all():
+            gl.glDrawElements(gl.GL_TRIANGLES, self.count, self.index_type, c_void_p(0))
+        else:
+            counts = self.counts[mask]
+            offsets = self.offsets[mask]
+            gl.glMultiDrawElements(gl.GL_TRIANGLES, counts, self.index_type,
+                                   offsets.ctypes.data_as(POINTER(c_void_p)), len(counts))
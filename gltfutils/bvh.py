@@ -0,0 +1,347 @@
+"""
+Bounding volume hierarchy over axis-aligned bounding boxes (e.g. the world-space bounds of the nodes of a scene).
+
+The tree is stored in flat arrays: the bounds of each tree node, the index of its first child (the two
+children of an internal node are adjacent, leaves have no children) and the range of item positions it
+spans.  Items are permuted (:attr:`BVH.item_indices`) so that the items of every subtree are contiguous.
+The tree is built top-down with binned surface area heuristic (SAH) splits, or (much faster, for large
+numbers of items such as the triangles of meshes) by ordering the items along a Morton curve and splitting
+the ranges of items in half, one level at a time.  The tree may be refit to new item bounds (e.g. after
+the transforms of the nodes have changed) without being rebuilt.
+
+Queries traverse the tree breadth-first, testing all tree nodes of a level at once: subtrees which are
+entirely rejected (e.g. outside of a view frustum) are skipped, subtrees which are entirely accepted
+(e.g. inside of a view frustum) are accepted without visiting their descendants.
+Rays are cast depth-first, visiting the nearer child first and skipping subtrees beyond the nearest hit.
+"""
+import heapq
+import logging
+
+import numpy as np
+
+
+_logger = logging.getLogger(__name__)
+
+
+class BVH(object):
+    """
+    :param bounds: array of shape :code:`(N, 2, 3)` of the :code:`[min, max]` bounds of the items
+    :param max_leaf_size: maximum number of items of a leaf
+    :param num_bins: number of bins along the split axis evaluated by the SAH
+    :param sah: if False, the tree is built from the Morton order of the items rather than with SAH splits
+    """
+    def __init__(self, bounds, max_leaf_size=4, num_bins=16, sah=True):
+        self.max_leaf_size = max_leaf_size
+        self.num_bins = num_bins
+        self.sah = sah
+        self.bounds = np.array(bounds, dtype=np.float32).reshape(-1, 2, 3)
+        self.build()
+
+    def __len__(self):
+        return len(self.bounds)
+
+    def build(self):
+        """Builds the tree over the current item bounds."""
+        bounds = self.bounds
+        n = len(bounds)
+        centroids = 0.5 * (bounds[:,0] + bounds[:,1])
+        if self.sah:
+            self._build_sah(bounds, centroids)
+        else:
+            self._build_morton(centroids)
+        node_children = self.node_children
+        self.node_bounds = np.empty((len(node_children), 2, 3), dtype=np.float32)
+        self.is_leaf = self.node_children < 0
+        # (the leaves, ordered by the positions of their items, which they partition)
+        leaves = np.flatnonzero(self.is_leaf)
+        self._leaves = leaves[np.argsort(self.node_starts[leaves])]
+        # the internal nodes at each depth, deepest first (the order in which they are refit):
+        internal = np.flatnonzero(~self.is_leaf)
+        self._levels = [internal[self.node_depths[internal] == depth]
+                        for depth in range(self.node_depths.max(initial=0), -1, -1)]
+        self.refit()
+        _logger.debug('built BVH: %d items, %d nodes (%d leaves), depth %d',
+                      n, len(node_children), len(self._leaves), self.node_depths.max(initial=0))
+
+    def _build_sah(self, bounds, centroids):
+        n = len(bounds)
+        item_indices = np.arange(n)
+        # (the nodes are numbered in the order they are created, children after their parent)
+        node_children = [-1]
+        node_starts = [0]
+        node_ends = [n]
+        node_depths = [0]
+        stack = [0] if n else []
+        while stack:
+            i = stack.pop()
+            start, end = node_starts[i], node_ends[i]
+            if end - start <= self.max_leaf_size:
+                continue
+            split = self._split(item_indices, start, end, bounds, centroids)
+            if split is None:
+                continue
+            node_children[i] = len(node_children)
+            for child_start, child_end in ((start, split), (split, end)):
+                stack.append(len(node_children))
+                node_children.append(-1)
+                node_starts.append(child_start)
+                node_ends.append(child_end)
+                node_depths.append(node_depths[i] + 1)
+        self.item_indices = item_indices
+        self.node_children = np.array(node_children, dtype=np.int64)
+        self.node_starts = np.array(node_starts, dtype=np.int64)
+        self.node_ends = np.array(node_ends, dtype=np.int64)
+        self.node_depths = np.array(node_depths, dtype=np.int64)
+
+    def _build_morton(self, centroids):
+        n = len(centroids)
+        self.item_indices = np.argsort(_morton_codes(centroids), kind='stable')
+        starts, ends, depths, children = [np.zeros(1, dtype=np.int64)], [np.full(1, n, dtype=np.int64)], [], []
+        num_nodes = 1
+        level = np.zeros(1, dtype=np.int64)
+        depth = 0
+        while len(level):
+            # (split the ranges of the nodes of this level with more items than a leaf at their middle)
+            level_starts, level_ends = starts[-1], ends[-1]
+            depths.append(np.full(len(level), depth, dtype=np.int64))
+            split = level_ends - level_starts > self.max_leaf_size
+            level_children = np.full(len(level), -1, dtype=np.int64)
+            num_split = int(split.sum())
+            level_children[split] = num_nodes + 2 * np.arange(num_split)
+            children.append(level_children)
+            middles = (level_starts[split] + level_ends[split]) // 2
+            starts.append(np.stack([level_starts[split], middles], axis=1).ravel())
+            ends.append(np.stack([middles, level_ends[split]], axis=1).ravel())
+            level = np.arange(num_nodes, num_nodes + 2 * num_split)
+            num_nodes += 2 * num_split
+            depth += 1
+        self.node_children = np.concatenate(children)
+        self.node_starts = np.concatenate(starts[:-1])
+        self.node_ends = np.concatenate(ends[:-1])
+        self.node_depths = np.concatenate(depths)
+
+    def _split(self, item_indices, start, end, bounds, centroids):
+        # partitions the items of [start, end) in place, returns the position of the split
+        # (or None if the items should not be split):
+        items = item_indices[start:end]
+        item_centroids = centroids[items]
+        cmin, cmax = item_centroids.min(axis=0), item_centroids.max(axis=0)
+        axis = int(np.argmax(cmax - cmin))
+        extent = cmax[axis] - cmin[axis]
+        if extent <= 0:
+            # (coincident centroids, split in the middle)
+            return (start + end) // 2
+        num_bins = self.num_bins
+        bins = ((item_centroids[:,axis] - cmin[axis]) * (num_bins / extent)).astype(np.int64)
+        np.minimum(bins, num_bins - 1, out=bins)
+        order = np.argsort(bins, kind='stable')
+        items = items[order]
+        bins = bins[order]
+        item_indices[start:end] = items
+        bin_starts = np.searchsorted(bins, np.arange(num_bins + 1))
+        nonempty = np.flatnonzero(bin_starts[1:] > bin_starts[:-1])
+        item_bounds = bounds[items]
+        bin_mins = np.minimum.reduceat(item_bounds[:,0], bin_starts[nonempty])
+        bin_maxs = np.maximum.reduceat(item_bounds[:,1], bin_starts[nonempty])
+        # the costs of splitting between each pair of consecutive non-empty bins:
+        left_counts = bin_starts[nonempty[1:]]
+        right_counts = (end - start) - left_counts
+        left_areas = _surface_areas(np.minimum.accumulate(bin_mins)[:-1], np.maximum.accumulate(bin_maxs)[:-1])
+        right_areas = _surface_areas(np.minimum.accumulate(bin_mins[::-1])[::-1][1:],
+                                     np.maximum.accumulate(bin_maxs[::-1])[::-1][1:])
+        costs = left_counts * left_areas + right_counts * right_areas
+        return start + int(left_counts[np.argmin(costs)])
+
+    def refit(self, bounds=None):
+        """Updates the bounds of all tree nodes (optionally, given new item bounds), without changing the tree."""
+        if bounds is not None:
+            self.bounds[...] = bounds
+        if not len(self.bounds):
+            return
+        node_bounds = self.node_bounds
+        leaves = self._leaves
+        item_bounds = self.bounds[self.item_indices]
+        node_bounds[leaves,0] = np.minimum.reduceat(item_bounds[:,0], self.node_starts[leaves])
+        node_bounds[leaves,1] = np.maximum.reduceat(item_bounds[:,1], self.node_starts[leaves])
+        for nodes in self._levels:
+            children = self.node_children[nodes]
+            node_bounds[nodes,0] = np.minimum(node_bounds[children,0], node_bounds[children+1,0])
+            node_bounds[nodes,1] = np.maximum(node_bounds[children,1], node_bounds[children+1,1])
+
+    def _traverse(self, test_nodes, test_items):
+        # returns the boolean mask of the accepted items, given functions which test an array of bounds and
+        # return (rejected, accepted) masks of the tree nodes / the mask of the accepted items:
+        n = len(self.bounds)
+        accepted = np.zeros(n, dtype=bool)
+        if not n:
+            return accepted
+        # (+1 / -1 at the starts / ends of the ranges of accepted subtrees, of the positions of accepted items)
+        ranges = np.zeros(n + 1, dtype=np.int64)
+        frontier = np.zeros(1, dtype=np.int64)
+        while len(frontier):
+            rejected, accepted_nodes = test_nodes(self.node_bounds[frontier])
+            accepted_nodes &= ~rejected
+            np.add.at(ranges, self.node_starts[frontier[accepted_nodes]], 1)
+            np.add.at(ranges, self.node_ends[frontier[accepted_nodes]], -1)
+            frontier = frontier[~(rejected | accepted_nodes)]
+            leaves = frontier[self.is_leaf[frontier]]
+            if len(leaves):
+                positions = np.concatenate([np.arange(start, end) for start, end
+                                            in zip(self.node_starts[leaves].tolist(), self.node_ends[leaves].tolist())])
+                items = self.item_indices[positions]
+                accepted[items[test_items(self.bounds[items])]] = True
+            children = self.node_children[frontier[~self.is_leaf[frontier]]]
+            frontier = np.concatenate([children, children + 1])
+        accepted[self.item_indices[np.cumsum(ranges[:-1]) > 0]] = True
+        return accepted
+
+    def query_frustum(self, planes):
+        """
+        Returns the boolean mask of the items which are (at least partially) inside the frustum
+        with the given planes (an array of shape :code:`(6, 4)`, see :func:`gltfutils.culling.calc_frustum_planes`).
+        """
+        planes = np.asarray(planes, dtype=np.float32).reshape(-1, 4)
+        normals, offsets = planes[:,:3], planes[:,3]
+        abs_normals = np.abs(normals)
+        def distances(bounds):
+            centers = 0.5 * (bounds[:,1] + bounds[:,0])
+            extents = 0.5 * (bounds[:,1] - bounds[:,0])
+            return centers.dot(normals.T) + offsets, extents.dot(abs_normals.T)
+        def test_nodes(bounds):
+            center_distances, radii = distances(bounds)
+            return ((center_distances + radii < 0).any(axis=1),
+                    (center_distances - radii >= 0).all(axis=1))
+        def test_items(bounds):
+            center_distances, radii = distances(bounds)
+            return (center_distances + radii >= 0).all(axis=1)
+        return self._traverse(test_nodes, test_items)
+
+    def query_box(self, box):
+        """Returns the boolean mask of the items whose bounds intersect the box :code:`[min, max]`."""
+        box = np.asarray(box, dtype=np.float32).reshape(2, 3)
+        def test_items(bounds):
+            return ((bounds[:,0] <= box[1]) & (bounds[:,1] >= box[0])).all(axis=1)
+        def test_nodes(bounds):
+            return ~test_items(bounds), ((bounds[:,0] >= box[0]) & (bounds[:,1] <= box[1])).all(axis=1)
+        return self._traverse(test_nodes, test_items)
+
+    def query_sphere(self, center, radius):
+        """Returns the boolean mask of the items whose bounds intersect the sphere with the given center and radius."""
+        center = np.asarray(center, dtype=np.float32).reshape(3)
+        r2 = radius**2
+        def test_items(bounds):
+            return _box_distances2(bounds, center) <= r2
+        def test_nodes(bounds):
+            # (the box is inside the sphere if its furthest corner is)
+            furthest = np.maximum(np.abs(bounds[:,0] - center), np.abs(bounds[:,1] - center))
+            return ~test_items(bounds), (furthest**2).sum(axis=1) <= r2
+        return self._traverse(test_nodes, test_items)
+
+    def nearest(self, point):
+        """
+        Returns the index of the item whose bounds are nearest to the point and the distance to them
+        (zero if the point is inside them), or :code:`(None, inf)` if there are no items.
+        """
+        point = np.asarray(point, dtype=np.float32).reshape(3)
+        best_item, best_distance2 = None, np.inf
+        if not len(self.bounds):
+            return best_item, np.sqrt(best_distance2)
+        # best-first search, ordered by the distance to the bounds of the tree nodes:
+        heap = [(float(_box_distances2(self.node_bounds[:1], point)[0]), 0)]
+        while heap:
+            distance2, i = heapq.heappop(heap)
+            if distance2 >= best_distance2:
+                break
+            if self.is_leaf[i]:
+                items = self.item_indices[self.node_starts[i]:self.node_ends[i]]
+                distances2 = _box_distances2(self.bounds[items], point)
+                j = int(np.argmin(distances2))
+                if distances2[j] < best_distance2:
+                    best_item, best_distance2 = int(items[j]), float(distances2[j])
+                continue
+            child = self.node_children[i]
+            for c, d2 in zip((child, child + 1), _box_distances2(self.node_bounds[child:child+2], point).tolist()):
+                if d2 < best_distance2:
+                    heapq.heappush(heap, (d2, int(c)))
+        return best_item, np.sqrt(best_distance2)
+
+    def raycast(self, origin, direction, intersect_items, max_distance=np.inf):
+        """
+        Finds the nearest intersection of a ray with the items.
+
+        :param intersect_items: function which intersects the ray with the items of a leaf (given their indices),
+                                returning the array of the distances (in units of the length of :code:`direction`)
+                                along the ray of the intersection with each item (:code:`inf` if there is none),
+                                and any per-item data of the intersections (indexable by position)
+        :returns: :code:`(distance, item, data)` of the nearest intersection (where :code:`data` is that of
+                  the intersected item), or :code:`None` if the ray does not intersect any item
+        """
+        origin = np.asarray(origin, dtype=np.float64).reshape(3)
+        direction = np.asarray(direction, dtype=np.float64).reshape(3)
+        with np.errstate(divide='ignore'):
+            inv_direction = 1.0 / direction
+        node_bounds = self.node_bounds
+        def entry_distances(nodes):
+            # (slab test of the ray against the bounds of the nodes, inf for the nodes which it misses)
+            with np.errstate(invalid='ignore'):
+                t0 = (node_bounds[nodes,0] - origin) * inv_direction
+                t1 = (node_bounds[nodes,1] - origin) * inv_direction
+            t0, t1 = np.fmin(t0, t1), np.fmax(t0, t1)
+            t_enter = np.maximum(t0.max(axis=1), 0.0)
+            t_exit = t1.min(axis=1)
+            return np.where(t_enter <= t_exit, t_enter, np.inf)
+        hit = None
+        if not len(self.bounds):
+            return hit
+        stack = [(float(entry_distances(slice(0, 1))[0]), 0)]
+        while stack:
+            t, i = stack.pop()
+            if t >= max_distance:
+                continue
+            if self.is_leaf[i]:
+                items = self.item_indices[self.node_starts[i]:self.node_ends[i]]
+                distances, data = intersect_items(items)
+                j = int(np.argmin(distances))
+                if distances[j] < max_distance:
+                    max_distance = float(distances[j])
+                    hit = (max_distance, int(items[j]), data[j])
+                continue
+            child = int(self.node_children[i])
+            t_near, t_far = entry_distances(slice(child, child + 2)).tolist()
+            # (push the farther child first, so that the nearer child is visited first)
+            if t_near <= t_far:
+                stack.append((t_far, child + 1))
+                stack.append((t_near, child))
+            else:
+                stack.append((t_near, child))
+                stack.append((t_far, child + 1))
+        return hit
+
+
+def _morton_codes(points):
+    # the 30-bit Morton codes of points, quantized to 10 bits per axis within their bounds:
+    if not len(points):
+        return np.zeros(0, dtype=np.uint64)
+    pmin, pmax = points.min(axis=0), points.max(axis=0)
+    scale = np.where(pmax > pmin, 1023.0 / np.where(pmax > pmin, pmax - pmin, 1.0), 0.0)
+    quantized = ((points - pmin) * scale).astype(np.uint64)
+    codes = np.zeros(len(points), dtype=np.uint64)
+    for axis in range(3):
+        x = quantized[:,axis]
+        # (spread the bits of x apart by 2)
+        x = (x | (x << np.uint64(16))) & np.uint64(0x030000FF)
+        x = (x | (x << np.uint64(8))) & np.uint64(0x0300F00F)
+        x = (x | (x << np.uint64(4))) & np.uint64(0x030C30C3)
+        x = (x | (x << np.uint64(2))) & np.uint64(0x09249249)
+        codes |= x << np.uint64(2 - axis)
+    return codes
+
+
+def _surface_areas(mins, maxs):
+    extents = maxs - mins
+    return extents[:,0]*extents[:,1] + extents[:,1]*extents[:,2] + extents[:,2]*extents[:,0]
+
+
+def _box_distances2(bounds, point):
+    # squared distances from a point to boxes (zero for boxes which contain it)
+    return (np.maximum(np.maximum(bounds[:,0] - point, point - bounds[:,1]), 0.0)**2).sum(axis=1)
@@ -0,0 +1,50 @@
+"""
+View-frustum culling of axis-aligned bounding boxes.
+
+The 6 planes of the view frustum are extracted from the combined view-projection matrix, and the
+world-space bounding boxes of all nodes are tested against all planes (of one or more views)
+in a single vectorized pass.
+
+As elsewhere in gltfutils, matrices are stored transposed (i.e. they transform row vectors).
+"""
+import logging
+
+import numpy as np
+
+
+_logger = logging.getLogger(__name__)
+
+
+def calc_frustum_planes(projection_matrices, view_matrices):
+    """
+    Returns the planes of the view frustum(s) of the given projection and view matrices
+    (arrays of shape :code:`(4, 4)` or :code:`(E, 4, 4)`), as an array of shape :code:`(E, 6, 4)`
+    of plane equations :code:`(a, b, c, d)` (normalized, pointing into the frustum):
+    left, right, bottom, top, near, far.
+    """
+    projection_matrices = np.asarray(projection_matrices, dtype=np.float32).reshape(-1, 4, 4)
+    view_matrices = np.asarray(view_matrices, dtype=np.float32).reshape(-1, 4, 4)
+    # clip coordinates are the (row vector) world coordinates times the view-projection matrix,
+    # so each plane is a sum / difference of its columns (-w <= x, y, z <= w):
+    columns = np.swapaxes(np.matmul(view_matrices, projection_matrices), -1, -2)
+    planes = np.empty((len(columns), 6, 4), dtype=np.float32)
+    planes[:,0::2] = columns[:,None,3] + columns[:,:3]
+    planes[:,1::2] = columns[:,None,3] - columns[:,:3]
+    planes /= np.linalg.norm(planes[...,:3], axis=-1)[...,None]
+    return planes
+
+
+def cull_boxes(planes, bounds):
+    """
+    Tests axis-aligned boxes (an array of shape :code:`(N, 2, 3)` of :code:`[min, max]`) against
+    the frustum planes of :code:`E` views (an array of shape :code:`(E, 6, 4)`, see :func:`calc_frustum_planes`),
+    returning an array of shape :code:`(E, N)` which is True for each box which is (at least partially)
+    inside each frustum.  The test is conservative, i.e. some boxes outside a frustum may not be culled.
+    """
+    centers = 0.5 * (bounds[:,1] + bounds[:,0])
+    extents = 0.5 * (bounds[:,1] - bounds[:,0])
+    # the signed distance to each plane of the corner of each box which is furthest along the plane's normal:
+    distances = np.einsum('epi,ni->enp', planes[...,:3], centers)
+    distances += np.einsum('epi,ni->enp', np.abs(planes[...,:3]), extents)
+    distances += planes[:,None,:,3]
+    return (distances >= 0).all(axis=-1)
@@ -0,0 +1,157 @@
+"""
+Loading of .gltf (JSON) files with embedded base64 data URIs, in bounded memory.
+
+The file is memory-mapped and scanned for base64 data URIs; the JSON is then parsed with each URI
+replaced by a :code:`DataURI`, which refers to the (memory-mapped) encoded payload rather than
+holding it as a string.  Payloads are decoded only when they are used, chunk by chunk into a
+preallocated buffer, and the pages of each encoded chunk are released once it is decoded,
+so that the encoded text is never held in memory alongside the decoded data.
+"""
+import re
+import json
+import binascii
+import logging
+
+from gltfutils.memutils import map_file, release_pages
+
+
+_logger = logging.getLogger(__name__)
+
+
+DECODE_CHUNK_SIZE = 4 * 2**20 # must be a multiple of 4
+_DATA_URI_RE = re.compile(rb'"data:([^",;]*)(?:;[^",;]*)*;base64,')
+_MARKER_PREFIX = 'gltfview:data-uri:'
+_URLSAFE_TO_STANDARD = bytes.maketrans(b'-_', b'+/')
+
+
+class DataURI(object):
+    """
+    A base64 data URI within a memory-mapped file, whose payload has not been decoded.
+
+    :param media_type: the media type of the URI, e.g. :code:`'image/png'`
+    :param mapped: the :code:`mmap` of the file
+    :param start: offset of the start of the base64 encoded payload within the file
+    :param end: offset of the end of the payload
+    """
+    def __init__(self, media_type, mapped, start, end):
+        self.media_type = media_type
+        self.mapped = mapped
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return '<DataURI %s, %d encoded bytes>' % (self.media_type, self.end - self.start)
+
+    def decode(self):
+        """Decodes the payload, returning a :code:`memoryview` of the decoded bytes."""
+        def release(chunk_start, chunk_end):
+            release_pages(self.mapped, self.start + chunk_start, self.start + chunk_end)
+        return memoryview(decode_base64(memoryview(self.mapped)[self.start:self.end], chunk_decoded=release))
+
+
+def is_data_uri(uri):
+    """Returns True if the given uri (either a str or a :code:`DataURI`) is a base64 data URI."""
+    return isinstance(uri, DataURI) or (isinstance(uri, str) and uri.startswith('data:') and ';base64,' in uri[:256])
+
+
+def decode_data_uri(uri):
+    """Decodes a base64 data URI (either a str or a :code:`DataURI`), returning a :code:`memoryview` of the decoded bytes."""
+    if isinstance(uri, DataURI):
+        return uri.decode()
+    return memoryview(decode_base64(memoryview(uri.encode('ascii'))[uri.index(',')+1:]))
+
+
+def get_decoded_length(payload):
+    """Returns the number of bytes encoded by a base64 payload (bytes-like object, which may omit its padding)."""
+    n = len(payload)
+    while n and payload[n-1] == ord('='):
+        n -= 1
+    return 3 * (n // 4) + max(0, n % 4 - 1)
+
+
+def decode_base64(payload, chunk_decoded=None):
+    """
+    Decodes a base64 payload (standard or URL-safe alphabet, str or bytes-like object),
+    returning a :code:`bytearray`.  The payload is decoded in chunks into a preallocated buffer,
+    so no more than one chunk of the encoded data is copied at a time.
+
+    :param chunk_decoded: optional function which is called with the start and end offsets
+                          of each chunk of the payload once it has been decoded
+    """
+    if isinstance(payload, str):
+        payload = memoryview(payload.encode('ascii'))
+    else:
+        payload = memoryview(payload).cast('B')
+    decoded = bytearray(get_decoded_length(payload))
+    offset = 0
+    for i in range(0, len(payload), DECODE_CHUNK_SIZE):
+        chunk = bytes(payload[i:i+DECODE_CHUNK_SIZE]).translate(_URLSAFE_TO_STANDARD)
+        if len(chunk) % 4:
+            chunk += b'=' * (4 - len(chunk) % 4)
+        decoded_chunk = binascii.a2b_base64(chunk)
+        decoded[offset:offset+len(decoded_chunk)] = decoded_chunk
+        offset += len(decoded_chunk)
+        if chunk_decoded is not None:
+            chunk_decoded(i, min(i + DECODE_CHUNK_SIZE, len(payload)))
+    if offset != len(decoded):
+        raise Exception('base64 payload decoded to %d bytes, expected %d' % (offset, len(decoded)))
+    return decoded
+
+
+def _scan_payload(mapped, start):
+    """
+    Finds the end of the JSON string which starts at the given offset, returning the tuple
+    :code:`(end, escaped)` of the offset of its closing quote and whether it contains any escapes.
+    The string is scanned in chunks, each of which is released once it is scanned
+    (the pages are not needed again until the payload is decoded).
+    """
+    escaped = False
+    pos = start
+    while pos < len(mapped):
+        chunk_end = min(pos + DECODE_CHUNK_SIZE, len(mapped))
+        end = mapped.find(b'"', pos, chunk_end)
+        scanned_end = chunk_end if end == -1 else end
+        escaped = escaped or mapped.find(b'\\', pos, scanned_end) != -1
+        release_pages(mapped, pos, scanned_end)
+        if end != -1:
+            return end, escaped
+        pos = chunk_end
+    return -1, escaped
+
+
+def load_gltf_json(filename):
+    """
+    Loads a .gltf (JSON) file, returning the gltf dict in which every base64 data URI
+    is a :code:`DataURI` referring to the memory-mapped file.
+    """
+    data = map_file(filename)
+    if len(data) == 0:
+        raise Exception('"%s" is empty' % filename)
+    mapped = data.obj
+    pieces = []
+    data_uris = []
+    pos = search_pos = 0
+    while True:
+        match = _DATA_URI_RE.search(mapped, search_pos)
+        if match is None:
+            break
+        end, escaped = _scan_payload(mapped, match.end())
+        if end == -1:
+            break
+        search_pos = end + 1
+        if escaped:
+            # the payload contains JSON escapes, leave it to the JSON decoder:
+            continue
+        pieces.append(data[pos:match.start()])
+        pieces.append(json.dumps(_MARKER_PREFIX + str(len(data_uris))).encode())
+        data_uris.append(DataURI(match.group(1).decode() or 'text/plain', mapped, match.end(), end))
+        pos = end + 1
+    pieces.append(data[pos:])
+    def object_hook(obj):
+        for key, value in obj.items():
+            if isinstance(value, str) and value.startswith(_MARKER_PREFIX):
+                obj[key] = data_uris[int(value[len(_MARKER_PREFIX):])]
+        return obj
+    gltf = json.loads(b''.join(pieces).decode('utf-8'), object_hook=object_hook)
+    _logger.debug('read "%s": %d bytes, %d data URIs', filename, len(data), len(data_uris))
+    return gltf
@@ -0,0 +1,537 @@
+"""
+Compiled, state-sorted list of the draw calls of a scene.
+
+The (node, primitive) pairs of a scene are resolved once (after :func:`gltfutils.gltfutils.init_scene`)
+into flat arrays of the program, material, vertex array object and index type / count / offset of each
+draw call, which are sorted by program, then material, then VAO so that state changes between consecutive
+draws are minimal.  Rendering a frame is then a single loop over the list, which only changes the
+material / VAO when they differ from those of the previous draw.
+
+The matrices of each drawn node (modelview, normal, MVP, ...) are computed for all nodes at once, with
+batched matrix products and inverses, when a frame is prepared (:meth:`DrawList.prepare`, which also
+handles several views, e.g. both eyes of a VR headset), and each draw sets its uniforms from them.
+The world-space bounding boxes of all nodes are also tested against the view frustum(s) then, and the
+draws of nodes which are outside are skipped.  The bounds are only recomputed after the transforms of
+the scene have been updated (see :meth:`gltfutils.transforms.TransformStore.update`), and for scenes
+with many nodes they are culled hierarchically, using a bounding volume hierarchy (:mod:`gltfutils.bvh`).
+Nodes may also be culled by hardware occlusion queries (:mod:`gltfutils.occlusion`).
+
+Meshes which are shared by many nodes are drawn with one instanced draw call per primitive, if their materials
+have instanced variants (see :mod:`gltfutils.instancing`), as are the nodes which use the
+:code:`EXT_mesh_gpu_instancing` extension (whose bounds are those of all of their instances).  The primitives of static nodes may also be merged at load
+time into batches, each drawn with a single draw call (see :mod:`gltfutils.batching`).
+
+For programs which declare the uniform blocks of :mod:`gltfutils.uniformbuffers`, the frame block is
+updated once per frame and the material block of each material is bound when the material changes.
+"""
+from ctypes import c_void_p
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+import gltfutils.gltfutils as gltfu
+from gltfutils.culling import calc_frustum_planes, cull_boxes
+from gltfutils.bvh import BVH
+from gltfutils.occlusion import OcclusionCuller, OCCLUSION_CONDITIONAL
+from gltfutils.instancing import (find_instanced_meshes, has_instanced_materials,
+                                  InstanceBuffer, create_instanced_vertex_array)
+from gltfutils.transforms import get_instance_matrices
+from gltfutils.batching import find_static_batches, StaticBatch
+from gltfutils.uniformbuffers import (FRAME_BLOCK_NAME, MATERIAL_BLOCK_NAME,
+                                      FrameUniformBuffer, MaterialUniformBuffer)
+
+
+_logger = logging.getLogger(__name__)
+
+
+# the number of nodes (with bounds) above which nodes are culled using a BVH:
+BVH_CULLING_MIN_NODES = 10000
+
+
+class DrawList(object):
+    """
+    :param gltf: the gltf dict
+    :param scene: the scene (as returned by :func:`gltfutils.gltfutils.init_scene`)
+    :param camera_position: optional position of the camera, draws with the same state are ordered
+                            from front to back with respect to it (to avoid overdraw)
+    :param frustum_culling: if True, draws of nodes whose bounding box is outside of the view frustum are skipped
+    :param uri_path: path used to resolve the URIs of buffers, if the bounds of accessors must be computed
+    :param occlusion_culling: optional occlusion culling mode (see :mod:`gltfutils.occlusion`):
+                              :code:`'skip'` or :code:`'conditional'`
+    :param instancing: if True, meshes which are shared by many nodes are drawn instanced
+                       (if the scene was set up with instanced materials) - nodes which use the
+                       :code:`EXT_mesh_gpu_instancing` extension are drawn instanced regardless
+    :param batch_static: if True, the primitives of the nodes which are not instanced are merged into static batches
+                         (the transforms of those nodes must then not change)
+    """
+    def __init__(self, gltf, scene, camera_position=None, frustum_culling=True, uri_path=None,
+                 occlusion_culling=None, instancing=False, batch_static=False):
+        self.gltf = gltf
+        self.frustum_culling = frustum_culling
+        self.occlusion_culling = occlusion_culling
+        self.occlusion_culler = None
+        scene_index = scene['scene_index']
+        node_names = [name for name, node in zip(scene_index.names, scene_index.nodes)
+                      if 'mesh' in node or node.get('meshes')]
+        all_nodes = gltf['nodes']
+        if camera_position is not None:
+            node_names = sorted(node_names, key=lambda name: np.linalg.norm(camera_position -
+                                                                            all_nodes[name]['world_matrix'][3,:3]))
+        nodes = [all_nodes[name] for name in node_names]
+        self.node_names = node_names
+        self.nodes = nodes
+        # the world matrices of the nodes are gathered from the transform store into one array each frame:
+        self.transform_store = scene['transform_store']
+        self.node_indices = np.array([self.transform_store.index[name] for name in node_names], dtype=np.int64)
+        self.model_matrices = np.empty((len(nodes), 4, 4), dtype=np.float32)
+        # (the dequantization matrices of the meshes of the nodes, which precede their world matrices,
+        # if any have been quantized)
+        self.dequantization_matrices = None
+        if any('dequantization_matrix' in gltf['meshes'][node['mesh']] for node in nodes if 'mesh' in node):
+            self.dequantization_matrices = np.array([gltf['meshes'][node['mesh']].get('dequantization_matrix',
+                                                                                       np.eye(4, dtype=np.float32))
+                                                     if 'mesh' in node else np.eye(4, dtype=np.float32)
+                                                     for node in nodes], dtype=np.float32)
+        self.projection_matrices = self.view_matrices = self.frustum_planes = None
+        self.visible = np.ones((1, len(nodes)), dtype=bool)
+        # the local matrices of the instances of the nodes which use EXT_mesh_gpu_instancing, by node slot:
+        self.instance_matrices = {}
+        for node_slot, node in enumerate(nodes):
+            matrices = get_instance_matrices(gltf, node, uri_path=uri_path)
+            if matrices is not None:
+                self.instance_matrices[node_slot] = matrices
+        self._compile_node_bounds(uri_path)
+        self.world_bounds = np.empty_like(self.node_bounds)
+        self._world_bounds_version = None
+        self.bvh = None
+        # (the node slot of each item of the BVH)
+        self.bvh_node_slots = np.flatnonzero(self.has_bounds)
+        self.materials = []
+        material_slots = {}
+        def get_material_slot(material_name):
+            if material_name not in material_slots:
+                material_slots[material_name] = len(self.materials)
+                self.materials.append(material_name)
+            return material_slots[material_name]
+        instanced_meshes = find_instanced_meshes(gltf, nodes) if instancing else {}
+        is_instanced = np.zeros(len(nodes), dtype=bool)
+        self.instance_buffers = []
+        instanced_draws = []
+        for mesh_name, mesh_node_slots in instanced_meshes.items():
+            is_instanced[mesh_node_slots] = True
+            instance_buffer = InstanceBuffer(mesh_node_slots)
+            for primitive in gltf['meshes'][mesh_name]['primitives']:
+                material_name = gltf['materials'][primitive['material']]['instanced_material']
+                vao = create_instanced_vertex_array(primitive, material_name, gltf, instance_buffer)
+                draw = self._compile_primitive(primitive, material_name, vao)
+                if draw is not None:
+                    instanced_draws.append((len(self.instance_buffers), get_material_slot(material_name)) + draw)
+            self.instance_buffers.append(instance_buffer)
+        num_instanced_nodes = is_instanced.sum()
+        for node_slot, matrices in list(self.instance_matrices.items()):
+            node = nodes[node_slot]
+            mesh_names = node.get('meshes', [node['mesh']] if 'mesh' in node else [])
+            if not all(has_instanced_materials(gltf, mesh_name) for mesh_name in mesh_names):
+                _logger.warning('node %s uses EXT_mesh_gpu_instancing, but its materials do not have instanced '
+                                'variants: drawing it (once) without its instances', node_names[node_slot])
+                # (so that it is also picked as it is drawn)
+                del self.instance_matrices[node_slot]
+                continue
+            is_instanced[node_slot] = True
+            instance_buffer = InstanceBuffer(np.array([node_slot], dtype=np.int64), matrices,
+                                             self.mesh_bounds[node_slot] if self.has_bounds[node_slot] else None)
+            for mesh_name in mesh_names:
+                for primitive in gltf['meshes'][mesh_name]['primitives']:
+                    material_name = gltf['materials'][primitive['material']]['instanced_material']
+                    vao = create_instanced_vertex_array(primitive, material_name, gltf, instance_buffer)
+                    draw = self._compile_primitive(primitive, material_name, vao)
+                    if draw is not None:
+                        instanced_draws.append((len(self.instance_buffers), get_material_slot(material_name)) + draw)
+            self.instance_buffers.append(instance_buffer)
+        self.static_batches = []
+        batched = set()
+        if batch_static:
+            self._gather_model_matrices()
+            for (material_name, _), members in find_static_batches(gltf, nodes, node_mask=~is_instanced).items():
+                self.static_batches.append(StaticBatch(gltf, material_name, members, self.model_matrices,
+                                                       uri_path=uri_path))
+                batched.update((node_slot, id(primitive)) for node_slot, primitive in members)
+        draws = []
+        for node_slot, node in enumerate(nodes):
+            if is_instanced[node_slot]:
+                continue
+            for mesh_name in node.get('meshes', [node['mesh']] if 'mesh' in node else []):
+                for primitive in gltf['meshes'][mesh_name]['primitives']:
+                    if (node_slot, id(primitive)) in batched:
+                        continue
+                    draw = self._compile_primitive(primitive, primitive['material'], primitive.get('vao'))
+                    if draw is not None:
+                        draws.append((node_slot, get_material_slot(primitive['material'])) + draw)
+        # (batches are sorted by program, then material)
+        batch_material_slots = [get_material_slot(batch.material_name) for batch in self.static_batches]
+        self._compile_uniform_bindings()
+        order = sorted(range(len(self.static_batches)),
+                       key=lambda i: (self.material_programs[batch_material_slots[i]], batch_material_slots[i]))
+        self._batches = [(self.static_batches[i], batch_material_slots[i]) for i in order]
+        # (the model-dependent uniform values of the batches, whose model matrix is the identity)
+        self.batch_uniform_values = gltfu.SemanticUniformValues(gltf, semantics=self.uniform_values.semantics)
+        self._batches_version = self.transform_store.version
+        self._instanced_draws = self._sort_draws(instanced_draws)
+        if instanced_meshes:
+            _logger.info('instancing %d nodes of %d meshes (%d instanced draws)',
+                         num_instanced_nodes, len(instanced_meshes), len(self._instanced_draws))
+        if self.instance_matrices:
+            _logger.info('%d nodes use EXT_mesh_gpu_instancing (%d instances)', len(self.instance_matrices),
+                         sum(len(matrices) for matrices in self.instance_matrices.values()))
+        (node_slots, material_slots, program_ids, vaos,
+         modes, counts, index_types, index_offsets) = np.array(draws, dtype=np.int64).reshape(-1, 8).T
+        order = np.lexsort((vaos, material_slots, program_ids))
+        self.node_slots = node_slots[order]
+        self.material_slots = material_slots[order]
+        self.program_ids = program_ids[order]
+        self.vaos = vaos[order]
+        self.modes = modes[order]
+        self.counts = counts[order]
+        self.index_types = index_types[order]
+        self.index_offsets = index_offsets[order]
+        # (the number of draws of each node, counting each primitive of instanced nodes)
+        self.node_draw_counts = np.bincount(self.node_slots, minlength=len(nodes))
+        for group, *_ in self._instanced_draws:
+            self.node_draw_counts[self.instance_buffers[group].node_slots] += 1
+        for batch in self.static_batches:
+            np.add.at(self.node_draw_counts, batch.node_slots, 1)
+        self._draws = list(zip(self.node_slots.tolist(), self.material_slots.tolist(), self.vaos.tolist(),
+                               self.modes.tolist(), self.counts.tolist(), self.index_types.tolist(),
+                               [c_void_p(offset) for offset in self.index_offsets.tolist()]))
+        if self.static_batches:
+            num_batched = sum(len(batch.node_slots) for batch in self.static_batches)
+            _logger.info('batched %d static draws into %d batches: %d draws -> %d draws',
+                         num_batched, len(self.static_batches), len(self) - len(self.static_batches) + num_batched,
+                         len(self))
+        _logger.debug('compiled draw list: %d draws, %d programs, %d materials',
+                      len(self), len(set(self.program_ids.tolist())), len(self.materials))
+
+    def __len__(self):
+        return len(self._draws) + len(self._instanced_draws) + len(self._batches)
+
+    @staticmethod
+    def _sort_draws(draws):
+        # sorts draws (tuples of (slot, material slot, program id, VAO, mode, count, index type, index offset))
+        # by program, then material, then VAO, returning them without their program ids:
+        draws = sorted(draws, key=lambda draw: (draw[2], draw[1], draw[3]))
+        return [(slot, material_slot, vao, mode, count, index_type, c_void_p(index_offset))
+                for slot, material_slot, _, vao, mode, count, index_type, index_offset in draws]
+
+    def _compile_node_bounds(self, uri_path):
+        # the (local) bounds of the POSITION data of the meshes of each node, nodes without bounds are never culled
+        # (the bounds of nodes which use EXT_mesh_gpu_instancing are those of all of their instances, and those of
+        # their meshes are kept in mesh_bounds):
+        gltf = self.gltf
+        self.node_bounds = np.zeros((len(self.nodes), 2, 3), dtype=np.float32)
+        self.has_bounds = np.zeros(len(self.nodes), dtype=bool)
+        mesh_bounds = {}
+        for node_slot, node in enumerate(self.nodes):
+            for mesh_name in node.get('meshes', [node['mesh']] if 'mesh' in node else []):
+                if mesh_name not in mesh_bounds:
+                    mesh_bounds[mesh_name] = gltfu.find_mesh_bounds(gltf['meshes'][mesh_name], gltf,
+                                                                    uri_path=uri_path).get('POSITION')
+                bounds = mesh_bounds[mesh_name]
+                if bounds is None or bounds.shape != (2, 3):
+                    continue
+                if self.has_bounds[node_slot]:
+                    np.minimum(self.node_bounds[node_slot,0], bounds[0], out=self.node_bounds[node_slot,0])
+                    np.maximum(self.node_bounds[node_slot,1], bounds[1], out=self.node_bounds[node_slot,1])
+                else:
+                    self.node_bounds[node_slot] = bounds
+                    self.has_bounds[node_slot] = True
+        self.mesh_bounds = self.node_bounds.copy()
+        for node_slot, matrices in self.instance_matrices.items():
+            if not self.has_bounds[node_slot] or not len(matrices):
+                continue
+            mesh_bounds = np.broadcast_to(self.mesh_bounds[node_slot], (len(matrices), 2, 3))
+            instance_bounds = gltfu.transform_bounds(mesh_bounds, matrices)
+            self.node_bounds[node_slot] = instance_bounds[:,0].min(axis=0), instance_bounds[:,1].max(axis=0)
+
+    def _compile_uniform_bindings(self):
+        # resolve the semantic uniforms of the program of each material into lists of
+        # (setter, location, transpose, value array) for those whose values change once per frame, and
+        # (setter, location, transpose, semantic) for those whose values change with the model matrix:
+        gltf = self.gltf
+        programs = [gltf['programs'][gltf['techniques'][gltf['materials'][material_name]['technique']]['program']]
+                    for material_name in self.materials]
+        self.material_programs = [program['id'] for program in programs]
+        semantic_uniforms = [[uniform for uniform in program['semantic_uniforms']
+                              if uniform.semantic != gltfu.SEMANTIC_LOCAL]
+                             for program in programs]
+        semantics = {uniform.semantic for uniforms in semantic_uniforms for uniform in uniforms}
+        # the buffer of the frame block (which is shared by all programs) and of the material blocks:
+        frame_block = next((program['uniform_blocks'][FRAME_BLOCK_NAME] for program in programs
+                            if FRAME_BLOCK_NAME in program.get('uniform_blocks', {})), None)
+        self.frame_uniform_buffer = None
+        if frame_block is not None:
+            self.frame_uniform_buffer = FrameUniformBuffer(frame_block)
+            semantics |= gltfu.FRAME_SEMANTICS
+        self.material_uniform_buffer = None
+        if any(MATERIAL_BLOCK_NAME in program.get('uniform_blocks', {}) for program in programs):
+            self.material_uniform_buffer = MaterialUniformBuffer(gltf, self.materials)
+        values = gltfu.SemanticUniformValues(gltf, semantics=semantics)
+        self.uniform_values = values
+        self.frame_bindings = []
+        self.model_bindings = []
+        for uniforms in semantic_uniforms:
+            self.frame_bindings.append([(uniform.setter, uniform.location, uniform.transpose, values.get_value(uniform))
+                                        for uniform in uniforms if values.is_frame_uniform(uniform)])
+            self.model_bindings.append([(uniform.setter, uniform.location, uniform.transpose, uniform.semantic)
+                                        for uniform in uniforms if not values.is_frame_uniform(uniform)])
+
+    def _compile_primitive(self, primitive, material_name, vao):
+        # returns (program id, VAO, mode, count, index type, index offset), with an index type of 0
+        # for non-indexed primitives, or None if the primitive has nothing to draw:
+        gltf = self.gltf
+        material = gltf['materials'][material_name]
+        technique = gltf['techniques'][material['technique']]
+        program_id = gltf['programs'][technique['program']]['id']
+        mode = primitive.get('mode', gl.GL_TRIANGLES)
+        if 'indices' not in primitive:
+            accessor_name = primitive['attributes'].get('POSITION')
+            if accessor_name is None:
+                return None
+            count = gltf['accessors'][accessor_name].get('count', 1)
+            return program_id, vao, mode, count, 0, 0
+        index_accessor = gltf['accessors'][primitive['indices']]
+        index_bufferView = gltf['bufferViews'][index_accessor['bufferView']]
+        # the element array buffer binding is part of the VAO state:
+        gl.glBindVertexArray(vao)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, index_bufferView['id'])
+        gl.glBindVertexArray(0)
+        return (program_id, vao, mode, index_accessor['count'],
+                index_accessor['componentType'], index_accessor.get('byteOffset', 0))
+
+    def _gather_model_matrices(self):
+        # gathers the world matrices of the nodes from the transform store, preceded by their dequantization matrices:
+        np.take(self.transform_store.world_matrices, self.node_indices, axis=0, out=self.model_matrices)
+        if self.dequantization_matrices is not None:
+            np.matmul(self.dequantization_matrices, self.model_matrices, out=self.model_matrices)
+
+    def _update_world_bounds(self):
+        # recomputes the world-space bounds of the nodes (and refits the BVH) if the transforms have changed:
+        if self._world_bounds_version == self.transform_store.version:
+            return
+        self._gather_model_matrices()
+        self.world_bounds[...] = gltfu.transform_bounds(self.node_bounds, self.model_matrices)
+        if self.bvh is not None:
+            self.bvh.refit(self.world_bounds[self.bvh_node_slots])
+        self._world_bounds_version = self.transform_store.version
+
+    def get_bvh(self):
+        """
+        Returns the :code:`BVH` of the world-space bounds of the nodes which have bounds
+        (the node slot of each of its items is given by :attr:`bvh_node_slots`), e.g. for spatial queries.
+        """
+        self._update_world_bounds()
+        if self.bvh is None:
+            self.bvh = BVH(self.world_bounds[self.bvh_node_slots])
+        return self.bvh
+
+    def prepare(self, projection_matrices, view_matrices):
+        """
+        Computes the matrices of all nodes for one or more views, given the projection and view matrices
+        (arrays of shape :code:`(4, 4)`, or :code:`(E, 4, 4)` for :code:`E` views).
+        """
+        self.projection_matrices = np.asarray(projection_matrices, dtype=np.float32).reshape(-1, 4, 4)
+        self.view_matrices = np.asarray(view_matrices, dtype=np.float32).reshape(-1, 4, 4)
+        self._gather_model_matrices()
+        self.uniform_values.set_models(self.model_matrices, self.view_matrices,
+                                       projection_matrices=self.projection_matrices)
+        if self._batches:
+            if self._batches_version != self.transform_store.version:
+                _logger.warning('the transforms of the scene have changed since its static batches were built')
+                self._batches_version = self.transform_store.version
+            self.batch_uniform_values.set_models(np.eye(4, dtype=np.float32)[None], self.view_matrices,
+                                                 projection_matrices=self.projection_matrices)
+        if self.occlusion_culling is not None:
+            self._update_world_bounds()
+            if self.occlusion_culler is None or len(self.occlusion_culler.queries) != len(self.view_matrices):
+                self.occlusion_culler = OcclusionCuller(len(self.nodes), mode=self.occlusion_culling,
+                                                        num_views=len(self.view_matrices))
+        if self.frustum_culling:
+            self._update_world_bounds()
+            planes = calc_frustum_planes(self.projection_matrices, self.view_matrices)
+            self.frustum_planes = planes
+            if len(self.bvh_node_slots) >= BVH_CULLING_MIN_NODES:
+                bvh = self.get_bvh()
+                self.visible = np.ones((len(planes), len(self.nodes)), dtype=bool)
+                for visible, view_planes in zip(self.visible, planes):
+                    visible[self.bvh_node_slots] = bvh.query_frustum(view_planes)
+            else:
+                self.visible = cull_boxes(planes, self.world_bounds)
+                self.visible |= ~self.has_bounds
+        elif self.visible.shape[0] != len(self.view_matrices):
+            self.visible = np.ones((len(self.view_matrices), len(self.nodes)), dtype=bool)
+
+    def draw(self, projection_matrix=None, view_matrix=None, camera_matrix=None, eye=0):
+        """
+        Renders all draws of the list, given the projection matrix and either the view matrix or
+        the camera (i.e. inverse view) matrix, or else for one of the views of the last :meth:`prepare`.
+        """
+        gltf = self.gltf
+        if view_matrix is None and camera_matrix is not None:
+            view_matrix = np.linalg.inv(camera_matrix)
+        if view_matrix is not None:
+            self.prepare(projection_matrix, view_matrix)
+            eye = 0
+        self.uniform_values.set_frame(self.projection_matrices[eye], self.view_matrices[eye],
+                                      camera_matrix=camera_matrix)
+        model_values = self.uniform_values.model_values
+        model_bindings = [[(setter, location, transpose, model_values[semantic][eye])
+                           for setter, location, transpose, semantic in bindings]
+                          for bindings in self.model_bindings]
+        if self.frame_uniform_buffer is not None:
+            self.frame_uniform_buffer.update(self.uniform_values)
+        visible = self.visible[eye]
+        occlusion_culler = self.occlusion_culler
+        if occlusion_culler is None:
+            num_draws = self._draw_nodes(visible.tolist(), model_bindings)
+            num_draws += self._draw_instances(visible, eye)
+            num_draws += self._draw_batches(visible, eye)
+        else:
+            # draw the nodes which were not occluded, then query the occlusion of all nodes (whose draws
+            # then either are skipped or are conditional on the results if they were occluded):
+            occlusion_culler.collect(view=eye)
+            occluded = occlusion_culler.occluded[eye] & visible
+            num_draws = self._draw_nodes((visible & ~occluded).tolist(), model_bindings)
+            # (occluded instances and batched nodes are skipped in either mode)
+            num_draws += self._draw_instances(visible & ~occluded, eye)
+            num_draws += self._draw_batches(visible & ~occluded, eye)
+            occlusion_culler.issue(np.flatnonzero(visible & self.has_bounds), self.world_bounds,
+                                   self.projection_matrices[eye], self.view_matrices[eye], view=eye)
+            gltfu.set_material_state.current_material = None
+            gltfu.set_technique_state.current_technique = None
+            if occlusion_culler.mode == OCCLUSION_CONDITIONAL:
+                num_draws += self._draw_nodes(occluded.tolist(), model_bindings,
+                                              queries=occlusion_culler.node_queries[eye])
+            gltfu.num_draws_occluded += int(self.node_draw_counts[occluded].sum())
+        gltfu.num_draw_calls += num_draws
+        num_visible = int(visible.sum())
+        gltfu.num_nodes_visible += num_visible
+        gltfu.num_nodes_culled += len(visible) - num_visible
+        if gltfu.CHECK_GL_ERRORS:
+            if gl.glGetError() != gl.GL_NO_ERROR:
+                raise Exception('error drawing draw list')
+
+    def _draw_nodes(self, node_mask, model_bindings, queries=None):
+        # renders the draws of the nodes for which node_mask is True (conditionally on the results of
+        # the nodes' occlusion queries, if they are given), returns the number of draws:
+        gltf = self.gltf
+        material_uniform_buffer = self.material_uniform_buffer
+        materials = self.materials
+        material_programs = self.material_programs
+        frame_bindings = self.frame_bindings
+        set_material_state = gltfu.set_material_state
+        glBindVertexArray = gl.glBindVertexArray
+        glDrawElements = gl.glDrawElements
+        num_draws = 0
+        current_node_slot = current_material_slot = current_program = current_vao = None
+        for node_slot, material_slot, vao, mode, count, index_type, index_offset in self._draws:
+            if not node_mask[node_slot]:
+                continue
+            if material_slot != current_material_slot:
+                set_material_state(materials[material_slot], gltf)
+                if material_uniform_buffer is not None:
+                    material_uniform_buffer.bind(material_slot)
+                current_material_slot = material_slot
+                bindings = model_bindings[material_slot]
+                if material_programs[material_slot] != current_program:
+                    # uniform values are program state, so are set once per frame for each program
+                    # (the draws of each program are consecutive):
+                    current_program = material_programs[material_slot]
+                    for setter, location, transpose, value in frame_bindings[material_slot]:
+                        setter(location, 1, transpose, value)
+                    current_node_slot = None
+            if node_slot != current_node_slot:
+                for setter, location, transpose, values in bindings:
+                    setter(location, 1, transpose, values[node_slot])
+                current_node_slot = node_slot
+            if vao != current_vao:
+                glBindVertexArray(vao)
+                current_vao = vao
+            if queries is not None:
+                gl.glBeginConditionalRender(queries[node_slot], gl.GL_QUERY_NO_WAIT)
+            if index_type:
+                glDrawElements(mode, count, index_type, index_offset)
+            else:
+                gl.glDrawArrays(mode, 0, count)
+            if queries is not None:
+                gl.glEndConditionalRender()
+            num_draws += 1
+        return num_draws
+
+    def _draw_instances(self, node_mask, eye=0):
+        # renders the instanced draws, of the instances for which node_mask is True (and, for EXT_mesh_gpu_instancing
+        # instances, which are inside the view frustum), returns the number of draws:
+        if not self._instanced_draws:
+            return 0
+        gltf = self.gltf
+        instance_buffers = self.instance_buffers
+        frustum_planes = self.frustum_planes[eye] if self.frustum_culling else None
+        for instance_buffer in instance_buffers:
+            instance_buffer.update(self.model_matrices, node_mask, frustum_planes=frustum_planes)
+        material_uniform_buffer = self.material_uniform_buffer
+        materials = self.materials
+        material_programs = self.material_programs
+        frame_bindings = self.frame_bindings
+        num_draws = 0
+        current_material_slot = current_program = None
+        for group, material_slot, vao, mode, count, index_type, index_offset in self._instanced_draws:
+            num_instances = instance_buffers[group].num_instances
+            if not num_instances:
+                continue
+            if material_slot != current_material_slot:
+                gltfu.set_material_state(materials[material_slot], gltf)
+                if material_uniform_buffer is not None:
+                    material_uniform_buffer.bind(material_slot)
+                current_material_slot = material_slot
+                if material_programs[material_slot] != current_program:
+                    current_program = material_programs[material_slot]
+                    for setter, location, transpose, value in frame_bindings[material_slot]:
+                        setter(location, 1, transpose, value)
+            gl.glBindVertexArray(vao)
+            if index_type:
+                gl.glDrawElementsInstanced(mode, count, index_type, index_offset, num_instances)
+            else:
+                gl.glDrawArraysInstanced(mode, 0, count, num_instances)
+            num_draws += 1
+        return num_draws
+
+    def _draw_batches(self, node_mask, eye=0):
+        # renders the static batches, of the nodes for which node_mask is True, returns the number of draws:
+        if not self._batches:
+            return 0
+        gltf = self.gltf
+        batch_values = self.batch_uniform_values.model_values
+        material_uniform_buffer = self.material_uniform_buffer
+        materials = self.materials
+        material_programs = self.material_programs
+        frame_bindings = self.frame_bindings
+        num_draws = 0
+        current_material_slot = current_program = None
+        for batch, material_slot in self._batches:
+            mask = node_mask[batch.node_slots]
+            if not mask.any():
+                continue
+            if material_slot != current_material_slot:
+                gltfu.set_material_state(materials[material_slot], gltf)
+                if material_uniform_buffer is not None:
+                    material_uniform_buffer.bind(material_slot)
+                current_material_slot = material_slot
+                if material_programs[material_slot] != current_program:
+                    current_program = material_programs[material_slot]
+                    for setter, location, transpose, value in frame_bindings[material_slot]:
+                        setter(location, 1, transpose, value)
+                    for setter, location, transpose, semantic in self.model_bindings[material_slot]:
+                        setter(location, 1, transpose, batch_values[semantic][eye,0])
+            gl.glBindVertexArray(batch.vao)
+            batch.draw(mask)
+            num_draws += 1
+        return num_draws
@@ -7,6 +7,8 @@ import numpy as np
 import PIL.Image as Image
 import OpenGL.GL as gl
 
+from gltfutils.textureutils import upload_image
+
 
 c_float_p = POINTER(c_float)
 
@@ -204,13 +206,7 @@ class Texture(GLRendering):
         gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_MAG_FILTER, self.mag_filter)
         gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_S, self.wrap_s)
         gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_T, self.wrap_t)
-        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0,
-                        gl.GL_RGB if image.mode == 'RGB' else gl.GL_RGBA,
-                        image.width, image.height, 0,
-                        gl.GL_RGB if image.mode == 'RGB' else gl.GL_RGBA,
-                        gl.GL_UNSIGNED_BYTE,
-                        np.array(image.getdata(), dtype=np.ubyte))
+        upload_image(gl.GL_TEXTURE_2D, image)
         gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
         err = gl.glGetError()
         if err != gl.GL_NO_ERROR:
@@ -254,15 +250,9 @@ class CubeTexture(Texture):
         gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
         gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_S, gl.GL_REPEAT)
         gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_T, gl.GL_REPEAT)
-        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
         for uri, target in zip(self.uris, self.TARGETS):
             image = Image.open(uri)
-            gl.glTexImage2D(target, 0,
-                            gl.GL_RGB if image.mode == 'RGB' else gl.GL_RGBA,
-                            image.width, image.height, 0,
-                            gl.GL_RGB if image.mode == 'RGB' else gl.GL_RGBA,
-                            gl.GL_UNSIGNED_BYTE,
-                            np.array(image.getdata(), dtype=np.ubyte))
+            upload_image(target, image, texture_target=gl.GL_TEXTURE_CUBE_MAP)
         gl.glGenerateMipmap(gl.GL_TEXTURE_CUBE_MAP)
         err = gl.glGetError()
         if err != gl.GL_NO_ERROR:
@@ -0,0 +1,143 @@
+"""
+Reader for the binary glTF container format (.glb), supporting both the glTF 2.0 GLB
+layout and the glTF 1.0 KHR_binary_glTF extension layout.
+
+The binary chunk of the container is exposed as a :code:`memoryview`, so that
+bufferViews (and images / shaders stored within the binary chunk) can be sliced
+from it directly without making any intermediate copies.
+"""
+import struct
+import json
+import logging
+
+from gltfutils.memutils import map_file
+from gltfutils.datauri import load_gltf_json
+
+
+_logger = logging.getLogger(__name__)
+
+
+GLB_MAGIC = b'glTF'
+GLB_HEADER = struct.Struct('<4sII')
+GLB_CHUNK_HEADER = struct.Struct('<I4s')
+GLB_CHUNK_TYPE_JSON = b'JSON'
+GLB_CHUNK_TYPE_BIN = b'BIN\x00'
+KHR_BINARY_GLTF_HEADER = struct.Struct('<4sIIII')
+KHR_BINARY_GLTF_CONTENT_FORMAT_JSON = 0
+KHR_BINARY_GLTF_BUFFER = 'binary_glTF'
+
+
+def is_glb(filename):
+    """Returns True if the file at the given path starts with the binary glTF magic bytes."""
+    with open(filename, 'rb') as f:
+        return f.read(len(GLB_MAGIC)) == GLB_MAGIC
+
+
+def read_glb(data):
+    """
+    Parses a binary glTF container.
+
+    :param data: bytes-like object containing the entire contents of the .glb file
+
+    :returns: tuple :code:`(gltf, bin_chunk)` of the decoded JSON dict and a :code:`memoryview`
+              of the binary chunk (:code:`None` if the container has no binary chunk)
+    """
+    data = memoryview(data)
+    if len(data) < GLB_HEADER.size:
+        raise Exception('binary glTF data is too short (%d bytes)' % len(data))
+    magic, version, length = GLB_HEADER.unpack_from(data)
+    if magic != GLB_MAGIC:
+        raise Exception('binary glTF data has an invalid magic number: %s' % magic)
+    if length > len(data):
+        raise Exception('binary glTF header specifies a length of %d bytes, but only %d bytes are available' %
+                        (length, len(data)))
+    if version == 1:
+        return _read_khr_binary_gltf(data[:length])
+    elif version == 2:
+        return _read_glb_v2(data[:length])
+    else:
+        raise Exception('unsupported binary glTF version: %d' % version)
+
+
+def _read_glb_v2(data):
+    offset = GLB_HEADER.size
+    json_chunk, bin_chunk = None, None
+    while offset + GLB_CHUNK_HEADER.size <= len(data):
+        chunk_length, chunk_type = GLB_CHUNK_HEADER.unpack_from(data, offset)
+        offset += GLB_CHUNK_HEADER.size
+        if offset + chunk_length > len(data):
+            raise Exception('GLB chunk %s extends past the end of the file' % chunk_type)
+        chunk = data[offset:offset+chunk_length]
+        offset += chunk_length
+        if chunk_type == GLB_CHUNK_TYPE_JSON and json_chunk is None:
+            json_chunk = chunk
+        elif chunk_type == GLB_CHUNK_TYPE_BIN and bin_chunk is None:
+            bin_chunk = chunk
+        else:
+            _logger.debug('skipping GLB chunk of type %s (%d bytes)', chunk_type, chunk_length)
+    if json_chunk is None:
+        raise Exception('GLB does not contain a JSON chunk')
+    gltf = json.loads(bytes(json_chunk).decode('utf-8'))
+    return gltf, bin_chunk
+
+
+def _read_khr_binary_gltf(data):
+    magic, version, length, content_length, content_format = KHR_BINARY_GLTF_HEADER.unpack_from(data)
+    if content_format != KHR_BINARY_GLTF_CONTENT_FORMAT_JSON:
+        raise Exception('unsupported KHR_binary_glTF content format: %d' % content_format)
+    content_end = KHR_BINARY_GLTF_HEADER.size + content_length
+    if content_end > len(data):
+        raise Exception('KHR_binary_glTF content extends past the end of the file')
+    gltf = json.loads(bytes(data[KHR_BINARY_GLTF_HEADER.size:content_end]).decode('utf-8'))
+    return gltf, data[content_end:]
+
+
+def attach_bin_chunk(gltf, bin_chunk):
+    """
+    Attaches the binary chunk of a binary glTF container to the buffer which refers to it,
+    as the :code:`'data'` property of the buffer.
+
+    For glTF 2.0, this is the first buffer, which must not define a :code:`uri`.
+    For glTF 1.0 (KHR_binary_glTF), this is the buffer with the id :code:`"binary_glTF"`.
+    """
+    if bin_chunk is None:
+        return
+    buffers = gltf.get('buffers')
+    if isinstance(buffers, dict):
+        if KHR_BINARY_GLTF_BUFFER not in buffers:
+            _logger.warning('binary glTF body is not referenced by any buffer')
+            return
+        buffer = buffers[KHR_BINARY_GLTF_BUFFER]
+    elif buffers and 'uri' not in buffers[0]:
+        buffer = buffers[0]
+    else:
+        _logger.warning('GLB binary chunk is not referenced by any buffer')
+        return
+    byteLength = buffer.get('byteLength', len(bin_chunk))
+    if byteLength > len(bin_chunk):
+        raise Exception('buffer byteLength (%d) is larger than the GLB binary chunk (%d bytes)' %
+                        (byteLength, len(bin_chunk)))
+    buffer['data'] = bin_chunk[:byteLength]
+
+
+def load_glb(filename):
+    """
+    Loads a binary glTF file, returning the gltf dict with its binary chunk attached.
+    The file is memory-mapped, so the binary chunk is only paged in as it is accessed.
+    """
+    data = map_file(filename)
+    gltf, bin_chunk = read_glb(data)
+    attach_bin_chunk(gltf, bin_chunk)
+    _logger.debug('read binary glTF "%s": %d bytes, binary chunk: %s bytes', filename, len(data),
+                  len(bin_chunk) if bin_chunk is not None else None)
+    return gltf
+
+
+def load_gltf(filename):
+    """
+    Loads a glTF asset from either a .gltf (JSON) or a .glb (binary glTF) file,
+    returning the gltf dict.  Base64 data URIs within .gltf files are decoded lazily (see :mod:`gltfutils.datauri`).
+    """
+    if is_glb(filename):
+        return load_glb(filename)
+    return load_gltf_json(filename)
@@ -14,6 +14,10 @@ import cyglfw3 as glfw
 
 _logger = logging.getLogger(__name__)
 import gltfutils.gltfutils as gltfu
+from gltfutils.memutils import format_peak_memory_usage
+from gltfutils.texturestreaming import TextureStreamer, DEFAULT_BYTES_PER_FRAME
+from gltfutils.drawlist import DrawList
+from gltfutils.picking import Picker, calc_pick_ray
 try:
     from gltfutils.openvr_renderer import OpenVRRenderer
 except ImportError as err:
@@ -51,7 +55,18 @@ def view_gltf(gltf, uri_path, scene_name=None,
               window_title='gltfview',
               screen_capture_prefix=None,
               display_fps=False,
-              move_speed=None):
+              move_speed=None,
+              load_workers=None,
+              load_processes=False,
+              cache=None,
+              stream_textures=False,
+              texture_upload_budget=DEFAULT_BYTES_PER_FRAME,
+              use_ubo=False,
+              occlusion_culling=None,
+              instancing=False,
+              batch_static=False,
+              optimize_indices=False,
+              quantize_attributes=False):
     _t0 = time.time()
     if window_size is None:
         window_size = [800, 600]
@@ -75,13 +90,22 @@ def view_gltf(gltf, uri_path, scene_name=None,
                                      aspectRatio=window_size[0] / max(5, window_size[1]))
     glfw.SetWindowSizeCallback(window, on_resize)
 
-    scene = gltfu.init_scene(gltf, uri_path, scene_name=scene_name)
-    scene_bounds = gltfu.find_scene_bounds(scene, gltf)
+    texture_streamer = None
+    if stream_textures:
+        texture_streamer = TextureStreamer(bytes_per_frame=texture_upload_budget)
+        _logger.info('streaming textures, upload budget: %d bytes per frame', texture_upload_budget)
+
+    scene = gltfu.init_scene(gltf, uri_path, scene_name=scene_name,
+                             load_workers=load_workers, load_processes=load_processes,
+                             cache=cache, texture_streamer=texture_streamer, use_ubo=use_ubo,
+                             instancing=instancing, optimize_indices=optimize_indices,
+                             quantize_attributes=quantize_attributes)
+    scene_bounds = gltfu.find_scene_bounds(scene, gltf, uri_path=uri_path)
     _logger.debug('scene bounds:\n%s', '\n'.join(['%20s: min = %s , max = %s' % (semantic, bounds[0], bounds[1])
                                                   for semantic, bounds in scene_bounds.items()]))
 
-    root_nodes = [gltf['nodes'][n] for n in scene.get('nodes', [])]
-    nodes = gltfu.flatten_nodes(root_nodes, gltf)
+    scene_index = scene['scene_index']
+    nodes = scene_index.nodes
 
     camera_node = next((node for node in nodes if 'camera' in node), None)
     if camera_node is not None:
@@ -112,8 +136,10 @@ def view_gltf(gltf, uri_path, scene_name=None,
                           [s,  c]], dtype=np.float32)
             camera_world_matrix[:3:2,:3:2] = camera_world_matrix[:3:2,:3:2].dot(r.T)
 
-    # sort nodes from front to back to avoid overdraw (assuming opaque objects):
-    nodes = sorted(nodes, key=lambda node: np.linalg.norm(camera_world_matrix[3, :3] - node['world_matrix'][3, :3]))
+    # compile the draw calls of the scene, sorted by state and then from front to back to avoid overdraw
+    # (assuming opaque objects):
+    draw_list = DrawList(gltf, scene, camera_position=camera_world_matrix[3, :3], uri_path=uri_path,
+                         occlusion_culling=occlusion_culling, instancing=instancing, batch_static=batch_static)
 
     on_resize(window, window_size[0], window_size[1])
 
@@ -124,7 +150,9 @@ def view_gltf(gltf, uri_path, scene_name=None,
                                  np.linalg.norm(bounds[1] - scene_centroid))
 
     process_input = setup_controls(camera_world_matrix=camera_world_matrix, window=window,
-                                   screen_capture_prefix=screen_capture_prefix, move_speed=move_speed)
+                                   screen_capture_prefix=screen_capture_prefix, move_speed=move_speed,
+                                   projection_matrix=projection_matrix,
+                                   picker=Picker(draw_list, uri_path=uri_path))
 
     text_renderer = None
     if display_fps:
@@ -132,17 +160,20 @@ def view_gltf(gltf, uri_path, scene_name=None,
         text_renderer.init_gl()
 
     _t1 = time.time()
-    _logger.info('''...INITIALIZATION COMPLETE (took %s seconds)''', _t1 - _t0);
+    _logger.info('''...INITIALIZATION COMPLETE (took %s seconds, peak memory usage: %s)''',
+                 _t1 - _t0, format_peak_memory_usage())
 
     # BURNER FRAME:
     gltfu.num_draw_calls = 0
+    gltfu.num_nodes_visible = gltfu.num_nodes_culled = 0
     process_input(0.0)
     lt = glfw.GetTime()
-    render(gltf, nodes, window_size,
+    render(draw_list, window_size,
            camera_world_matrix=camera_world_matrix,
            projection_matrix=projection_matrix)
     num_draw_calls_per_frame = gltfu.num_draw_calls
     _logger.info("NUM DRAW CALLS PER FRAME: %d", num_draw_calls_per_frame)
+    _logger.info("NUM NODES VISIBLE / CULLED PER FRAME: %d / %d", gltfu.num_nodes_visible, gltfu.num_nodes_culled)
     _draw_text(fps=1/(glfw.GetTime()-lt), display_fps=display_fps, text_renderer=text_renderer)
     if screenshot:
         save_screen(window, screenshot)
@@ -159,16 +190,18 @@ def view_gltf(gltf, uri_path, scene_name=None,
         setup_vr_controls()
         render_stats = vr_render_loop(vr_renderer=vr_renderer, process_input=process_input,
                                       window=window, window_size=window_size,
-                                      gltf=gltf, nodes=nodes)
+                                      draw_list=draw_list,
+                                      texture_streamer=texture_streamer)
         vr_renderer.shutdown()
     else:
         render_stats = render_loop(process_input=process_input,
                                    window=window, window_size=window_size,
-                                   gltf=gltf, nodes=nodes,
+                                   draw_list=draw_list,
                                    camera_world_matrix=camera_world_matrix,
                                    projection_matrix=projection_matrix,
                                    nframes=nframes,
-                                   display_fps=display_fps, text_renderer=text_renderer)
+                                   display_fps=display_fps, text_renderer=text_renderer,
+                                   texture_streamer=texture_streamer)
     _logger.info('''QUITING...
 
 %s
@@ -178,12 +211,14 @@ def view_gltf(gltf, uri_path, scene_name=None,
 
 
 def render_loop(process_input=None, window=None, window_size=None,
-                gltf=None, nodes=None,
+                draw_list=None,
                 camera_world_matrix=None, projection_matrix=None,
                 nframes=None,
-                display_fps=False, text_renderer=None):
+                display_fps=False, text_renderer=None,
+                texture_streamer=None):
     _nframes = 0
     dt_max = 0.0
+    gltfu.num_draws_occluded = 0
     lt = st = glfw.GetTime()
     while not glfw.WindowShouldClose(window) and _nframes != nframes:
         t = glfw.GetTime()
@@ -191,7 +226,9 @@ def render_loop(process_input=None, window=None, window_size=None,
         lt = t
         dt_max = max(dt, dt_max)
         process_input(dt)
-        render(gltf, nodes, window_size,
+        if texture_streamer is not None:
+            texture_streamer.update()
+        render(draw_list, window_size,
                camera_world_matrix=camera_world_matrix,
                projection_matrix=projection_matrix)
         _draw_text(fps=1/dt, display_fps=display_fps, text_renderer=text_renderer)
@@ -199,28 +236,26 @@ def render_loop(process_input=None, window=None, window_size=None,
         glfw.SwapBuffers(window)
     return {'NUM FRAMES RENDERED': _nframes,
             'AVERAGE FPS': _nframes / (t - st),
-            'MAX FRAME RENDER TIME': dt_max}
+            'MAX FRAME RENDER TIME': dt_max,
+            'DRAWS OCCLUDED PER FRAME': gltfu.num_draws_occluded / max(1, _nframes)}
 
 
-def render(gltf, nodes, window_size,
+def render(draw_list, window_size,
            projection_matrix=None,
-           camera_world_matrix=None,
-           **frame_data):
+           camera_world_matrix=None):
     gl.glViewport(0, 0, window_size[0], window_size[1])
     gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
     gltfu.set_material_state.current_material = None
     gltfu.set_technique_state.current_technique = None
     gltfu.set_technique_state.n_tex = 0
-    for node in nodes:
-        gltfu.draw_node(node, gltf,
-                        projection_matrix=projection_matrix,
-                        camera_matrix=camera_world_matrix,
-                        **frame_data)
+    draw_list.draw(projection_matrix=projection_matrix,
+                   camera_matrix=camera_world_matrix)
 
 
 def vr_render_loop(vr_renderer=None, process_input=None,
                    window=None, window_size=None,
-                   gltf=None, nodes=None):
+                   draw_list=None,
+                   texture_streamer=None):
     _nframes = 0
     dt_max = 0.0
     st = lt = glfw.GetTime()
@@ -230,7 +265,9 @@ def vr_render_loop(vr_renderer=None, process_input=None,
         lt = t
         process_input(dt)
         vr_renderer.process_input()
-        vr_renderer.render(gltf, nodes, window_size)
+        if texture_streamer is not None:
+            texture_streamer.update()
+        vr_renderer.render(draw_list, window_size)
         dt_max = max(dt, dt_max)
         _nframes += 1
         glfw.SwapBuffers(window)
@@ -241,7 +278,8 @@ def vr_render_loop(vr_renderer=None, process_input=None,
 
 def setup_controls(window=None, camera_world_matrix=None,
                    move_speed=None, turn_speed=0.5,
-                   screen_capture_prefix='screen-capture'):
+                   screen_capture_prefix='screen-capture',
+                   projection_matrix=None, picker=None):
     if move_speed is None:
         move_speed = 1.5 * abs(camera_world_matrix[3,3] / camera_world_matrix[2,2])
     _logger.debug('move_speed = %s', move_speed)
@@ -254,6 +292,8 @@ def setup_controls(window=None, camera_world_matrix=None,
                      C ----------------- capture screenshot
 
                      Esc --------------- quit
+
+  MOUSE CONTROLS:    left click -------- pick (report the node / triangle under the cursor)
 ''')
     camera_position = camera_world_matrix[3, :3]
     camera_rotation = camera_world_matrix[:3, :3]
@@ -277,8 +317,28 @@ def setup_controls(window=None, camera_world_matrix=None,
                 key_state_chg[key] = False
             key_state[key] = False
     glfw.SetKeyCallback(window, on_keydown)
+    picked_points = []
     def on_mousedown(window, button, action, mods):
-        pass
+        if picker is None or projection_matrix is None:
+            return
+        if button == glfw.MOUSE_BUTTON_LEFT and action == glfw.PRESS:
+            x, y = glfw.GetCursorPos(window)
+            ray_origin, ray_dir = calc_pick_ray(x, y, glfw.GetWindowSize(window),
+                                                projection_matrix, camera_world_matrix)
+            t = time.time()
+            hit = picker.pick(ray_origin, ray_dir)
+            dt = time.time() - t
+            if hit is None:
+                _logger.info('picked nothing (%.2f ms)', 1000 * dt)
+                return
+            _logger.info('''picked (%.2f ms):
+            node: %s, instance: %s, mesh: %s, primitive: %d, triangle: %d
+            barycentric coordinates: %s
+            distance: %f, point: %s''', 1000 * dt, hit.node, hit.instance, hit.mesh, hit.primitive, hit.triangle,
+                         hit.barycentrics, hit.distance, hit.point)
+            if picked_points:
+                _logger.info('distance from previously picked point: %f', np.linalg.norm(hit.point - picked_points[-1]))
+            picked_points.append(hit.point)
     glfw.SetMouseButtonCallback(window, on_mousedown)
 
     _capture_wait = 0.0
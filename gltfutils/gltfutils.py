@@ -1,7 +1,10 @@
 import os.path
-import base64
+import io
 from ctypes import c_void_p
 from itertools import chain
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 try:
     from types import MappingProxyType
 except ImportError:
@@ -15,6 +18,17 @@ import PIL.Image as Image
 
 from gltfutils.gl_rendering import set_matrix_from_quaternion
 from gltfutils.pbrmr import setup_pbrmr_programs
+from gltfutils.memutils import map_file, prefetch, format_peak_memory_usage
+from gltfutils.datauri import is_data_uri, decode_data_uri
+from gltfutils.accessors import Accessor, COMPONENT_TYPE_DTYPES, normalize_array
+from gltfutils.sceneindex import SceneIndex
+from gltfutils.transforms import TransformStore, EXT_MESH_GPU_INSTANCING, get_instance_matrices
+from gltfutils.uniformbuffers import get_uniform_blocks
+from gltfutils.textureutils import upload_image, upload_pixels, read_texture_levels
+from gltfutils.assetcache import CachedTexture, CACHE_KEY_INFO, content_hash
+from gltfutils.texturestreaming import NORMAL_MAP_PLACEHOLDER_COLOR, DEFAULT_PLACEHOLDER_COLOR
+from gltfutils.meshopt import optimize_mesh_indices
+from gltfutils.quantization import quantize_attributes as _quantize_attributes
 
 
 _here = os.path.dirname(__file__)
@@ -53,43 +67,163 @@ _DEFAULT_SAMPLER = {
     "wrapT": 10497
 }
 
+# semantics of uniforms which are set for each draw, indexed by their enum value:
+UNIFORM_SEMANTICS = ('MODEL', 'VIEW', 'PROJECTION', 'MODELVIEW', 'MODELVIEWPROJECTION',
+                     'MODELINVERSE', 'VIEWINVERSE', 'PROJECTIONINVERSE', 'MODELVIEWINVERSE',
+                     'MODELVIEWPROJECTIONINVERSE', 'MODELINVERSETRANSPOSE', 'MODELVIEWINVERSETRANSPOSE',
+                     'VIEWPORT', 'LOCAL')
+(SEMANTIC_MODEL, SEMANTIC_VIEW, SEMANTIC_PROJECTION, SEMANTIC_MODELVIEW, SEMANTIC_MODELVIEWPROJECTION,
+ SEMANTIC_MODELINVERSE, SEMANTIC_VIEWINVERSE, SEMANTIC_PROJECTIONINVERSE, SEMANTIC_MODELVIEWINVERSE,
+ SEMANTIC_MODELVIEWPROJECTIONINVERSE, SEMANTIC_MODELINVERSETRANSPOSE, SEMANTIC_MODELVIEWINVERSETRANSPOSE,
+ SEMANTIC_VIEWPORT, SEMANTIC_LOCAL) = range(len(UNIFORM_SEMANTICS))
+# semantics whose values depend only on the view / projection (i.e. which change at most once per frame):
+FRAME_SEMANTICS = frozenset([SEMANTIC_VIEW, SEMANTIC_PROJECTION, SEMANTIC_VIEWINVERSE,
+                             SEMANTIC_PROJECTIONINVERSE, SEMANTIC_VIEWPORT])
+
+
+def _uniform4fv(location, count, transpose, value):
+    gl.glUniform4fv(location, count, value)
+
+
+# the function which sets a uniform of each semantic, and whether the value is transposed:
+_SEMANTIC_UNIFORM_SETTERS = MappingProxyType({
+    SEMANTIC_MODEL: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_VIEW: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_PROJECTION: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_MODELVIEW: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_MODELVIEWPROJECTION: (gl.glUniformMatrix4fv, True),
+    SEMANTIC_MODELINVERSE: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_VIEWINVERSE: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_PROJECTIONINVERSE: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_MODELVIEWINVERSE: (gl.glUniformMatrix4fv, False),
+    SEMANTIC_MODELVIEWPROJECTIONINVERSE: (gl.glUniformMatrix4fv, True),
+    SEMANTIC_MODELINVERSETRANSPOSE: (gl.glUniformMatrix4fv, True),
+    SEMANTIC_MODELVIEWINVERSETRANSPOSE: (gl.glUniformMatrix3fv, True),
+    SEMANTIC_VIEWPORT: (_uniform4fv, None),
+    SEMANTIC_LOCAL: (gl.glUniformMatrix4fv, False)
+})
 
-def setup_shaders(gltf, uri_path):
-    """Loads and compiles all shaders defined or referenced in the given gltf."""
-    shader_ids = {}
+
+SemanticUniform = namedtuple('SemanticUniform', ['name', 'location', 'semantic', 'transpose', 'setter', 'node'])
+
+
+def load_shaders(gltf, uri_path):
+    """Loads the source of all shaders defined or referenced in the given gltf, returning a dict mapping GLTF shader to source."""
+    shader_sources = {}
     for shader_name, shader in gltf['shaders'].items():
-        uri = shader['uri']
-        if uri.startswith('data:text/plain;base64,'):
-            shader_str = base64.urlsafe_b64decode(uri.split(',')[1]).decode()
+        uri = shader.get('uri', '')
+        binary_gltf = shader.get('extensions', {}).get('KHR_binary_glTF')
+        if binary_gltf is not None:
+            shader_str = bytes(get_bufferView_data(gltf, binary_gltf['bufferView'], uri_path)).decode()
+            _logger.debug('loaded shader "%s" (from bufferView "%s")', shader_name, binary_gltf['bufferView'])
+        elif is_data_uri(uri):
+            shader_str = bytes(decode_data_uri(uri)).decode()
             _logger.debug('decoded shader "%s"', shader_name)
         else:
             filename = os.path.join(uri_path, shader['uri'])
             shader_str = open(filename).read()
             _logger.debug('loaded shader "%s" (from %s)', shader_name, filename)
-        shader_id = gl.glCreateShader(shader['type'])
-        gl.glShaderSource(shader_id, shader_str)
-        gl.glCompileShader(shader_id)
-        if not gl.glGetShaderiv(shader_id, gl.GL_COMPILE_STATUS):
-            raise Exception('FAILED to compile shader "%s":\n%s' % (shader_name, gl.glGetShaderInfoLog(shader_id).decode()))
-        _logger.debug('compiled shader "%s"', shader_name)
-        shader_ids[shader_name] = shader_id
-    return shader_ids
+        shader_sources[shader_name] = shader_str
+    return shader_sources
+
+
+def compile_shader(shader_name, shader_type, shader_str):
+    shader_id = gl.glCreateShader(shader_type)
+    gl.glShaderSource(shader_id, shader_str)
+    gl.glCompileShader(shader_id)
+    if not gl.glGetShaderiv(shader_id, gl.GL_COMPILE_STATUS):
+        raise Exception('FAILED to compile shader "%s":\n%s' % (shader_name, gl.glGetShaderInfoLog(shader_id).decode()))
+    _logger.debug('compiled shader "%s"', shader_name)
+    return shader_id
+
+
+def setup_shaders(gltf, uri_path):
+    """Loads and compiles all shaders defined or referenced in the given gltf."""
+    return {shader_name: compile_shader(shader_name, gltf['shaders'][shader_name]['type'], shader_str)
+            for shader_name, shader_str in load_shaders(gltf, uri_path).items()}
+
+
+def _get_program_cache_key(shader_sources, program):
+    renderer = '%s\n%s\n%s' % (gl.glGetString(gl.GL_VENDOR).decode(), gl.glGetString(gl.GL_RENDERER).decode(),
+                                 gl.glGetString(gl.GL_VERSION).decode())
+    # the #defines of each variant are part of its shader sources:
+    return content_hash('\n'.join([renderer,
+                                    shader_sources[program['vertexShader']],
+                                    shader_sources[program['fragmentShader']]]).encode())
+
+
+def _load_program_binary(program_id, cached_binary):
+    binary_format, binary = cached_binary
+    try:
+        gl.glProgramBinary(program_id, binary_format, np.frombuffer(binary, dtype=np.ubyte), len(binary))
+    except Exception as err:
+        _logger.debug('glProgramBinary failed: %s', err)
+    while gl.glGetError() != gl.GL_NO_ERROR:
+        pass
+    return gl.glGetProgramiv(program_id, gl.GL_LINK_STATUS)
+
+
+def _get_program_binary(program_id):
+    length = gl.glGetProgramiv(program_id, gl.GL_PROGRAM_BINARY_LENGTH)
+    binary = np.empty(length, dtype=np.ubyte)
+    written = np.zeros(1, dtype=np.int32)
+    binary_format = np.zeros(1, dtype=np.uint32)
+    gl.glGetProgramBinary(program_id, length, written, binary_format, binary)
+    return int(binary_format[0]), binary[:written[0]]
 
 
-def setup_programs(gltf, shader_ids):
+def setup_programs(gltf, shader_ids=None, shader_sources=None, cache=None):
     """
-    Creates and links OpenGL programs for the input gltf dict, given the mapping
-    from GLTF shader to OpenGL handle of the compiled vertex / fragment shaders.
+    Creates and links OpenGL programs for the input gltf dict, given either the mapping
+    from GLTF shader to OpenGL handle of the compiled vertex / fragment shaders,
+    or the mapping from GLTF shader to shader source (as returned by :func:`load_shaders`),
+    in which case shaders are compiled only as they are needed.
+
+    :param cache: optional :code:`AssetCache` from which linked program binaries are loaded (and in which they are stored),
+                  requires :code:`shader_sources`.  Programs are compiled from source if their cached binary is rejected.
     """
+    if shader_ids is None:
+        shader_ids = {}
+    compiled_shader_ids = []
+    def get_shader_id(shader_name):
+        if shader_name not in shader_ids:
+            shader_ids[shader_name] = compile_shader(shader_name, gltf['shaders'][shader_name]['type'],
+                                                     shader_sources[shader_name])
+            compiled_shader_ids.append(shader_ids[shader_name])
+        return shader_ids[shader_name]
+    if cache is not None and (shader_sources is None or not gl.glGetIntegerv(gl.GL_NUM_PROGRAM_BINARY_FORMATS)):
+        cache = None
+    program_techniques = {}
+    techniques = gltf.get('techniques', {})
+    for technique in (techniques.values() if isinstance(techniques, dict) else techniques):
+        program_techniques.setdefault(technique['program'], []).append(technique)
     for program_name, program in gltf['programs'].items():
         program_id = gl.glCreateProgram()
-        gl.glAttachShader(program_id, shader_ids[program['vertexShader']])
-        gl.glAttachShader(program_id, shader_ids[program['fragmentShader']])
-        gl.glLinkProgram(program_id)
-        gl.glDetachShader(program_id, shader_ids[program['vertexShader']])
-        gl.glDetachShader(program_id, shader_ids[program['fragmentShader']])
-        if not gl.glGetProgramiv(program_id, gl.GL_LINK_STATUS):
-            raise Exception('failed to link program "%s"' % program_name)
+        if cache is not None:
+            key = _get_program_cache_key(shader_sources, program)
+            cached_binary = cache.get_program_binary(key)
+            if cached_binary is not None:
+                if _load_program_binary(program_id, cached_binary):
+                    _logger.debug('loaded program "%s" from cached binary', program_name)
+                else:
+                    _logger.info('cached binary of program "%s" was rejected, it will be recompiled', program_name)
+                    gl.glDeleteProgram(program_id)
+                    program_id = gl.glCreateProgram()
+                    cached_binary = None
+        if cache is None or cached_binary is None:
+            vertex_shader_id = get_shader_id(program['vertexShader'])
+            fragment_shader_id = get_shader_id(program['fragmentShader'])
+            gl.glAttachShader(program_id, vertex_shader_id)
+            gl.glAttachShader(program_id, fragment_shader_id)
+            if cache is not None:
+                gl.glProgramParameteri(program_id, gl.GL_PROGRAM_BINARY_RETRIEVABLE_HINT, gl.GL_TRUE)
+            gl.glLinkProgram(program_id)
+            gl.glDetachShader(program_id, vertex_shader_id)
+            gl.glDetachShader(program_id, fragment_shader_id)
+            if not gl.glGetProgramiv(program_id, gl.GL_LINK_STATUS):
+                raise Exception('failed to link program "%s"' % program_name)
+            if cache is not None:
+                cache.put_program_binary(key, *_get_program_binary(program_id))
         program['id'] = program_id
         program['attribute_locations'] = {attribute_name: gl.glGetAttribLocation(program_id, attribute_name)
                                           for attribute_name in program['attributes']}
@@ -98,49 +232,261 @@ def setup_programs(gltf, shader_ids):
                                             for uniform_name in program['uniforms']}
         else:
             program['uniform_locations'] = {}
-        _logger.debug('linked program "%s"\n  attribute locations: %s\n  uniform locations: %s',
-                      program_name, program['attribute_locations'], program['uniform_locations'])
+        program['semantic_uniforms'] = _get_semantic_uniforms(program_id, program_techniques.get(program_name, []))
+        program['uniform_blocks'] = get_uniform_blocks(program_id)
+        _logger.debug('linked program "%s"\n  attribute locations: %s\n  uniform locations: %s\n  semantic uniforms: %s\n  uniform blocks: %s',
+                      program_name, program['attribute_locations'], program['uniform_locations'],
+                      ', '.join('%s (%s)' % (uniform.name, UNIFORM_SEMANTICS[uniform.semantic])
+                                for uniform in program['semantic_uniforms']),
+                      ', '.join('%s (%d bytes)' % (block.name, block.size) for block in program['uniform_blocks'].values()))
+    for shader_id in compiled_shader_ids:
+        gl.glDeleteShader(shader_id)
+
+
+def _get_semantic_uniforms(program_id, techniques):
+    """
+    Returns the binding table of the uniforms with semantics of a linked program,
+    i.e. the list of the :code:`SemanticUniform` of each active uniform
+    with a semantic of the techniques which use the program.
+    """
+    semantic_uniforms = {}
+    for technique in techniques:
+        for uniform_name, parameter_name in technique.get('uniforms', {}).items():
+            parameter = technique['parameters'][parameter_name]
+            if 'semantic' not in parameter or uniform_name in semantic_uniforms:
+                continue
+            location = gl.glGetUniformLocation(program_id, uniform_name)
+            if location == -1:
+                continue
+            if parameter['semantic'] not in UNIFORM_SEMANTICS:
+                raise Exception('unhandled semantic for uniform "%s": %s' %
+                                (uniform_name, parameter['semantic']))
+            semantic = UNIFORM_SEMANTICS.index(parameter['semantic'])
+            setter, transpose = _SEMANTIC_UNIFORM_SETTERS[semantic]
+            semantic_uniforms[uniform_name] = SemanticUniform(uniform_name, location, semantic, transpose, setter,
+                                                              parameter.get('node'))
+    return list(semantic_uniforms.values())
 
 
-def backport_pbrmr_materials(gltf):
+def backport_pbrmr_materials(gltf, use_ubo=False, instancing=False):
     """
     Converts v2 materials (paramaterized by the GLTF-2.0 standard PBR-MR material model)
     into an equivalent set of v1 material and lower-level properties:
     shaders, programs, techniques, materials.
+
+    :param use_ubo: if True, the programs read their per-frame and material uniforms from uniform blocks
+    :param instancing: if True, instanced variants of the techniques and materials are also defined
+    """
+    setup_pbrmr_programs(gltf, use_ubo=use_ubo, instancing=instancing)
+
+
+def get_buffer_data(buffer, uri_path):
+    """
+    Returns the binary data of a buffer: either the data which has already been attached to it
+    (e.g. the binary chunk of a .glb file), or else the decoded data URI / memory-mapped contents
+    of the referenced file, which is then attached to the buffer as its :code:`'data'` property.
     """
-    setup_pbrmr_programs(gltf)
+    if 'data' in buffer:
+        return buffer['data']
+    uri = buffer.get('uri')
+    if uri is None:
+        raise Exception('buffer does not define a uri and has no binary data attached')
+    if is_data_uri(uri):
+        data = decode_data_uri(uri)
+        _logger.debug('decoded buffer data URI (%d bytes)', len(data))
+    else:
+        filename = os.path.join(uri_path, uri)
+        data = map_file(filename)
+        _logger.debug('mapped buffer from "%s" (%d bytes)', filename, len(data))
+    buffer['data'] = data
+    return data
+
+
+def get_bufferView_data(gltf, bufferView_name, uri_path):
+    """
+    Returns a memoryview of exactly the bytes spanned by a bufferView.
+    No copy of the buffer data is made.
+    """
+    bufferView = gltf['bufferViews'][bufferView_name]
+    data = memoryview(get_buffer_data(gltf['buffers'][bufferView['buffer']], uri_path))
+    byteOffset = bufferView.get('byteOffset', 0)
+    return data[byteOffset:byteOffset+bufferView['byteLength']]
+
+
+def _get_bufferView_array(gltf, bufferView, uri_path):
+    # PyOpenGL does not handle memoryview slices correctly, so wrap the bytes of the bufferView in
+    # an ndarray (which is also zero-copy):
+    return np.frombuffer(get_buffer_data(gltf['buffers'][bufferView['buffer']], uri_path),
+                         dtype=np.ubyte, count=bufferView['byteLength'],
+                         offset=bufferView.get('byteOffset', 0))
 
 
-def load_images(gltf, uri_path):
+def _decode_image(source):
+    """
+    Opens and fully decodes an image, given either its filename or its encoded bytes.
+    This is the unit of work which is run by the loading pool (it must be picklable for process pools).
+    """
+    pil_image = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    pil_image.load()
+    if pil_image.mode == 'P':
+        pil_image = pil_image.convert(pil_image.palette.mode)
+    return pil_image
+
+
+def _load_image(source, cache=None, internal_format=None):
+    """
+    Loads an image, given either its filename or its encoded bytes, returning either
+    the decoded PIL.Image or, if the image is found in the given :code:`AssetCache`
+    (for textures of the given internal format), the :code:`CachedTexture`.
+    """
+    if cache is None:
+        return _decode_image(source)
+    key = cache.image_key(source, internal_format=internal_format)
+    cached_texture = cache.get_texture(key)
+    if cached_texture is not None:
+        return cached_texture
+    pil_image = _decode_image(source)
+    # the key is used to store the texture once it is created
+    # (the info dict is preserved when the image is returned from a process pool):
+    pil_image.info[CACHE_KEY_INFO] = key
+    return pil_image
+
+
+def _get_image_source(gltf, image, uri_path):
+    binary_gltf = image.get('extensions', {}).get('KHR_binary_glTF') # GLTF 1.0
+    if binary_gltf is not None:
+        image = binary_gltf
+    if 'bufferView' in image:
+        return bytes(get_bufferView_data(gltf, image['bufferView'], uri_path)), 'bufferView %s' % image['bufferView']
+    if is_data_uri(image['uri']):
+        # (the underlying bytearray is passed, since memoryviews can not be sent to process pools)
+        return decode_data_uri(image['uri']).obj, 'data URI'
+    filename = os.path.join(uri_path, image['uri'])
+    return filename, filename
+
+
+def _get_image_internal_formats(gltf):
+    # returns a dict mapping each GLTF image to the internal format of the textures which use it,
+    # for the images whose textures all have the same internal format (the others are not cached,
+    # since the texture levels stored in the cache are those of one internal format):
+    textures = gltf.get('textures', {})
+    textures = textures.values() if isinstance(textures, dict) else textures
+    internal_formats = {}
+    mixed = set()
+    for texture in textures:
+        if 'source' not in texture:
+            continue
+        # (GLTF 1.0 textures default to GL_RGBA, GLTF 2.0 textures have the internal format of their image)
+        internal_format = texture.get('internalFormat', gl.GL_RGBA if isinstance(gltf.get('textures'), dict)
+                                      else None)
+        if internal_formats.setdefault(texture['source'], internal_format) != internal_format:
+            mixed.add(texture['source'])
+    for image_name in mixed:
+        _logger.debug('image %s is used by textures of different internal formats, it is not cached', image_name)
+        del internal_formats[image_name]
+    return internal_formats
+
+
+def submit_load_images(gltf, uri_path, executor, cache=None):
+    """
+    Submits the decoding of all images referenced in the input gltf dict to the given
+    :code:`concurrent.futures` executor, returning a dict mapping GLTF image to
+    :code:`Future` of the loaded PIL.Image (or :code:`CachedTexture`, see :func:`load_images`).
+    """
+    images = gltf.get('images', {})
+    if isinstance(images, list):
+        images = {i: image for i, image in enumerate(images)}
+    internal_formats = _get_image_internal_formats(gltf)
+    futures = {}
+    for image_name, image in images.items():
+        source, description = _get_image_source(gltf, image, uri_path)
+        futures[image_name] = executor.submit(_load_image, source, cache if image_name in internal_formats else None,
+                                              internal_formats.get(image_name))
+        _logger.debug('submitted loading of image %s from "%s"', image_name, description)
+    return futures
+
+
+def load_images(gltf, uri_path, executor=None, cache=None):
     """
     Loads all images referenced in the input gltf dict,
     returning a dict mapping GLTF image to loaded PIL.Image.
+
+    :param executor: optional :code:`concurrent.futures` executor used to decode the images in parallel
+    :param cache: optional :code:`AssetCache`: images found in the cache are not decoded,
+                  they are instead loaded as :code:`CachedTexture` s
     """
-    # TODO: support data URIs
+    if executor is not None:
+        return {image_name: future.result()
+                for image_name, future in submit_load_images(gltf, uri_path, executor, cache=cache).items()}
     pil_images = {}
     images = gltf.get('images', {})
     if isinstance(images, list):
         images = {i: image for i, image in enumerate(images)}
+    internal_formats = _get_image_internal_formats(gltf)
     for image_name, image in images.items():
-        filename = os.path.join(uri_path, image['uri'])
-        pil_image = Image.open(filename)
-        if pil_image.mode == 'P':
-            pil_image = pil_image.convert(pil_image.palette.mode)
-        pil_images[filename] = pil_image
-        _logger.debug('loaded image %s from "%s"', image_name, filename)
+        source, description = _get_image_source(gltf, image, uri_path)
+        pil_images[image_name] = _load_image(source, cache if image_name in internal_formats else None,
+                                             internal_formats.get(image_name))
+        _logger.debug('loaded image %s from "%s"', image_name, description)
     return pil_images
 
 
-def setup_textures(gltf, uri_path):
+def _load_buffer(buffer, uri_path):
+    data = get_buffer_data(buffer, uri_path)
+    prefetch(data)
+    return data
+
+
+def submit_load_buffers(gltf, uri_path, executor):
+    """
+    Submits the loading (mapping and reading in from disk, or decoding) of all buffers
+    in the input gltf dict to the given :code:`concurrent.futures` executor,
+    which must be a thread pool since the loaded data is attached to the buffers.
+    Returns the list of :code:`Future` s.
+    """
+    buffers = gltf.get('buffers', {})
+    if isinstance(buffers, dict):
+        buffers = list(buffers.values())
+    return [executor.submit(_load_buffer, buffer, uri_path) for buffer in buffers]
+
+
+def _create_texture_image(target, image, internal_format=None, cache=None):
+    """
+    Uploads all levels of the texture currently bound to :code:`target`, either from a loaded PIL.Image
+    (generating its mipmaps, and storing the result in the cache if one is given)
+    or from a :code:`CachedTexture`.  Returns the :code:`ImageFormat` of the texture.
+    """
+    if isinstance(image, CachedTexture):
+        for level, pixels in enumerate(image.levels):
+            width, height = max(1, image.width >> level), max(1, image.height >> level)
+            upload_pixels(target, np.frombuffer(pixels, dtype=np.ubyte), image.image_format, width, height,
+                          level=level, internal_format=internal_format)
+        gl.glTexParameteri(target, gl.GL_TEXTURE_MAX_LEVEL, len(image.levels) - 1)
+        return image.image_format
+    image_format = upload_image(target, image, internal_format=internal_format)
+    gl.glGenerateMipmap(target)
+    key = image.info.get(CACHE_KEY_INFO)
+    if cache is not None and key is not None:
+        cache.put_texture(key, image.width, image.height, image_format,
+                          read_texture_levels(target, image_format, image.width, image.height))
+    return image_format
+
+
+def setup_textures(gltf, uri_path, pil_images=None, cache=None, texture_streamer=None):
     """
     Creates within the current GL context all textures referenced in the input gltf dict.
+
+    :param pil_images: optional dict mapping GLTF image to already loaded PIL.Image (or :code:`CachedTexture`)
+    :param cache: optional :code:`AssetCache` in which created textures are stored
+    :param texture_streamer: optional :code:`TextureStreamer`: if specified, textures are created with placeholder images
+                             and their images are queued for progressive upload (:code:`pil_images` may then map
+                             to :code:`Future` s of the loaded images)
     """
-    pil_images = load_images(gltf, uri_path)
+    if pil_images is None:
+        pil_images = load_images(gltf, uri_path, cache=cache)
     for i, (texture_name, texture) in enumerate(gltf.get('textures', {}).items()):
         sampler = gltf['samplers'][texture['sampler']]
-        image = gltf['images'][texture['source']]
-        filename = os.path.join(uri_path, image['uri'])
-        pil_image = pil_images[filename]
+        pil_image = pil_images[texture['source']]
         if 'target' not in texture:
             texture['target'] = gl.GL_TEXTURE_2D # GLTF 1.0 DEFAULT
         texture_id = gl.glGenTextures(1)
@@ -152,31 +498,39 @@ def setup_textures(gltf, uri_path):
             gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_S, sampler.get('wrapS', 10497))
             gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_T, sampler.get('wrapT', 10497))
             sampler['id'] = sampler_id
-        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        if texture_streamer is not None:
+            texture['id'] = texture_id
+            texture_streamer.add(texture, pil_image, internal_format=texture.get('internalFormat', gl.GL_RGBA),
+                                 cache=cache, name='"%s"' % texture_name)
+            _logger.debug('created texture "%s" (streaming)', texture_name)
+            continue
         if 'type' not in texture:
             texture['type'] = gl.GL_UNSIGNED_BYTE
-        if texture['type'] != gl.GL_UNSIGNED_BYTE:
-            _logger.warn('''you are trying to use a texture with property "type" set to %s,
-            not GL_UNSIGNED_BYTE (%d), is it going to work?!?!''',
-                         texture['type'], int(gl.GL_UNSIGNED_BYTE))
-        gl.glTexImage2D(texture['target'], 0,
-                        texture['internalFormat'],
-                        pil_image.width, pil_image.height, 0,
-                        gl.GL_RGB, #texture['format'],
-                        texture['type'],
-                        np.array(list(pil_image.getdata()),
-                                 dtype=(np.ubyte if texture['type'] == gl.GL_UNSIGNED_BYTE else np.ushort)))
-        gl.glGenerateMipmap(texture['target'])
+        # the pixel format and type of the uploaded data are determined by the image mode:
+        image_format = _create_texture_image(texture['target'], pil_image,
+                                             internal_format=texture.get('internalFormat', gl.GL_RGBA),
+                                             cache=cache)
+        if texture['type'] != image_format.type:
+            _logger.warning('''texture "%s" has property "type" set to %s,
+            but its image data is of type %s, the image data type will be used''',
+                            texture_name, texture['type'], int(image_format.type))
         if gl.glGetError() != gl.GL_NO_ERROR:
             raise Exception('failed to create texture "%s"' % texture_name)
         texture['id'] = texture_id
         _logger.debug('created texture "%s"', texture_name)
 
 
-def setup_textures_v2(gltf, uri_path):
+def setup_textures_v2(gltf, uri_path, pil_images=None, cache=None, texture_streamer=None):
     from copy import copy
-    pil_images = load_images(gltf, uri_path)
+    if pil_images is None:
+        pil_images = load_images(gltf, uri_path, cache=cache)
     textures = gltf.get('textures', [])
+    if texture_streamer is not None:
+        normal_textures = set()
+        for material in gltf.get('materials', []):
+            normal_texture = material.get('values', material).get('normalTexture')
+            if normal_texture is not None:
+                normal_textures.add(normal_texture['index'] if isinstance(normal_texture, dict) else normal_texture)
     for i, texture in enumerate(textures):
         if 'samplers' not in gltf:
             gltf['samplers'] = []
@@ -184,20 +538,12 @@ def setup_textures_v2(gltf, uri_path):
             texture['sampler'] = len(gltf['samplers'])
             gltf['samplers'].append(copy(_DEFAULT_SAMPLER))
         sampler = gltf['samplers'][texture['sampler']]
-        image = gltf['images'][texture['source']]
-        filename = os.path.join(uri_path, image['uri'])
-        pil_image = pil_images[filename]
+        pil_image = pil_images[texture['source']]
         texture_id = gl.glGenTextures(1)
         if 'target' not in texture:
             texture['target'] = gl.GL_TEXTURE_2D # GLTF-1.0 DEFAULT
         target = texture['target']
         gl.glBindTexture(target, texture_id)
-        if 'type' not in texture:
-            texture['type'] = gl.GL_UNSIGNED_BYTE
-        if texture['type'] != gl.GL_UNSIGNED_BYTE:
-            _logger.warn('''you are trying to use a texture with property "type" set to %s,
-            not GL_UNSIGNED_BYTE (%d), is it going to work?!?!''',
-                         texture['type'], int(gl.GL_UNSIGNED_BYTE))
         if 'id' not in sampler:
             sampler_id = gl.glGenSamplers(1)
             gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_MIN_FILTER, sampler.get('minFilter', 9986))
@@ -205,21 +551,15 @@ def setup_textures_v2(gltf, uri_path):
             gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_S, sampler.get('wrapS', 10497))
             gl.glSamplerParameteri(sampler_id, gl.GL_TEXTURE_WRAP_T, sampler.get('wrapT', 10497))
             sampler['id'] = sampler_id
-        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
-        if pil_image.mode == 'RGBA':
-            internal_format = gl.GL_RGBA
-        elif pil_image.mode == 'L':
-            internal_format = gl.GL_RED
-        else:
-            internal_format = gl.GL_RGB
-        gl.glTexImage2D(target, 0,
-                        internal_format,
-                        pil_image.width, pil_image.height, 0,
-                        internal_format,
-                        texture['type'],
-                        np.array(list(pil_image.getdata()),
-                                 dtype=(np.ubyte if texture['type'] == gl.GL_UNSIGNED_BYTE else np.ushort)))
-        gl.glGenerateMipmap(target)
+        if texture_streamer is not None:
+            texture['id'] = texture_id
+            texture_streamer.add(texture, pil_image, cache=cache,
+                                 placeholder_color=(NORMAL_MAP_PLACEHOLDER_COLOR if i in normal_textures
+                                                    else DEFAULT_PLACEHOLDER_COLOR), name=i)
+            _logger.debug('created texture %d (streaming)', i)
+            continue
+        image_format = _create_texture_image(target, pil_image, cache=cache)
+        texture['type'] = image_format.type
         if gl.glGetError() != gl.GL_NO_ERROR:
             raise Exception('failed to create texture %d' % i)
         texture['id'] = texture_id
@@ -227,53 +567,37 @@ def setup_textures_v2(gltf, uri_path):
 
 
 def setup_buffers(gltf, uri_path):
-    buffers = gltf['buffers']
-    data_buffers = {}
-    for buffer_name, buffer in buffers.items():
-        uri = buffer['uri']
-        if uri.startswith('data:application/octet-stream;base64,'):
-            data_buffers[buffer_name] = base64.b64decode(uri.split(',')[1])
-        else:
-            filename = os.path.join(uri_path, buffer['uri'])
-            if buffer['type'] == 'arraybuffer':
-                data_buffers[buffer_name] = open(filename, 'rb').read()
-            elif buffer['type'] == 'text':
-                raise Exception('TODO')
-                #data_buffers[buffer_name] = open(filename, 'r').read()
-            _logger.debug('loaded buffer "%s" (from %s)', buffer_name, filename)
+    for buffer_name, buffer in gltf['buffers'].items():
+        if buffer.get('type', 'arraybuffer') == 'text':
+            raise Exception('TODO')
+        get_buffer_data(buffer, uri_path)
+        _logger.debug('loaded buffer "%s"', buffer_name)
     for bufferView_name, bufferView in gltf['bufferViews'].items():
         buffer_id = gl.glGenBuffers(1)
-        byteOffset = bufferView['byteOffset']
-        gl.glBindBuffer(bufferView['target'], buffer_id)
-        gl.glBufferData(bufferView['target'], bufferView['byteLength'],
-                        data_buffers[bufferView['buffer']][byteOffset:], gl.GL_STATIC_DRAW)
+        target = bufferView.get('target', gl.GL_ARRAY_BUFFER)
+        gl.glBindBuffer(target, buffer_id)
+        gl.glBufferData(target, bufferView['byteLength'],
+                        _get_bufferView_array(gltf, bufferView, uri_path), gl.GL_STATIC_DRAW)
         if gl.glGetError() != gl.GL_NO_ERROR:
             raise Exception('failed to create buffer "%s"' % bufferView_name)
         bufferView['id'] = buffer_id
-        gl.glBindBuffer(bufferView['target'], 0)
+        gl.glBindBuffer(target, 0)
         _logger.debug('created buffer "%s"' % bufferView_name)
 
 
 def setup_buffers_v2(gltf, uri_path):
-    buffers = gltf.get('buffers', [])
-    data_buffers = []
-    for i, buffer in enumerate(buffers):
-        uri = buffer['uri']
-        if uri.startswith('data:application/octet-stream;base64,'):
-            data_buffers.append(base64.b64decode(uri.split(',')[1]))
-        else:
-            filename = os.path.join(uri_path, buffer['uri'])
-            data_buffers.append(open(filename, 'rb').read())
-            _logger.debug('loaded buffer %s from "%s"',
-                          i if 'name' not in buffer else '%d ("%s")' % (i, buffer['name']),
-                          filename)
+    for i, buffer in enumerate(gltf.get('buffers', [])):
+        get_buffer_data(buffer, uri_path)
+        _logger.debug('loaded buffer %s', i if 'name' not in buffer else '%d ("%s")' % (i, buffer['name']))
     for i, bufferView in enumerate(gltf.get('bufferViews', [])):
+        if bufferView.get('unreferenced'):
+            # (e.g. the original data of quantized attributes)
+            continue
         buffer_id = gl.glGenBuffers(1)
-        byteOffset = bufferView.get('byteOffset', 0)
         target = bufferView.get('target', gl.GL_ARRAY_BUFFER)
         gl.glBindBuffer(target, buffer_id)
         gl.glBufferData(target, bufferView['byteLength'],
-                        data_buffers[bufferView['buffer']][byteOffset:], gl.GL_STATIC_DRAW)
+                        _get_bufferView_array(gltf, bufferView, uri_path), gl.GL_STATIC_DRAW)
         if gl.glGetError() != gl.GL_NO_ERROR:
             raise Exception('failed to create bufferView %s' % i)
         bufferView['id'] = buffer_id
@@ -284,11 +608,19 @@ def setup_buffers_v2(gltf, uri_path):
 def _setup_vertex_array_objects_for_primitive(primitive, gltf):
     if 'vao' in primitive:
         return
+    primitive['vao'] = create_primitive_vertex_array(primitive, primitive['material'], gltf)
+
+
+def create_primitive_vertex_array(primitive, material_name, gltf):
+    """
+    Creates a vertex array object which binds the attributes of a primitive to those of the program
+    of a material's technique.
+    """
     enabled_locations = []
     buffer_id = None
     vao = gl.glGenVertexArrays(1)
     gl.glBindVertexArray(vao)
-    material = gltf['materials'][primitive['material']]
+    material = gltf['materials'][material_name]
     technique = gltf['techniques'][material['technique']]
     program = gltf['programs'][technique['program']]
     accessor_names = primitive['attributes']
@@ -309,7 +641,7 @@ def _setup_vertex_array_objects_for_primitive(primitive, gltf):
                 enabled_locations.append(location)
                 gl.glVertexAttribPointer(location,
                                          GLTF_BUFFERVIEW_TYPE_SIZES[accessor['type']],
-                                         accessor['componentType'], False,
+                                         accessor['componentType'], accessor.get('normalized', False),
                                          accessor.get('byteStride', # GLTF 1.0
                                                       bufferView.get('byteStride', 0)), # GLTF 2.0
                                          c_void_p(accessor.get('byteOffset', 0)))
@@ -319,7 +651,7 @@ def _setup_vertex_array_objects_for_primitive(primitive, gltf):
     gl.glBindVertexArray(0)
     for location in enabled_locations:
         gl.glDisableVertexAttribArray(location)
-    primitive['vao'] = vao
+    return vao
 
 
 def setup_vertex_array_objects(gltf, mesh):
@@ -327,7 +659,44 @@ def setup_vertex_array_objects(gltf, mesh):
         _setup_vertex_array_objects_for_primitive(primitive, gltf)
 
 
-def init_scene(gltf, uri_path, scene_name=None):
+def _create_load_executors(load_workers, load_processes=False):
+    if not load_workers:
+        return None, None
+    executor = ThreadPoolExecutor(max_workers=load_workers)
+    if load_processes:
+        image_executor = ProcessPoolExecutor(max_workers=load_workers,
+                                             mp_context=multiprocessing.get_context('spawn'))
+    else:
+        image_executor = executor
+    _logger.info('loading with %d %s', load_workers, 'processes' if load_processes else 'threads')
+    return executor, image_executor
+
+
+def init_scene(gltf, uri_path, scene_name=None, load_workers=None, load_processes=False, cache=None,
+               texture_streamer=None, use_ubo=False, instancing=False, optimize_indices=False,
+               quantize_attributes=False):
+    """
+    Sets up all GL resources required to render a scene of the given gltf dict.
+
+    :param load_workers: if specified, images are decoded and buffers are read in by a pool of
+                         this many workers, while GL setup proceeds on the calling (GL context) thread
+    :param load_processes: if True, images are decoded by a pool of processes rather than threads
+    :param cache: optional :code:`AssetCache` from which previously decoded textures
+                  and linked program binaries are loaded
+    :param texture_streamer: optional :code:`TextureStreamer`: if specified, the scene is set up without waiting for
+                             images to load, textures are instead uploaded progressively by the streamer
+                             (images are then always loaded by a pool of workers)
+    :param use_ubo: if True, the PBRMR programs of GLTF 2.0 scenes read their per-frame and material uniforms
+                    from uniform buffers (see :mod:`gltfutils.uniformbuffers`)
+    :param instancing: if True, instanced variants of the PBRMR programs of GLTF 2.0 scenes are also set up,
+                       for drawing nodes which share meshes with instanced draw calls (see :mod:`gltfutils.instancing`)
+                       - they are always set up for scenes which use the :code:`EXT_mesh_gpu_instancing` extension
+    :param optimize_indices: if True, the indices (and vertices) of triangle primitives are reordered for the vertex
+                             cache and to reduce overdraw before they are uploaded (see :mod:`gltfutils.meshopt`),
+                             the optimized indices are stored in the :code:`cache`, if it is given
+    :param quantize_attributes: if True, the float vertex attributes of GLTF 2.0 meshes are quantized to smaller
+                                types before they are uploaded (see :mod:`gltfutils.quantization`)
+    """
     version = gltf.get('asset', {'version': '1.0'})['version']
     generator = gltf.get('asset', {'generator': 'no generator was specified for this file'})\
                     .get('generator', 'no generator was specified for this file')
@@ -338,10 +707,31 @@ def init_scene(gltf, uri_path, scene_name=None):
 
 ''', version, generator)
 
+    if texture_streamer is not None and not load_workers:
+        load_workers = 1
+    executor, image_executor = _create_load_executors(load_workers, load_processes=load_processes)
+
+    def _start_loading(gltf, uri_path):
+        if executor is None:
+            return None, []
+        return (submit_load_images(gltf, uri_path, image_executor, cache=cache),
+                submit_load_buffers(gltf, uri_path, executor))
+
+    def _finish_loading(image_futures, buffer_futures):
+        for future in buffer_futures:
+            future.result()
+        if image_futures is None or texture_streamer is not None:
+            return image_futures
+        return {image_name: future.result() for image_name, future in image_futures.items()}
+
     def _init_scene_v1(gltf, uri_path, scene_name=None):
-        shader_ids = setup_shaders(gltf, uri_path)
-        setup_programs(gltf, shader_ids)
-        setup_textures(gltf, uri_path)
+        image_futures, buffer_futures = _start_loading(gltf, uri_path)
+        shader_sources = load_shaders(gltf, uri_path)
+        setup_programs(gltf, shader_sources=shader_sources, cache=cache)
+        pil_images = _finish_loading(image_futures, buffer_futures)
+        setup_textures(gltf, uri_path, pil_images=pil_images, cache=cache, texture_streamer=texture_streamer)
+        if optimize_indices:
+            optimize_mesh_indices(gltf, uri_path=uri_path, cache=cache)
         setup_buffers(gltf, uri_path)
         scenes = gltf.get('scenes', {})
         if scene_name and scene_name in scenes:
@@ -356,10 +746,17 @@ def init_scene(gltf, uri_path, scene_name=None):
             return next((scene for scene in scenes.values()), {'nodes': list(nodes_dict.keys())})
 
     def _init_scene_v2(gltf, uri_path, scene_name=None):
-        backport_pbrmr_materials(gltf)
-        shader_ids = setup_shaders(gltf, uri_path)
-        setup_programs(gltf, shader_ids)
-        setup_textures_v2(gltf, uri_path)
+        image_futures, buffer_futures = _start_loading(gltf, uri_path)
+        backport_pbrmr_materials(gltf, use_ubo=use_ubo,
+                                 instancing=instancing or EXT_MESH_GPU_INSTANCING in gltf.get('extensionsUsed', []))
+        shader_sources = load_shaders(gltf, uri_path)
+        setup_programs(gltf, shader_sources=shader_sources, cache=cache)
+        pil_images = _finish_loading(image_futures, buffer_futures)
+        setup_textures_v2(gltf, uri_path, pil_images=pil_images, cache=cache, texture_streamer=texture_streamer)
+        if optimize_indices:
+            optimize_mesh_indices(gltf, uri_path=uri_path, cache=cache)
+        if quantize_attributes:
+            _quantize_attributes(gltf, uri_path=uri_path)
         setup_buffers_v2(gltf, uri_path)
         scenes = gltf.get('scenes', [])
         if scene_name and scene_name < len(scenes):
@@ -372,19 +769,29 @@ def init_scene(gltf, uri_path, scene_name=None):
                         root_nodes.remove(i_child)
             return next((scene for scene in scenes), {'nodes': list(root_nodes)})
 
-    if version.startswith('1.'):
-        scene = _init_scene_v1(gltf, uri_path, scene_name=scene_name)
-        all_meshes = gltf.get('meshes', {})
-    else:
-        if not version.startswith('2.'):
-            _logger.warning('''unknown GLTF version: %s
-            ...will try loading as 2.0...
-            ''', version)
-        scene = _init_scene_v2(gltf, uri_path, scene_name=scene_name)
-        all_meshes = gltf.get('meshes', [])
+    try:
+        if version.startswith('1.'):
+            scene = _init_scene_v1(gltf, uri_path, scene_name=scene_name)
+            all_meshes = gltf.get('meshes', {})
+        else:
+            if not version.startswith('2.'):
+                _logger.warning('''unknown GLTF version: %s
+                ...will try loading as 2.0...
+                ''', version)
+            scene = _init_scene_v2(gltf, uri_path, scene_name=scene_name)
+            all_meshes = gltf.get('meshes', [])
+    finally:
+        # when streaming textures, images continue to load after the scene is set up:
+        wait = texture_streamer is None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+        if image_executor is not None and image_executor is not executor:
+            image_executor.shutdown(wait=wait)
 
     nodes = [gltf['nodes'][n] for n in scene.get('nodes', [])]
-    flattened_nodes = flatten_nodes(nodes, gltf)
+    scene_index = SceneIndex(gltf, scene.get('nodes', []))
+    scene['scene_index'] = scene_index
+    flattened_nodes = scene_index.nodes
     flattened_meshes = list(chain.from_iterable([[all_meshes[m] for m in node.get('meshes', [])] +
                                                  ([] if 'mesh' not in node else
                                                   [all_meshes[node['mesh']]])
@@ -395,59 +802,107 @@ def init_scene(gltf, uri_path, scene_name=None):
     number of meshes in scene: %d''', len(nodes), len(flattened_nodes), len(flattened_meshes))
     for mesh in flattened_meshes:
         setup_vertex_array_objects(gltf, mesh)
-    for node in nodes:
-        update_world_matrices(node, gltf)
+    scene['transform_store'] = TransformStore(gltf, scene.get('nodes', []), scene_index=scene_index)
+    _logger.info('peak memory usage after loading scene: %s', format_peak_memory_usage())
     return scene
 
 
-def find_mesh_bounds(mesh, gltf):
+def get_accessor_bounds(gltf, accessor_name, uri_path=None):
+    """
+    Returns the bounds of the data of an accessor as a float32 array :code:`[min, max]`
+    (or :code:`None` if the accessor is empty).  If the accessor does not define its
+    :code:`min` / :code:`max` properties, they are computed from its data and stored in the accessor.
+    """
+    accessor = gltf['accessors'][accessor_name]
+    if 'min' not in accessor or 'max' not in accessor:
+        array = Accessor(gltf, accessor_name, uri_path=uri_path).array
+        if len(array) == 0:
+            return None
+        array = array.reshape(len(array), -1)
+        # (as per the GLTF spec, the bounds are in terms of the stored, not normalized, values)
+        accessor['min'] = array.min(axis=0).tolist()
+        accessor['max'] = array.max(axis=0).tolist()
+        _logger.debug('computed bounds of accessor %s', accessor_name)
+    bounds = np.array([accessor['min'], accessor['max']], dtype=np.float64)
+    if accessor.get('normalized', False):
+        bounds = normalize_array(bounds.astype(COMPONENT_TYPE_DTYPES[accessor['componentType']]))
+    return bounds.astype(np.float32)
+
+
+def find_mesh_bounds(mesh, gltf, uri_path=None):
+    """Returns a dict mapping attribute semantic to the bounds :code:`[min, max]` of the mesh's attribute data."""
     bounds = {}
     for primitive in mesh['primitives']:
-        material = gltf['materials'][primitive['material']]
-        technique = gltf['techniques'][material['technique']]
-        accessor_names = primitive['attributes']
-        for attribute_name, parameter_name in technique['attributes'].items():
-            parameter = technique['parameters'][parameter_name]
-            if 'semantic' in parameter:
-                semantic = parameter['semantic']
-                if semantic in accessor_names:
-                    accessor = gltf['accessors'][accessor_names[semantic]]
-                    if ('min' in accessor or 'max' in accessor) and semantic not in bounds:
-                        ndim = GLTF_BUFFERVIEW_TYPE_SIZES[accessor['type']]
-                        bounds[semantic] = np.array([ndim*[float('inf')], ndim*[float('-inf')]],
-                                                    dtype=np.float32)
-                    if 'min' in accessor:
-                        bounds[semantic][0] = np.minimum(bounds[semantic][0], accessor['min'])
-                    if 'max' in accessor:
-                        bounds[semantic][1] = np.maximum(bounds[semantic][1], accessor['max'])
+        for semantic, accessor_name in primitive.get('attributes', {}).items():
+            accessor_bounds = get_accessor_bounds(gltf, accessor_name, uri_path=uri_path)
+            if accessor_bounds is None:
+                continue
+            if semantic not in bounds:
+                bounds[semantic] = accessor_bounds
+            elif bounds[semantic].shape == accessor_bounds.shape:
+                np.minimum(bounds[semantic][0], accessor_bounds[0], out=bounds[semantic][0])
+                np.maximum(bounds[semantic][1], accessor_bounds[1], out=bounds[semantic][1])
     return bounds
 
 
-def find_scene_bounds(scene, gltf):
+# selects the 8 corners of a box from [min, max] along each axis:
+_BOX_CORNERS = np.array([[(i >> axis) & 1 for axis in range(3)] for i in range(8)], dtype=bool)
+
+
+def transform_bounds(bounds, world_matrices):
+    """
+    Transforms axis-aligned boxes (an array of shape :code:`(N, 2, 3)` of :code:`[min, max]`) by
+    (row-vector convention) world matrices (an array of shape :code:`(N, 4, 4)`), returning the
+    array of shape :code:`(N, 2, 3)` of the axis-aligned bounds of each transformed box.
+    """
+    corners = np.where(_BOX_CORNERS, bounds[:,None,1,:], bounds[:,None,0,:])
+    world_corners = np.einsum('nci,nij->ncj', corners, world_matrices[:,:3,:3])
+    world_corners += world_matrices[:,None,3,:3]
+    return np.stack([world_corners.min(axis=1), world_corners.max(axis=1)], axis=1)
+
+
+def find_scene_bounds(scene, gltf, uri_path=None):
+    """
+    Returns a dict mapping attribute semantic to the bounds :code:`[min, max]` of the attribute data
+    of all meshes of the scene.  POSITION bounds are in world space (all 8 corners of the bounding box
+    of each mesh instance are transformed by the world matrix of its node, or of each of its instances for nodes
+    which use the :code:`EXT_mesh_gpu_instancing` extension), the bounds of other semantics are not transformed.
+    """
     root_nodes = [gltf['nodes'][n] for n in scene.get('nodes', [])]
     all_nodes = flatten_nodes(root_nodes, gltf)
-    scene_bounds = {}
+    mesh_indices = {}
     all_mesh_bounds = []
-    world_matrices = []
+    instance_meshes = []
+    instance_matrices = []
     for node in all_nodes:
-        if 'mesh' in node:
-            mesh_bounds = find_mesh_bounds(gltf['meshes'][node['mesh']], gltf)
-            all_mesh_bounds.append(mesh_bounds)
-            world_matrices.append(node['world_matrix'])
-        if 'meshes' in node:
-            for m in node['meshes']:
-                mesh_bounds = find_mesh_bounds(gltf['meshes'][m], gltf)
-                all_mesh_bounds.append(mesh_bounds)
-                world_matrices.append(node['world_matrix'])
-    for mesh_bounds, world_matrix in zip(all_mesh_bounds, world_matrices):
-        for semantic, bounds in mesh_bounds.items():
-            ndim = bounds.shape[1]
-            if semantic not in scene_bounds:
-                scene_bounds[semantic] = np.array([ndim*[float( 'inf')],
-                                                   ndim*[float('-inf')]], dtype=np.float32)
-            mesh_world_bounds = bounds.dot(world_matrix[:ndim,:ndim])
-            scene_bounds[semantic][0] = np.minimum(scene_bounds[semantic][0], mesh_world_bounds[0])
-            scene_bounds[semantic][1] = np.maximum(scene_bounds[semantic][1], mesh_world_bounds[1])
+        node_matrices = [node['world_matrix']]
+        if EXT_MESH_GPU_INSTANCING in node.get('extensions', {}):
+            node_matrices = np.matmul(get_instance_matrices(gltf, node, uri_path=uri_path), node['world_matrix'])
+        for m in chain(node.get('meshes', []), [node['mesh']] if 'mesh' in node else []):
+            if m not in mesh_indices:
+                mesh_indices[m] = len(all_mesh_bounds)
+                all_mesh_bounds.append(find_mesh_bounds(gltf['meshes'][m], gltf, uri_path=uri_path))
+            instance_meshes.extend([mesh_indices[m]] * len(node_matrices))
+            if 'dequantization_matrix' in gltf['meshes'][m]:
+                instance_matrices.extend(np.matmul(gltf['meshes'][m]['dequantization_matrix'], node_matrices))
+            else:
+                instance_matrices.extend(node_matrices)
+    scene_bounds = {}
+    if not instance_meshes:
+        return scene_bounds
+    instance_meshes = np.array(instance_meshes)
+    instance_matrices = np.array(instance_matrices, dtype=np.float32)
+    for semantic in set(chain.from_iterable(all_mesh_bounds)):
+        ndim = next(b[semantic].shape[1] for b in all_mesh_bounds if semantic in b)
+        has_semantic = np.array([semantic in b and b[semantic].shape[1] == ndim for b in all_mesh_bounds])
+        bounds = np.array([b[semantic] if has else np.zeros((2, ndim), dtype=np.float32)
+                           for b, has in zip(all_mesh_bounds, has_semantic)])
+        instances = has_semantic[instance_meshes]
+        instance_bounds = bounds[instance_meshes[instances]]
+        if semantic == 'POSITION' and ndim == 3:
+            instance_bounds = transform_bounds(instance_bounds, instance_matrices[instances])
+        scene_bounds[semantic] = np.array([instance_bounds[:,0].min(axis=0),
+                                           instance_bounds[:,1].max(axis=0)], dtype=np.float32)
     return scene_bounds
 
 
@@ -475,6 +930,25 @@ set_technique_state.current_technique = None
 set_technique_state.states = {}
 
 
+def get_material_value(material_name, parameter_name, gltf):
+    """
+    Returns the value of a (non-semantic) parameter of a material: the material's value, or else the
+    parameter's value, or else the default value for the parameter's type.
+    """
+    material = gltf['materials'][material_name]
+    technique = gltf['techniques'][material['technique']]
+    parameter = technique['parameters'][parameter_name]
+    value = material.get('values', {}).get(parameter_name,
+                                           parameter.get('value',
+                                                         _DEFAULT_MATERIAL_VALUES_BY_PARAM_TYPE.get(parameter['type'])))
+    if value is None:
+        raise Exception('''could not determine a value to use for material "%s", parameter "%s":
+        %s''' % (material_name, parameter_name, parameter['type']))
+    if isinstance(value, (tuple, list)):
+        value = np.array(value, dtype=np.float32)
+    return value
+
+
 def set_material_state(material_name, gltf):
     if set_material_state.current_material == material_name:
         return
@@ -486,25 +960,19 @@ def set_material_state(material_name, gltf):
     program = gltf['programs'][technique['program']]
     textures = gltf.get('textures', {})
     samplers = gltf.get('samplers', {})
-    material_values = material.get('values', {})
     for uniform_name, parameter_name in technique['uniforms'].items():
         parameter = technique['parameters'][parameter_name]
         if 'semantic' in parameter:
             continue
-        value = material_values.get(parameter_name,
-                                    parameter.get('value',
-                                                  _DEFAULT_MATERIAL_VALUES_BY_PARAM_TYPE.get(parameter['type'])))
-        if value is None:
-            raise Exception('''could not determine a value to use for material "%s", parameter "%s":
-            %s %s''' % (material_name, parameter_name,
-                        parameter['type'], uniform_name))
-        if isinstance(value, (tuple, list)):
-            value = np.array(value, dtype=np.float32)
         if uniform_name in program['uniform_locations']:
             location = program['uniform_locations'][uniform_name]
         else:
             location = gl.glGetUniformLocation(program['id'], uniform_name)
             program['uniform_locations'][uniform_name] = location
+        if location == -1:
+            # inactive, or a member of a uniform block (see gltfutils.uniformbuffers)
+            continue
+        value = get_material_value(material_name, parameter_name, gltf)
         if parameter['type'] == gl.GL_SAMPLER_2D:
             texture = textures[value]
             gl.glActiveTexture(gl.GL_TEXTURE0 + set_material_state.n_tex)
@@ -538,6 +1006,158 @@ set_material_state.current_material = None
 set_material_state.n_tex = 0
 
 
+class SemanticUniformValues(object):
+    """
+    Preallocated arrays holding the values of the uniforms of each semantic, which are computed
+    once per frame (:meth:`set_frame`) and once per model matrix (:meth:`set_model`).
+    The value of a uniform is always held by the same array (see :meth:`get_value`), so that the
+    uniforms of a draw can be set from a precomputed list of (location, value array) pairs.
+
+    Alternatively, the values which depend on the model matrix are computed for many model matrices
+    (and views) at once by :meth:`set_models`, into the arrays of :attr:`model_values`.
+
+    :param gltf: the gltf dict
+    :param semantics: the semantics whose values are computed (by default, all semantics)
+    """
+    def __init__(self, gltf, semantics=None):
+        self.gltf = gltf
+        self.semantics = frozenset(range(len(UNIFORM_SEMANTICS)) if semantics is None else semantics)
+        self.values = [np.eye(4, dtype=np.float32) for _ in UNIFORM_SEMANTICS]
+        self.values[SEMANTIC_MODELVIEWINVERSETRANSPOSE] = np.eye(3, dtype=np.float32)
+        self.values[SEMANTIC_VIEWPORT] = np.array([0.0, 800.0, 0.0, 600.0], dtype=np.float32)
+        self.node_modelview_matrices = {}
+        self.projection_matrix = None
+        self.view_matrix = None
+        # (indexed by semantic, arrays of shape (num. views, num. models, ...) or None):
+        self.model_values = [None for _ in UNIFORM_SEMANTICS]
+
+    def get_value(self, uniform):
+        """Returns the array which holds the value of the given :code:`SemanticUniform`."""
+        if uniform.semantic == SEMANTIC_MODELVIEW and uniform.node is not None:
+            # the modelview matrix of a specific node:
+            if uniform.node not in self.node_modelview_matrices:
+                self.node_modelview_matrices[uniform.node] = np.eye(4, dtype=np.float32)
+            return self.node_modelview_matrices[uniform.node]
+        return self.values[uniform.semantic]
+
+    def is_frame_uniform(self, uniform):
+        """Returns True if the value of the given :code:`SemanticUniform` is set by :meth:`set_frame`."""
+        return uniform.semantic in FRAME_SEMANTICS or (uniform.semantic == SEMANTIC_MODELVIEW and
+                                                       uniform.node is not None)
+
+    def set_frame(self, projection_matrix, view_matrix, camera_matrix=None):
+        values = self.values
+        semantics = self.semantics
+        self.projection_matrix = projection_matrix
+        self.view_matrix = view_matrix
+        values[SEMANTIC_VIEW][...] = view_matrix
+        if SEMANTIC_VIEWINVERSE in semantics:
+            values[SEMANTIC_VIEWINVERSE][...] = np.linalg.inv(view_matrix) if camera_matrix is None else camera_matrix
+        if projection_matrix is not None:
+            values[SEMANTIC_PROJECTION][...] = projection_matrix
+            if SEMANTIC_PROJECTIONINVERSE in semantics:
+                values[SEMANTIC_PROJECTIONINVERSE][...] = np.linalg.inv(projection_matrix)
+        nodes = self.gltf['nodes']
+        for node_name, modelview_matrix in self.node_modelview_matrices.items():
+            nodes[node_name]['world_matrix'].dot(view_matrix, out=modelview_matrix)
+
+    def set_model(self, model_matrix):
+        values = self.values
+        semantics = self.semantics
+        modelview_matrix = values[SEMANTIC_MODELVIEW]
+        values[SEMANTIC_MODEL][...] = model_matrix
+        model_matrix.dot(self.view_matrix, out=modelview_matrix)
+        values[SEMANTIC_MODELVIEWINVERSETRANSPOSE][...] = np.linalg.inv(modelview_matrix[:3,:3])
+        if SEMANTIC_MODELINVERSE in semantics or SEMANTIC_MODELINVERSETRANSPOSE in semantics:
+            values[SEMANTIC_MODELINVERSE][...] = np.linalg.inv(model_matrix)
+            values[SEMANTIC_MODELINVERSETRANSPOSE][...] = values[SEMANTIC_MODELINVERSE]
+        if SEMANTIC_MODELVIEWINVERSE in semantics:
+            values[SEMANTIC_MODELVIEWINVERSE][...] = np.linalg.inv(modelview_matrix)
+        if self.projection_matrix is not None:
+            self.projection_matrix.dot(modelview_matrix, out=values[SEMANTIC_MODELVIEWPROJECTION])
+            if SEMANTIC_MODELVIEWPROJECTIONINVERSE in semantics:
+                values[SEMANTIC_MODELVIEWPROJECTIONINVERSE][...] = np.linalg.inv(values[SEMANTIC_MODELVIEWPROJECTION])
+
+    def set_models(self, model_matrices, view_matrices, projection_matrices=None):
+        """
+        Batched version of :meth:`set_model`: computes the values of the model-dependent semantics for
+        an array of shape :code:`(N, 4, 4)` of model matrices and one or more views (e.g. one per eye),
+        given as arrays of shape :code:`(4, 4)` or :code:`(E, 4, 4)`.
+
+        :attr:`model_values` then holds, for each semantic, the array of shape :code:`(E, N, ...)` of its values.
+        """
+        semantics = self.semantics
+        view_matrices = np.asarray(view_matrices, dtype=np.float32).reshape(-1, 4, 4)
+        num_views, num_models = len(view_matrices), len(model_matrices)
+        model_values = self.model_values
+        modelview_matrices = model_values[SEMANTIC_MODELVIEW]
+        if modelview_matrices is None or modelview_matrices.shape[:2] != (num_views, num_models):
+            # (re)allocate the arrays of the semantics which are computed:
+            for semantic in (SEMANTIC_MODELVIEW, SEMANTIC_MODELVIEWINVERSETRANSPOSE, SEMANTIC_MODELVIEWPROJECTION,
+                             SEMANTIC_MODELVIEWINVERSE, SEMANTIC_MODELVIEWPROJECTIONINVERSE):
+                if semantic in semantics or semantic in (SEMANTIC_MODELVIEW, SEMANTIC_MODELVIEWPROJECTION):
+                    shape = (3, 3) if semantic == SEMANTIC_MODELVIEWINVERSETRANSPOSE else (4, 4)
+                    model_values[semantic] = np.empty((num_views, num_models) + shape, dtype=np.float32)
+            modelview_matrices = model_values[SEMANTIC_MODELVIEW]
+        # (the model matrices and their inverses do not depend on the view):
+        model_values[SEMANTIC_MODEL] = np.broadcast_to(model_matrices, (num_views,) + model_matrices.shape)
+        if SEMANTIC_MODELINVERSE in semantics or SEMANTIC_MODELINVERSETRANSPOSE in semantics:
+            model_inverses = np.linalg.inv(model_matrices)
+            model_values[SEMANTIC_MODELINVERSE] = model_values[SEMANTIC_MODELINVERSETRANSPOSE] = \
+                np.broadcast_to(model_inverses, (num_views,) + model_inverses.shape)
+        np.matmul(model_matrices[None], view_matrices[:,None], out=modelview_matrices)
+        if SEMANTIC_MODELVIEWINVERSETRANSPOSE in semantics:
+            model_values[SEMANTIC_MODELVIEWINVERSETRANSPOSE][...] = np.linalg.inv(modelview_matrices[...,:3,:3])
+        if SEMANTIC_MODELVIEWINVERSE in semantics:
+            model_values[SEMANTIC_MODELVIEWINVERSE][...] = np.linalg.inv(modelview_matrices)
+        if projection_matrices is not None:
+            projection_matrices = np.asarray(projection_matrices, dtype=np.float32).reshape(-1, 4, 4)
+            mvp_matrices = model_values[SEMANTIC_MODELVIEWPROJECTION]
+            np.matmul(projection_matrices[:,None], modelview_matrices, out=mvp_matrices)
+            if SEMANTIC_MODELVIEWPROJECTIONINVERSE in semantics:
+                model_values[SEMANTIC_MODELVIEWPROJECTIONINVERSE][...] = np.linalg.inv(mvp_matrices)
+
+
+def set_semantic_uniforms(technique, gltf,
+                          projection_matrix=None,
+                          view_matrix=None,
+                          camera_matrix=None,
+                          model_matrix=None,
+                          modelview_matrix=None,
+                          normal_matrix=None,
+                          mvp_matrix=None,
+                          local_matrix=None):
+    """
+    Sets the values of the uniforms of a technique which have semantics
+    (the technique's program must be in use), using the binding table of the program
+    (see :func:`setup_programs`).  Uniforms whose values depend on the model matrix are
+    only set if it is given.
+    """
+    program = gltf['programs'][technique['program']]
+    values = set_semantic_uniforms.values
+    if values is None or values.gltf is not gltf:
+        values = set_semantic_uniforms.values = SemanticUniformValues(gltf)
+    if view_matrix is None and camera_matrix is not None:
+        view_matrix = np.linalg.inv(camera_matrix)
+    if view_matrix is not None:
+        values.set_frame(projection_matrix, view_matrix, camera_matrix=camera_matrix)
+        if model_matrix is not None:
+            values.set_model(model_matrix)
+    for uniform in program['semantic_uniforms']:
+        if uniform.semantic == SEMANTIC_LOCAL:
+            if local_matrix is None:
+                continue
+            value = local_matrix
+        elif uniform.semantic == SEMANTIC_VIEWPORT:
+            value = values.get_value(uniform)
+        elif view_matrix is None or (model_matrix is None and not values.is_frame_uniform(uniform)):
+            continue
+        else:
+            value = values.get_value(uniform)
+        uniform.setter(uniform.location, 1, uniform.transpose, value)
+set_semantic_uniforms.values = None
+
+
 def set_draw_state(primitive, gltf,
                    projection_matrix=None,
                    view_matrix=None,
@@ -550,74 +1170,19 @@ def set_draw_state(primitive, gltf,
     set_material_state(primitive['material'], gltf)
     material = gltf['materials'][primitive['material']]
     technique = gltf['techniques'][material['technique']]
-    program = gltf['programs'][technique['program']]
-    for uniform_name, parameter_name in technique['uniforms'].items():
-        parameter = technique['parameters'][parameter_name]
-        if 'semantic' in parameter:
-            semantic = parameter['semantic']
-            location = gl.glGetUniformLocation(program['id'], uniform_name)
-            if semantic == 'MODELVIEW':
-                if 'node' in parameter and view_matrix is not None:
-                    world_matrix = gltf['nodes'][parameter['node']]['world_matrix']
-                    world_matrix.dot(view_matrix, out=set_draw_state.modelview_matrix)
-                    gl.glUniformMatrix4fv(location, 1, False, set_draw_state.modelview_matrix)
-                elif modelview_matrix is not None:
-                    gl.glUniformMatrix4fv(location, 1, False, modelview_matrix)
-            elif semantic == 'PROJECTION':
-                if projection_matrix is not None:
-                    gl.glUniformMatrix4fv(location, 1, False, projection_matrix)
-            elif semantic == 'MODELVIEWPROJECTION':
-                if mvp_matrix is not None:
-                    gl.glUniformMatrix4fv(location, 1, True, mvp_matrix)
-            elif semantic == 'MODEL':
-                if model_matrix is not None:
-                    gl.glUniformMatrix4fv(location, 1, False, model_matrix)
-            elif semantic == 'LOCAL':
-                if local_matrix is not None:
-                    gl.glUniformMatrix4fv(location, 1, False, local_matrix)
-            elif semantic == 'VIEW':
-                if view_matrix is not None:
-                    gl.glUniformMatrix4fv(location, 1, False, view_matrix)
-            elif semantic == 'VIEWINVERSE':
-                if camera_matrix is None and view_matrix is not None:
-                    camera_matrix = np.linalg.inv(view_matrix)
-                if camera_matrix is not None:
-                    gl.glUniformMatrix4fv(location, 1, False, camera_matrix)
-            elif semantic == 'MODELVIEWINVERSETRANSPOSE':
-                if normal_matrix is not None:
-                    gl.glUniformMatrix3fv(location, 1, True, normal_matrix)
-            elif semantic == 'MODELINVERSE':
-                if model_matrix is not None:
-                    model_inverse_matrix = np.linalg.inv(model_matrix)
-                    gl.glUniformMatrix4fv(location, 1, False, model_inverse_matrix)
-            elif semantic == 'MODELINVERSETRANSPOSE':
-                if model_matrix is not None:
-                    model_inverse_matrix = np.linalg.inv(model_matrix)
-                    gl.glUniformMatrix4fv(location, 1, True, model_inverse_matrix)
-            elif semantic == 'MODELVIEWINVERSE':
-                if modelview_matrix is not None:
-                    modelview_inverse_matrix = np.linalg.inv(modelview_matrix)
-                    gl.glUniformMatrix4fv(location, 1, False, modelview_inverse_matrix)
-            elif semantic == 'MODELVIEWPROJECTIONINVERSE':
-                if mvp_matrix is not None:
-                    mvp_inverse_matrix = np.linalg.inv(mvp_matrix)
-                    gl.glUniformMatrix4fv(location, 1, True, mvp_inverse_matrix)
-            elif semantic == 'PROJECTIONINVERSE':
-                if projection_matrix is not None:
-                    projection_inverse_matrix = np.linalg.inv(projection_matrix)
-                    gl.glUniformMatrix4fv(location, 1, False, projection_inverse_matrix)
-            elif semantic == 'VIEWPORT':
-                gl.glUniform4f(location, *set_draw_state.viewport)
-            else:
-                raise Exception('unhandled semantic for uniform "%s": %s' %
-                                (uniform_name, parameter['semantic']))
+    set_semantic_uniforms(technique, gltf,
+                          projection_matrix=projection_matrix,
+                          view_matrix=view_matrix,
+                          camera_matrix=camera_matrix,
+                          model_matrix=model_matrix,
+                          modelview_matrix=modelview_matrix,
+                          normal_matrix=normal_matrix,
+                          mvp_matrix=mvp_matrix,
+                          local_matrix=local_matrix)
     gl.glBindVertexArray(primitive['vao'])
     if CHECK_GL_ERRORS:
         if gl.glGetError() != gl.GL_NO_ERROR:
             raise Exception('error setting draw state')
-set_draw_state.modelview_matrix = np.empty((4,4), dtype=np.float32)
-set_draw_state.mvp_matrix = np.empty((4,4), dtype=np.float32)
-set_draw_state.viewport = np.array([0.0, 800.0, 0.0, 600.0], dtype=np.float32)
 
 
 def draw_primitive(primitive, gltf,
@@ -657,6 +1222,11 @@ def draw_primitive(primitive, gltf,
         if gl.glGetError() != gl.GL_NO_ERROR:
             raise Exception('error drawing elements')
 num_draw_calls = 0
+# the numbers of nodes which were drawn / skipped by view-frustum culling (see gltfutils.drawlist):
+num_nodes_visible = 0
+num_nodes_culled = 0
+# the number of draws of nodes which were occluded (skipped, or rendered conditionally):
+num_draws_occluded = 0
 
 
 def set_vert_draw_state(projection_matrix=None,
@@ -694,7 +1264,8 @@ def draw_mesh(mesh, gltf,
 def draw_node(node, gltf,
               projection_matrix=None,
               view_matrix=None,
-              camera_matrix=None):
+              camera_matrix=None,
+              draw_children=True):
     if 'meshes' in node: # GLTF v1.0
         meshes = node['meshes']
     elif 'mesh' in node: # GLTF v2.0
@@ -702,7 +1273,7 @@ def draw_node(node, gltf,
     else:
         meshes = []
     if meshes:
-        model_matrix = node['world_matrix']
+        model_matrix = get_model_matrix(node, gltf)
         if view_matrix is None:
             view_matrix = np.linalg.inv(camera_matrix)
         model_matrix.dot(view_matrix, out=draw_node.modelview_matrix)
@@ -718,7 +1289,7 @@ def draw_node(node, gltf,
                       modelview_matrix=draw_node.modelview_matrix,
                       normal_matrix=draw_node.normal_matrix,
                       mvp_matrix=draw_node.mvp_matrix)
-    if 'children' in node:
+    if draw_children and 'children' in node:
         for child in node['children']:
             draw_node(gltf['nodes'][child], gltf,
                       projection_matrix=projection_matrix,
@@ -729,6 +1300,17 @@ draw_node.normal_matrix    = np.eye(3, dtype=np.float32)
 draw_node.mvp_matrix       = np.eye(4, dtype=np.float32)
 
 
+def get_model_matrix(node, gltf):
+    """
+    Returns the model matrix of a node: its world matrix, preceded by the dequantization matrix of its mesh
+    if the mesh's positions have been quantized (see :mod:`gltfutils.quantization`).
+    """
+    mesh = gltf['meshes'][node['mesh']] if 'mesh' in node else None
+    if mesh is not None and 'dequantization_matrix' in mesh:
+        return mesh['dequantization_matrix'].dot(node['world_matrix'])
+    return node['world_matrix']
+
+
 def update_world_matrices(node, gltf, world_matrix=None):
     if 'matrix' not in node:
         matrix = np.eye(4, dtype=np.float32)
@@ -755,11 +1337,24 @@ def update_world_matrices(node, gltf, world_matrix=None):
 
 
 def flatten_nodes(nodes, gltf, flat=None):
+    """
+    Returns the list of the given nodes followed by all of their descendents
+    (the children of each node, followed by the descendents of each of its children).
+    """
     all_nodes = gltf.get('nodes', {})
-    def find_all_descendents(node):
+    nodes = list(nodes)
+    flat = list(nodes)
+    stack = [iter(nodes)]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
         children = [all_nodes[c] for c in node.get('children', [])]
-        return children + list(chain.from_iterable(find_all_descendents(child) for child in children))
-    return list(chain(nodes, chain.from_iterable(find_all_descendents(node) for node in nodes)))
+        if children:
+            flat.extend(children)
+            stack.append(iter(children))
+    return flat
 
 
 def calc_projection_matrix(camera, out=None, **kwargs):
@@ -0,0 +1,132 @@
+"""
+Automatic instancing of the nodes which share a mesh.
+
+Meshes which are the mesh of many nodes (at least :data:`INSTANCING_MIN_NODES`) are drawn with a single
+instanced draw call (:code:`glDrawElementsInstanced`) per primitive, using the instanced variants of the
+PBRMR materials (see :func:`gltfutils.pbrmr.setup_pbrmr_programs`), which read the model matrix from a
+per-instance attribute (with a divisor of 1).  Each frame, the model matrices of the instances which are
+visible (i.e. which were not culled) are written to the instance buffer of the mesh, and the instanced
+draws of the mesh draw only those.
+
+Nodes which use the :code:`EXT_mesh_gpu_instancing` extension are drawn the same way, with the (per-frame)
+world matrices of their instances (each culled individually by the view frustum).
+
+As elsewhere in gltfutils, matrices are stored transposed (i.e. they transform row vectors), so the rows
+of each model matrix are the columns of the :code:`mat4` attribute.
+"""
+from ctypes import c_void_p
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+from gltfutils.gltfutils import create_primitive_vertex_array, transform_bounds
+from gltfutils.culling import cull_boxes
+from gltfutils.transforms import EXT_MESH_GPU_INSTANCING
+
+
+_logger = logging.getLogger(__name__)
+
+
+# the minimum number of nodes which share a mesh for it to be drawn instanced:
+INSTANCING_MIN_NODES = 2
+
+
+def find_instanced_meshes(gltf, nodes, min_nodes=INSTANCING_MIN_NODES):
+    """
+    Returns a dict mapping each mesh which is the (only) mesh of at least :code:`min_nodes` of the given nodes
+    (other than those which use :code:`EXT_mesh_gpu_instancing`), and whose primitives all have instanced
+    material variants, to the array of the positions of those nodes (in the given list).
+    """
+    mesh_nodes = {}
+    for node_slot, node in enumerate(nodes):
+        mesh_names = node.get('meshes', [node['mesh']] if 'mesh' in node else [])
+        if len(mesh_names) == 1 and 'skin' not in node and \
+           EXT_MESH_GPU_INSTANCING not in node.get('extensions', {}):
+            mesh_nodes.setdefault(mesh_names[0], []).append(node_slot)
+    return {mesh_name: np.array(node_slots, dtype=np.int64)
+            for mesh_name, node_slots in mesh_nodes.items()
+            if len(node_slots) >= min_nodes and
+            has_instanced_materials(gltf, mesh_name)}
+
+
+def has_instanced_materials(gltf, mesh_name):
+    """Returns True if the materials of all primitives of a mesh have instanced variants."""
+    materials = gltf['materials']
+    return all('instanced_material' in materials[primitive['material']]
+               for primitive in gltf['meshes'][mesh_name]['primitives'])
+
+
+class InstanceBuffer(object):
+    """
+    A buffer of the (per-instance) model matrices of the instances of a mesh: either of the nodes which share it,
+    or of the :code:`EXT_mesh_gpu_instancing` instances of a node.
+
+    :param node_slots: the positions (in the draw list) of the nodes
+    :param instance_matrices: the local matrices (an array of shape :code:`(K, 4, 4)`) of the instances
+                              of the (single) node, if it uses :code:`EXT_mesh_gpu_instancing`
+    :param instance_bounds: the (local) bounds of the mesh of the instances, for culling them individually
+    """
+    def __init__(self, node_slots, instance_matrices=None, instance_bounds=None):
+        self.node_slots = node_slots
+        self.instance_matrices = instance_matrices
+        self.instance_bounds = None
+        if instance_matrices is not None and instance_bounds is not None:
+            self.instance_bounds = np.broadcast_to(instance_bounds, (len(instance_matrices), 2, 3))
+        self.size = len(node_slots) if instance_matrices is None else len(instance_matrices)
+        self.num_instances = 0
+        self.buffer_id = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer_id)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, 64 * self.size, None, gl.GL_STREAM_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def update(self, model_matrices, node_mask, frustum_planes=None):
+        """
+        Writes the model matrices of the instances whose nodes are those for which :code:`node_mask` is True
+        (given the model matrices of all nodes of the draw list) to the buffer.  The instances of a node which
+        uses :code:`EXT_mesh_gpu_instancing` are also culled by the frustum planes of a view, if given
+        (see :func:`gltfutils.culling.calc_frustum_planes`).
+        """
+        node_slots = self.node_slots[node_mask[self.node_slots]]
+        if self.instance_matrices is None:
+            data = model_matrices[node_slots]
+        elif len(node_slots):
+            data = np.matmul(self.instance_matrices, model_matrices[node_slots[0]])
+            if frustum_planes is not None and self.instance_bounds is not None:
+                data = data[cull_boxes(frustum_planes[None], transform_bounds(self.instance_bounds, data))[0]]
+        else:
+            data = model_matrices[:0]
+        self.num_instances = len(data)
+        if not self.num_instances:
+            return
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.buffer_id)
+        # (orphan the previous contents, which may still be in use by the draws of the last frame)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, 64 * self.size, None, gl.GL_STREAM_DRAW)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, data.nbytes, data)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+
+def create_instanced_vertex_array(primitive, material_name, gltf, instance_buffer):
+    """
+    Creates a vertex array object which binds the attributes of a primitive to those of the program of an
+    instanced material, and its per-instance attributes (those of the technique's :code:`attribute_divisors`,
+    which must be :code:`mat4` model matrices) to an :code:`InstanceBuffer`.
+    """
+    vao = create_primitive_vertex_array(primitive, material_name, gltf)
+    technique = gltf['techniques'][gltf['materials'][material_name]['technique']]
+    program = gltf['programs'][technique['program']]
+    gl.glBindVertexArray(vao)
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, instance_buffer.buffer_id)
+    for attribute_name, divisor in technique.get('attribute_divisors', {}).items():
+        location = program['attribute_locations'][attribute_name]
+        if location == -1:
+            continue
+        # (a mat4 attribute occupies 4 consecutive locations, one per column)
+        for column in range(4):
+            gl.glEnableVertexAttribArray(location + column)
+            gl.glVertexAttribPointer(location + column, 4, gl.GL_FLOAT, False, 64, c_void_p(16 * column))
+            gl.glVertexAttribDivisor(location + column, divisor)
+    gl.glBindVertexArray(0)
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+    return vao
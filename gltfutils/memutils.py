@@ -0,0 +1,81 @@
+"""
+Utilities for keeping the memory footprint of loading large glTF assets in check:
+memory-mapped file access and reporting of peak memory usage.
+"""
+import mmap
+import logging
+try:
+    import resource
+except ImportError:
+    resource = None # not available on Windows
+import sys
+
+
+_logger = logging.getLogger(__name__)
+
+
+def map_file(filename):
+    """
+    Memory-maps the file at the given path (read-only), returning a :code:`memoryview` of its contents.
+
+    Pages of the file are only read in as they are accessed, and since the mapping is backed by
+    the file itself, they do not count against the process's anonymous memory.
+    """
+    with open(filename, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped:
+            return memoryview(b'')
+    return memoryview(mapped)
+
+
+def peak_memory_usage():
+    """
+    Returns the peak resident set size of the current process in bytes,
+    or :code:`None` if it can not be determined on this platform.
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+def format_peak_memory_usage():
+    peak = peak_memory_usage()
+    if peak is None:
+        return 'unavailable'
+    return '%.1f MB' % (peak / 2**20)
+
+
+def prefetch(data):
+    """
+    Asks the OS to start reading in all pages of a memory-mapped :code:`memoryview`
+    (as returned by :func:`map_file`), so that they are resident by the time they are accessed.
+    Data which is not memory-mapped is left untouched.
+    """
+    mapped = getattr(data, 'obj', None)
+    if not isinstance(mapped, mmap.mmap) or len(mapped) == 0:
+        return
+    if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_WILLNEED'):
+        mapped.madvise(mmap.MADV_WILLNEED)
+    else:
+        # touch one byte of every page:
+        page = memoryview(data).cast('B')[::mmap.PAGESIZE]
+        bytes(page)
+
+
+def release_pages(mapped, start, end):
+    """
+    Advises the OS that the pages of an :code:`mmap` which lie entirely within the given byte range
+    will not be accessed again, so that they are dropped from the resident set of the process
+    (for a read-only file mapping, they are read in again from the file if they are accessed).
+    """
+    if not hasattr(mapped, 'madvise') or not hasattr(mmap, 'MADV_DONTNEED'):
+        return
+    start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+    end = min(end, len(mapped)) // mmap.PAGESIZE * mmap.PAGESIZE
+    if end > start:
+        mapped.madvise(mmap.MADV_DONTNEED, start, end - start)
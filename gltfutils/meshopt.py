@@ -0,0 +1,291 @@
+"""
+Load-time optimization of the index (and vertex) data of indexed triangle primitives, for the GPU.
+
+The triangles of each primitive are reordered for the post-transform vertex cache with the Tipsify algorithm
+("Fast Triangle Reordering for Vertex Locality and Reduced Overdraw", Sander, Nehab & Barczak 2007), which
+fans around vertices which are still in a (simulated, FIFO) cache.  The reordered triangles are then split into
+clusters (where the cache is flushed, i.e. where Tipsify restarts from a vertex it is not fanning around, or
+else where the cache efficiency of the current cluster is already good), and the clusters are sorted so that
+those which are furthest out along their normal (i.e. which tend to occlude the others) are drawn first,
+reducing overdraw.  Finally, the vertices of the primitive are renumbered in the order in which they are first
+used, so that vertex fetches are (mostly) sequential, if none of the primitive's vertex data is shared
+with other primitives (with different indices).
+
+The quality of each order is reported as its average cache miss ratio (ACMR: cache misses per triangle)
+and its average transform to vertex ratio (ATVR: cache misses per vertex, 1.0 being optimal).
+
+The optimized data is written over (a writable copy of) the data of the buffers, before it is uploaded by
+:func:`gltfutils.gltfutils.setup_buffers_v2`, so CPU-side accessor data is consistent with it.  The optimized
+triangle orders may be stored in an :code:`AssetCache`, keyed by the content of the index and position data.
+"""
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+from gltfutils.accessors import Accessor
+from gltfutils.assetcache import content_hash
+
+
+_logger = logging.getLogger(__name__)
+
+
+# the size of the (FIFO) post-transform vertex cache which is simulated:
+VERTEX_CACHE_SIZE = 16
+# a cluster is split (where Tipsify starts fanning around a new vertex) once its ACMR is below this threshold:
+CLUSTER_ACMR_THRESHOLD = 0.75
+
+
+def simulate_vertex_cache(indices, cache_size=VERTEX_CACHE_SIZE):
+    """Returns the number of misses of a FIFO vertex cache of the given size for a sequence of vertex indices."""
+    inserted = {}
+    misses = 0
+    for v in indices.tolist():
+        if misses - inserted.get(v, -cache_size) >= cache_size:
+            inserted[v] = misses
+            misses += 1
+    return misses
+
+
+def calc_acmr_atvr(indices, cache_size=VERTEX_CACHE_SIZE):
+    """Returns the ACMR and ATVR of a list of triangles (vertex indices, 3 per triangle)."""
+    indices = np.asarray(indices).ravel()
+    misses = simulate_vertex_cache(indices, cache_size=cache_size)
+    num_vertices = len(np.unique(indices))
+    return misses / max(len(indices) // 3, 1), misses / max(num_vertices, 1)
+
+
+def tipsify(triangles, num_vertices, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Reorders triangles (an array of shape :code:`(T, 3)` of vertex indices) for the vertex cache, returning
+    the order of the triangles, and an array which marks the positions in that order at which the fanning vertex
+    changed: 1 where it was chosen from the cache, 2 where Tipsify restarted elsewhere (0 elsewhere).
+    """
+    triangles = np.asarray(triangles, dtype=np.int64)
+    num_triangles = len(triangles)
+    # the triangles adjacent to each vertex (in CSR layout):
+    corners = triangles.ravel()
+    adjacency = (np.argsort(corners, kind='stable') // 3).tolist()
+    live = np.bincount(corners, minlength=num_vertices)
+    offsets = np.zeros(num_vertices + 1, dtype=np.int64)
+    np.cumsum(live, out=offsets[1:])
+    offsets = offsets.tolist()
+    live = live.tolist()
+    vertices = triangles.tolist()
+    cache_times = [-cache_size - 1] * num_vertices
+    emitted = [False] * num_triangles
+    dead_end = []
+    order = []
+    fan_starts = []
+    fan_local = []
+    time = 0
+    cursor = 0
+    fanning = int(corners[0]) if num_triangles else -1
+    local = False
+    while fanning >= 0:
+        fan_starts.append(len(order))
+        fan_local.append(local)
+        candidates = []
+        for t in adjacency[offsets[fanning]:offsets[fanning+1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = True
+            order.append(t)
+            for v in vertices[t]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if time - cache_times[v] > cache_size:
+                    cache_times[v] = time
+                    time += 1
+        # the next fanning vertex: the one of the 1-ring which will be in the cache for longest,
+        # if its remaining triangles can be emitted before it leaves the cache:
+        fanning = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if time - cache_times[v] + 2 * live[v] <= cache_size:
+                    priority = time - cache_times[v]
+                if priority > best:
+                    best = priority
+                    fanning = v
+        local = fanning >= 0
+        if fanning < 0:
+            # (dead end: restart from a recently used vertex, or else the next one which has live triangles)
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    fanning = v
+                    break
+            else:
+                while cursor < num_vertices:
+                    if live[cursor] > 0:
+                        fanning = cursor
+                        break
+                    cursor += 1
+    fan_boundaries = np.zeros(num_triangles + 1, dtype=np.int8)
+    # (1 where a fan starts from the cache, 2 where it starts elsewhere)
+    fan_boundaries[fan_starts] = np.where(fan_local, 1, 2)
+    return np.array(order, dtype=np.int64), fan_boundaries[:num_triangles]
+
+
+def find_clusters(triangles, fan_boundaries, cache_size=VERTEX_CACHE_SIZE, threshold=CLUSTER_ACMR_THRESHOLD):
+    """
+    Returns the start positions of the clusters of a list of (reordered) triangles: a cluster starts at each
+    hard boundary (:code:`fan_boundaries == 2`, see :func:`tipsify`), and at each soft boundary
+    (:code:`fan_boundaries == 1`) where the ACMR of the current cluster (drawn on its own, i.e. starting from
+    an empty cache) is below the threshold.
+    """
+    starts = [0]
+    inserted = {}
+    misses = 0
+    cluster_triangles = 0
+    for i, (boundary, vertices) in enumerate(zip(fan_boundaries.tolist(), triangles.tolist())):
+        if i and (boundary == 2 or (boundary == 1 and misses < threshold * cluster_triangles)):
+            starts.append(i)
+            inserted = {}
+            misses = cluster_triangles = 0
+        for v in vertices:
+            if misses - inserted.get(v, -cache_size) >= cache_size:
+                inserted[v] = misses
+                misses += 1
+        cluster_triangles += 1
+    return np.array(starts, dtype=np.int64)
+
+
+def sort_clusters(triangles, starts, positions):
+    """
+    Returns the order of the triangles of the clusters (starting at the given positions in the list of triangles),
+    sorted in decreasing order of the offset of their centroid from the centroid of the mesh along their
+    (area-weighted) average normal, so that outward-facing clusters on the outside are drawn first.
+    """
+    corners = positions[triangles]
+    cross = np.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0])
+    areas = 0.5 * np.linalg.norm(cross, axis=1)
+    centroids = corners.mean(axis=1)
+    mesh_centroid = (centroids * areas[:,None]).sum(axis=0) / max(areas.sum(), 1e-30)
+    cluster_normals = np.add.reduceat(cross, starts, axis=0)
+    cluster_areas = np.add.reduceat(areas, starts)
+    cluster_centroids = np.add.reduceat(centroids * areas[:,None], starts, axis=0) / \
+                        np.maximum(cluster_areas, 1e-30)[:,None]
+    cluster_normals /= np.maximum(np.linalg.norm(cluster_normals, axis=1), 1e-30)[:,None]
+    keys = ((cluster_centroids - mesh_centroid) * cluster_normals).sum(axis=1)
+    cluster_order = np.argsort(-keys, kind='stable')
+    ends = np.append(starts[1:], len(triangles))
+    return np.concatenate([np.arange(starts[c], ends[c]) for c in cluster_order])
+
+
+def optimize_triangles(triangles, positions, cache_size=VERTEX_CACHE_SIZE, threshold=CLUSTER_ACMR_THRESHOLD):
+    """
+    Returns the triangles (an array of shape :code:`(T, 3)` of vertex indices) reordered for the vertex cache,
+    with their clusters sorted to reduce overdraw, given the positions of the vertices.
+    """
+    order, fan_boundaries = tipsify(triangles, len(positions), cache_size=cache_size)
+    triangles = triangles[order]
+    starts = find_clusters(triangles, fan_boundaries, cache_size=cache_size, threshold=threshold)
+    return triangles[sort_clusters(triangles, starts, positions)]
+
+
+def calc_fetch_order(indices, num_vertices):
+    """
+    Returns the order of the vertices in which they are first used by the (flat) array of indices
+    (followed by any unused vertices), i.e. the old vertex index of each new vertex.
+    """
+    first_uses = np.full(num_vertices, len(indices), dtype=np.int64)
+    np.minimum.at(first_uses, indices, np.arange(len(indices)))
+    return np.argsort(first_uses, kind='stable')
+
+
+def _get_writable_array(gltf, accessor_name, uri_path=None):
+    # returns a writable view of the data of an accessor, copying the data of its buffer if it is read-only
+    # (e.g. memory-mapped):
+    Accessor(gltf, accessor_name, uri_path=uri_path).array
+    accessor = gltf['accessors'][accessor_name]
+    buffer = gltf['buffers'][gltf['bufferViews'][accessor['bufferView']]['buffer']]
+    if memoryview(buffer['data']).readonly:
+        buffer['data'] = memoryview(bytearray(buffer['data']))
+    return Accessor(gltf, accessor_name).array
+
+
+def optimize_mesh_indices(gltf, uri_path=None, cache=None, cache_size=VERTEX_CACHE_SIZE):
+    """
+    Optimizes the indices (and, where possible, the order of the vertices) of all indexed triangle primitives
+    of the gltf dict in place, in the data of its buffers (which must have been loaded), and logs the
+    ACMR / ATVR before and after.
+
+    :param cache: optional :code:`AssetCache` in which the optimized triangle orders are stored
+    """
+    meshes = gltf.get('meshes', [])
+    accessors = gltf['accessors']
+    # the primitives which use each index accessor, and the index accessors which use each vertex accessor
+    # (None for primitives without indices, whose vertices must then never be renumbered):
+    index_users = {}
+    vertex_users = {}
+    for mesh in (meshes.values() if isinstance(meshes, dict) else meshes):
+        for primitive in mesh['primitives']:
+            vertex_accessors = list(primitive.get('attributes', {}).values()) + \
+                               [name for target in primitive.get('targets', []) for name in target.values()]
+            index_name = primitive.get('indices')
+            for name in vertex_accessors:
+                vertex_users.setdefault(name, set()).add(index_name)
+            if index_name is not None:
+                index_users.setdefault(index_name, []).append(primitive)
+    totals = np.zeros(5)
+    num_optimized = num_reordered = 0
+    for index_name, primitives in index_users.items():
+        primitive = primitives[0]
+        index_accessor = accessors[index_name]
+        if any(p.get('mode', gl.GL_TRIANGLES) != gl.GL_TRIANGLES or p.get('attributes', {}).get('POSITION') is None
+               for p in primitives) or 'sparse' in index_accessor or 'bufferView' not in index_accessor \
+           or index_accessor['count'] < 3:
+            continue
+        positions = Accessor(gltf, primitive['attributes']['POSITION'], uri_path=uri_path)
+        if positions.is_sparse or positions.type != 'VEC3':
+            continue
+        positions = positions.array.astype(np.float64)
+        indices = Accessor(gltf, index_name, uri_path=uri_path).array
+        num_triangles = len(indices) // 3
+        triangles = indices[:num_triangles*3].reshape(-1, 3).astype(np.int64)
+        if triangles.max() >= len(positions):
+            _logger.warning('indices %s reference vertices past the end of their POSITION data, not optimizing them',
+                            index_name)
+            continue
+        key = None
+        cached = None
+        if cache is not None:
+            key = content_hash(triangles.astype(np.uint32).tobytes() + positions.astype(np.float32).tobytes() +
+                               ('tipsify:%d:%g' % (cache_size, CLUSTER_ACMR_THRESHOLD)).encode())
+            cached = cache.get_optimized_indices(key)
+        if cached is not None and len(cached[0]) == num_triangles * 3:
+            optimized, stats = cached
+            optimized = optimized.reshape(-1, 3).astype(np.int64)
+        else:
+            optimized = optimize_triangles(triangles, positions, cache_size=cache_size)
+            stats = calc_acmr_atvr(triangles, cache_size) + calc_acmr_atvr(optimized, cache_size)
+            if cache is not None:
+                cache.put_optimized_indices(key, optimized.astype(np.uint32).ravel(), stats)
+        # renumber the vertices if none of them are shared with primitives which have different indices:
+        vertex_accessors = {name for p in primitives for name in p['attributes'].values()} | \
+                           {name for p in primitives for target in p.get('targets', []) for name in target.values()}
+        if all(vertex_users[name] == {index_name} and 'sparse' not in accessors[name] and
+               'bufferView' in accessors[name] and accessors[name]['count'] == len(positions)
+               for name in vertex_accessors):
+            fetch_order = calc_fetch_order(optimized.ravel(), len(positions))
+            new_indices = np.empty_like(fetch_order)
+            new_indices[fetch_order] = np.arange(len(fetch_order))
+            optimized = new_indices[optimized]
+            for name in vertex_accessors:
+                array = _get_writable_array(gltf, name, uri_path=uri_path)
+                array[...] = array[fetch_order]
+            num_reordered += 1
+        _get_writable_array(gltf, index_name, uri_path=uri_path)[:num_triangles*3] = optimized.ravel()
+        _logger.debug('optimized indices %s (%d triangles): ACMR %.3f -> %.3f, ATVR %.3f -> %.3f',
+                      index_name, num_triangles, *stats)
+        totals += (num_triangles,) + tuple(num_triangles * np.array(stats))
+        num_optimized += 1
+    if totals[0]:
+        acmr_before, atvr_before, acmr_after, atvr_after = totals[1:] / totals[0]
+        _logger.info('optimized the indices of %d primitives (%d triangles, %d with reordered vertices): '
+                     'ACMR %.3f -> %.3f, ATVR %.3f -> %.3f (triangle-weighted averages)', num_optimized,
+                     totals[0], num_reordered, acmr_before, acmr_after, atvr_before, atvr_after)
@@ -0,0 +1,236 @@
+"""
+Hardware occlusion culling with asynchronous occlusion queries.
+
+Each frame, the (world-space) bounding boxes of the nodes which are inside the view frustum are rendered
+as proxies (without writing color or depth) after the nodes which were visible in the previous frame,
+each inside a :code:`GL_ANY_SAMPLES_PASSED` query.  Query results are only read once they are available
+(they are never waited for), so a node's occlusion is determined by the last query of it which has
+completed, typically that of the previous frame.  The draws of nodes which are occluded are then either
+skipped, or rendered conditionally on the result of the node's query (:code:`glBeginConditionalRender`,
+without waiting), so that they appear as soon as they are no longer occluded.
+
+Visible nodes are only queried every few frames (staggered, so that their queries are spread evenly over
+frames), and nodes which were occluded are queried every frame, in groups which share a single query
+and proxy draw (as in "CHC++: Coherent Hierarchical Culling Revisited", Mattausch et al.): while the
+group remains occluded, so do all of its nodes, otherwise they are all considered visible (and are
+queried individually from then on).
+
+As elsewhere in gltfutils, matrices are stored transposed (i.e. they transform row vectors).
+"""
+import ctypes
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+# (the query loops call the raw entry points, which skip PyOpenGL's argument conversion)
+from OpenGL.raw.GL.VERSION import GL_1_5 as _gl_1_5, GL_3_2 as _gl_3_2
+
+from gltfutils.gltfutils import compile_shader
+
+
+_logger = logging.getLogger(__name__)
+
+
+OCCLUSION_SKIP = 'skip'
+OCCLUSION_CONDITIONAL = 'conditional'
+OCCLUSION_MODES = (OCCLUSION_SKIP, OCCLUSION_CONDITIONAL)
+
+# the expansion of the proxy boxes, relative to their size:
+BOX_EXPANSION = 1e-3
+# the maximum number of occluded nodes which are queried together:
+MAX_GROUP_SIZE = 16
+
+
+_PROXY_VERT_SRC = '''#version 130
+uniform mat4 u_ViewProjectionMatrix;
+in vec3 a_Position;
+void main() {
+  gl_Position = u_ViewProjectionMatrix * vec4(a_Position, 1.0);
+}
+'''
+_PROXY_FRAG_SRC = '''#version 130
+void main() {
+  gl_FragColor = vec4(1.0);
+}
+'''
+
+# the corners of the unit cube (as indices into the min / max of a box), and its (12) triangles:
+_CUBE_VERTICES = np.array([[(i >> axis) & 1 for axis in range(3)] for i in range(8)])
+_CUBE_INDICES = np.array([0, 2, 1, 1, 2, 3,   4, 5, 6, 5, 7, 6,
+                          0, 1, 4, 1, 5, 4,   2, 6, 3, 3, 6, 7,
+                          0, 4, 2, 2, 4, 6,   1, 3, 5, 3, 7, 5], dtype=np.uint16)
+# (the triangles of MAX_GROUP_SIZE consecutive cubes)
+_GROUP_INDICES = (_CUBE_INDICES + 8 * np.arange(MAX_GROUP_SIZE, dtype=np.uint16)[:,None]).ravel()
+
+
+class OcclusionCuller(object):
+    """
+    The occlusion queries of the nodes of a draw list, for one or more views (e.g. both eyes of a VR headset).
+
+    :param num_nodes: number of nodes
+    :param mode: :code:`OCCLUSION_SKIP` (the draws of occluded nodes are skipped) or
+                 :code:`OCCLUSION_CONDITIONAL` (they are rendered conditionally on the results of their queries)
+    :param num_views: number of views
+    :param visible_query_interval: number of frames between the queries of nodes which are visible
+    """
+    def __init__(self, num_nodes, mode=OCCLUSION_CONDITIONAL, num_views=1, visible_query_interval=4):
+        if mode not in OCCLUSION_MODES:
+            raise Exception('unknown occlusion culling mode: %s' % mode)
+        self.mode = mode
+        self.num_nodes = num_nodes
+        self.visible_query_interval = visible_query_interval
+        self.frame_numbers = [0] * num_views
+        self._query_phases = np.arange(num_nodes) % visible_query_interval
+        self._result = (ctypes.c_uint * 1)()
+        self._null = ctypes.c_void_p(0)
+        self.occluded = np.zeros((num_views, num_nodes), dtype=bool)
+        # whether each node has a query whose result has not been read:
+        self.pending = np.zeros((num_views, num_nodes), dtype=bool)
+        # the query object of each node (which also serves for the groups that it is the first node of):
+        self.queries = []
+        # the query object of the last query of each node (i.e. of it, or of its group):
+        self.node_queries = []
+        for _ in range(num_views):
+            queries = np.asarray(gl.glGenQueries(num_nodes), dtype=np.uint32).reshape(-1).tolist() if num_nodes else []
+            self.queries.append(queries)
+            self.node_queries.append(list(queries))
+        # (the pending queries of each view, and the nodes of each, in the order they were issued)
+        self._issued = [[] for _ in range(num_views)]
+        self._setup_proxy()
+
+    def _setup_proxy(self):
+        vertex_shader_id = compile_shader('occlusion proxy vertex shader', gl.GL_VERTEX_SHADER, _PROXY_VERT_SRC)
+        fragment_shader_id = compile_shader('occlusion proxy fragment shader', gl.GL_FRAGMENT_SHADER, _PROXY_FRAG_SRC)
+        program_id = gl.glCreateProgram()
+        gl.glAttachShader(program_id, vertex_shader_id)
+        gl.glAttachShader(program_id, fragment_shader_id)
+        gl.glBindAttribLocation(program_id, 0, 'a_Position')
+        gl.glLinkProgram(program_id)
+        gl.glDetachShader(program_id, vertex_shader_id)
+        gl.glDetachShader(program_id, fragment_shader_id)
+        gl.glDeleteShader(vertex_shader_id)
+        gl.glDeleteShader(fragment_shader_id)
+        if not gl.glGetProgramiv(program_id, gl.GL_LINK_STATUS):
+            raise Exception('failed to link occlusion proxy program')
+        self.program_id = program_id
+        self.view_projection_location = gl.glGetUniformLocation(program_id, 'u_ViewProjectionMatrix')
+        # (the corners of the proxies of each frame are written to a single buffer, and the proxy of
+        # each node is drawn with a base vertex)
+        self.vao = gl.glGenVertexArrays(1)
+        gl.glBindVertexArray(self.vao)
+        self.vertex_buffer_id, index_buffer_id = gl.glGenBuffers(2)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vertex_buffer_id)
+        gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, False, 0, None)
+        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, index_buffer_id)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, _GROUP_INDICES.nbytes, _GROUP_INDICES, gl.GL_STATIC_DRAW)
+        gl.glBindVertexArray(0)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+    def collect(self, view=0):
+        """
+        Reads the results of the pending queries of a view which are available (without waiting),
+        updating :attr:`occluded`.
+        """
+        issued = self._issued[view]
+        occluded = self.occluded[view]
+        pending = self.pending[view]
+        glGetQueryObjectuiv = _gl_1_5.glGetQueryObjectuiv
+        result = self._result
+        num_collected = 0
+        # (queries complete in the order they were issued, so stop at the first which is not available)
+        for query, node_slots in issued:
+            glGetQueryObjectuiv(query, gl.GL_QUERY_RESULT_AVAILABLE, result)
+            if not result[0]:
+                break
+            glGetQueryObjectuiv(query, gl.GL_QUERY_RESULT, result)
+            occluded[node_slots] = not result[0]
+            pending[node_slots] = False
+            num_collected += 1
+        del issued[:num_collected]
+
+    def issue(self, node_slots, world_bounds, projection_matrix, view_matrix, view=0):
+        """
+        Renders the bounding box proxies of the given nodes within queries, given the world-space bounds of
+        all nodes (an array of shape :code:`(N, 2, 3)`).  Nodes with pending queries, and visible nodes which
+        are not due to be queried in this frame, are skipped.
+        Nodes whose (slightly expanded) bounds contain the camera are not queried, and are not occluded.
+        """
+        frame_number = self.frame_numbers[view]
+        self.frame_numbers[view] += 1
+        occluded = self.occluded[view]
+        node_slots = np.asarray(node_slots, dtype=np.int64)
+        node_slots = node_slots[~self.pending[view, node_slots] &
+                                (occluded[node_slots] |
+                                 (self._query_phases[node_slots] == frame_number % self.visible_query_interval))]
+        # (expand the boxes by the distance from the camera to the corners of the near plane)
+        inverse_projection_matrix = np.linalg.inv(projection_matrix.astype(np.float64))
+        near_corner = np.array([1.0, 1.0, -1.0, 1.0]).dot(inverse_projection_matrix)
+        margin = np.linalg.norm(near_corner[:3] / near_corner[3])
+        camera_position = np.linalg.inv(view_matrix.astype(np.float64))[3,:3]
+        bounds = world_bounds[node_slots]
+        contains_camera = ((bounds[:,0] - margin <= camera_position) &
+                           (bounds[:,1] + margin >= camera_position)).all(axis=1)
+        occluded[node_slots[contains_camera]] = False
+        node_slots = node_slots[~contains_camera]
+        if not len(node_slots):
+            return
+        # (the visible nodes are queried individually, followed by the groups of occluded nodes)
+        was_occluded = occluded[node_slots]
+        node_slots = np.concatenate([node_slots[~was_occluded], node_slots[was_occluded]])
+        num_visible = len(node_slots) - int(was_occluded.sum())
+        groups = [(i, min(i + MAX_GROUP_SIZE, len(node_slots)))
+                  for i in range(num_visible, len(node_slots), MAX_GROUP_SIZE)]
+        # (the proxies are slightly expanded, and pass the depth test where they coincide with rendered
+        # geometry, so that nodes are not occluded by themselves)
+        bounds = world_bounds[node_slots]
+        extents = BOX_EXPANSION * (bounds[:,1] - bounds[:,0]).max(axis=1)[:,None]
+        bounds = np.stack([bounds[:,0] - extents, bounds[:,1] + extents], axis=1)
+        corners = np.ascontiguousarray(bounds[:, _CUBE_VERTICES, [0, 1, 2]], dtype=np.float32)
+        view_projection_matrix = view_matrix.dot(projection_matrix).astype(np.float32)
+        cull_face_enabled = gl.glIsEnabled(gl.GL_CULL_FACE)
+        depth_test_enabled = gl.glIsEnabled(gl.GL_DEPTH_TEST)
+        depth_func = gl.glGetIntegerv(gl.GL_DEPTH_FUNC)
+        gl.glDisable(gl.GL_CULL_FACE)
+        gl.glEnable(gl.GL_DEPTH_TEST)
+        gl.glDepthFunc(gl.GL_LEQUAL)
+        gl.glColorMask(False, False, False, False)
+        gl.glDepthMask(False)
+        gl.glUseProgram(self.program_id)
+        gl.glUniformMatrix4fv(self.view_projection_location, 1, False, view_projection_matrix)
+        gl.glBindVertexArray(self.vao)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.vertex_buffer_id)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, corners.nbytes, corners, gl.GL_STREAM_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+        queries = self.queries[view]
+        node_queries = self.node_queries[view]
+        issued = self._issued[view]
+        glBeginQuery, glEndQuery = _gl_1_5.glBeginQuery, _gl_1_5.glEndQuery
+        glDrawElementsBaseVertex = _gl_3_2.glDrawElementsBaseVertex
+        num_indices, null = len(_CUBE_INDICES), self._null
+        slots = node_slots.tolist()
+        for i, node_slot in enumerate(slots[:num_visible]):
+            query = queries[node_slot]
+            glBeginQuery(gl.GL_ANY_SAMPLES_PASSED, query)
+            glDrawElementsBaseVertex(gl.GL_TRIANGLES, num_indices, gl.GL_UNSIGNED_SHORT, null, 8*i)
+            glEndQuery(gl.GL_ANY_SAMPLES_PASSED)
+            node_queries[node_slot] = query
+            issued.append((query, node_slot))
+        for start, end in groups:
+            query = queries[slots[start]]
+            glBeginQuery(gl.GL_ANY_SAMPLES_PASSED, query)
+            glDrawElementsBaseVertex(gl.GL_TRIANGLES, num_indices * (end - start), gl.GL_UNSIGNED_SHORT, null, 8*start)
+            glEndQuery(gl.GL_ANY_SAMPLES_PASSED)
+            group_slots = slots[start:end]
+            for node_slot in group_slots:
+                node_queries[node_slot] = query
+            issued.append((query, group_slots))
+        gl.glBindVertexArray(0)
+        gl.glColorMask(True, True, True, True)
+        gl.glDepthMask(True)
+        gl.glDepthFunc(depth_func)
+        if cull_face_enabled:
+            gl.glEnable(gl.GL_CULL_FACE)
+        if not depth_test_enabled:
+            gl.glDisable(gl.GL_DEPTH_TEST)
+        self.pending[view, node_slots] = True
@@ -45,7 +45,7 @@ class OpenVRRenderer(object):
         self._poll_tracked_device_frequency = poll_tracked_device_frequency
         self._frames_rendered = 0
         self._pulse_t0 = 0.0
-    def render(self, gltf, nodes, window_size=(800, 600)):
+    def render(self, draw_list, window_size=(800, 600)):
         self.vr_compositor.waitGetPoses(self._poses, openvr.k_unMaxTrackedDeviceCount, None, 0)
         hmd_pose = self._poses[openvr.k_unTrackedDeviceIndex_Hmd]
         if not hmd_pose.bPoseIsValid:
@@ -63,16 +63,15 @@ class OpenVRRenderer(object):
                 poses.append(pose_34)
         view.dot(self.eye_transforms[0], out=self.view_matrices[0])
         view.dot(self.eye_transforms[1], out=self.view_matrices[1])
+        # compute the matrices of all nodes for both eyes at once:
+        draw_list.prepare(self.projection_matrices, self.view_matrices)
         for eye in (0, 1):
             gl.glViewport(0, 0, self.vr_framebuffers[eye].width, self.vr_framebuffers[eye].height)
             gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.vr_framebuffers[eye].fb)
             gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
             gltfu.set_material_state.current_material = None
             gltfu.set_technique_state.current_technique = None
-            for node in nodes:
-                gltfu.draw_node(node, gltf,
-                                projection_matrix=self.projection_matrices[eye],
-                                view_matrix=self.view_matrices[eye])
+            draw_list.draw(eye=eye)
             self.controllers.display_gl(self.view_matrices[eye], self.projection_matrices[eye])
         # self.vr_compositor.submit(openvr.Eye_Left, self.vr_framebuffers[0].texture)
         # self.vr_compositor.submit(openvr.Eye_Right, self.vr_framebuffers[1].texture)
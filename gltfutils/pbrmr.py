@@ -89,6 +89,11 @@ _GLTF_UNIF_TO_DEFINE = {_GLSL_UNIF_TO_GLTF_UNIF[glsl_unif]: define
                         for glsl_unif, define in _GLSL_UNIF_TO_DEFINE.items()}
 
 _REQUIRED_GLSL_UNIFS = _REQUIRED_GLSL_VERT_UNIFS + _REQUIRED_GLSL_FRAG_UNIFS
+# the instanced variants read the model matrix from a per-instance attribute, and the view matrix from a uniform:
+_INSTANCED_GLSL_ATTRS = ['a_ModelMatrix']
+_INSTANCED_GLSL_ATTR_DIVISORS = {'a_ModelMatrix': 1}
+_REQUIRED_INSTANCED_GLSL_UNIFS = [glsl_unif if glsl_unif != 'u_ModelViewMatrix' else 'u_ViewMatrix'
+                                  for glsl_unif in _REQUIRED_GLSL_UNIFS]
 _ALL_GLTF_UNIFS = [_GLSL_UNIF_TO_GLTF_UNIF[glsl_unif]
                    for glsl_unif in _REQUIRED_GLSL_UNIFS] + list(_GLTF_UNIF_TO_DEFINE.keys())
 
@@ -143,7 +148,17 @@ _GLSL_UNIF_PARAMS = {
 }
 
 
-def setup_pbrmr_programs(gltf):
+def setup_pbrmr_programs(gltf, use_ubo=False, instancing=False):
+    """
+    Defines GLTF 1.0 techniques, materials, programs and shaders which implement the PBRMR materials of a GLTF 2.0 gltf dict.
+
+    :param use_ubo: if True, the shaders are compiled with the :code:`USE_UBO` define, which declares the per-frame
+                    and material uniforms in uniform blocks (see :mod:`gltfutils.uniformbuffers`)
+    :param instancing: if True, an instanced variant (compiled with the :code:`USE_INSTANCING` define, which reads the
+                       model matrix from the per-instance attribute :code:`a_ModelMatrix`) of each technique and material
+                       is also defined, the index of the instanced variant of each material is stored as its
+                       :code:`instanced_material` (see :mod:`gltfutils.instancing`)
+    """
     with open(_VERT_SHADER_SRC_PATH) as f:
         vert_src = f.read()
     with open(_FRAG_SHADER_SRC_PATH) as f:
@@ -231,6 +246,31 @@ def setup_pbrmr_programs(gltf):
 ''',
                                   json.dumps(technique_material, indent=2, sort_keys=True))
                 primitive['material'] = technique_and_material_to_technique_material[material_key]
+    program_defines = [(defines, i_technique) for defines, i_technique in defines_to_technique.items()]
+    if instancing:
+        instanced_techniques = {}
+        for defines, i_technique in list(program_defines):
+            technique = techniques[i_technique]
+            uniforms = {glsl_unif: gltf_unif for glsl_unif, gltf_unif in technique['uniforms'].items()
+                        if glsl_unif != 'u_ModelViewMatrix'}
+            uniforms['u_ViewMatrix'] = _GLSL_UNIF_TO_GLTF_UNIF['u_ViewMatrix']
+            parameters = {name: parameter for name, parameter in technique['parameters'].items()
+                          if name != _GLSL_UNIF_TO_GLTF_UNIF['u_ModelViewMatrix']}
+            parameters[uniforms['u_ViewMatrix']] = _GLSL_UNIF_PARAMS['u_ViewMatrix']
+            instanced_techniques[i_technique] = len(techniques)
+            techniques.append({
+                "states": technique['states'],
+                "attributes": technique['attributes'],
+                "uniforms": uniforms,
+                "parameters": parameters,
+                "attribute_divisors": dict(_INSTANCED_GLSL_ATTR_DIVISORS)
+            })
+            program_defines.append((defines + ('USE_INSTANCING',), instanced_techniques[i_technique]))
+        for material in list(technique_materials):
+            material['instanced_material'] = len(technique_materials)
+            technique_materials.append({'name': material['name'] + ' (instanced)',
+                                        'values': material['values'],
+                                        'technique': instanced_techniques[material['technique']]})
     gltf['techniques'] = techniques
     gltf['materials'] = technique_materials
     _logger.debug('number of techniques defined = %d, number of materials defined = %d',
@@ -238,7 +278,9 @@ def setup_pbrmr_programs(gltf):
 
     gltf['programs'] = {}
     gltf['shaders'] = {}
-    for i_program, (defines, i_technique) in enumerate(defines_to_technique.items()):
+    for i_program, (defines, i_technique) in enumerate(program_defines):
+        if use_ubo:
+            defines = defines + ('USE_UBO',)
         v_src = '\n'.join(['#version 130'] + ['#define %s 1' % define for define in defines] + [vert_src])
         f_src = '\n'.join(['#version 130'] + ['#define %s 1' % define for define in defines] + [frag_src])
         vert_shader_index = 'technique-%d-vert' % i_technique
@@ -249,8 +291,13 @@ def setup_pbrmr_programs(gltf):
                                               'type': gl.GL_FRAGMENT_SHADER}
         attributes = _REQUIRED_GLSL_ATTRS + [_DEFINE_TO_GLSL_ATTR[define]
                                              for define in defines if define in _DEFINE_TO_GLSL_ATTR]
-        uniforms = _REQUIRED_GLSL_UNIFS + [glsl_unif for define in defines if define in _DEFINE_TO_GLSL_UNIFS
-                                           for glsl_unif in _DEFINE_TO_GLSL_UNIFS[define]]
+        uniforms = [glsl_unif for define in defines if define in _DEFINE_TO_GLSL_UNIFS
+                    for glsl_unif in _DEFINE_TO_GLSL_UNIFS[define]]
+        if 'USE_INSTANCING' in defines:
+            attributes += _INSTANCED_GLSL_ATTRS
+            uniforms = _REQUIRED_INSTANCED_GLSL_UNIFS + uniforms
+        else:
+            uniforms = _REQUIRED_GLSL_UNIFS + uniforms
         program = {'vertexShader': vert_shader_index,
                    'fragmentShader': frag_shader_index,
                    'attributes': attributes,
@@ -0,0 +1,224 @@
+"""
+Ray picking of the triangles of the meshes of a scene.
+
+Rays are first cast against the BVH of the world-space bounds of the nodes of a draw list
+(see :meth:`gltfutils.drawlist.DrawList.get_bvh`), then (in the local space of each node which
+they may hit, nearest first) against a BVH of the triangles of the node's meshes.  The triangle BVH
+of each mesh is built from its POSITION / indices accessor data when it is first needed, and cached.
+
+As elsewhere in gltfutils, matrices are stored transposed (i.e. they transform row vectors).
+"""
+from collections import namedtuple
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+import gltfutils.gltfutils as gltfu
+from gltfutils.accessors import get_accessor_array
+from gltfutils.bvh import BVH
+
+
+_logger = logging.getLogger(__name__)
+
+
+PickResult = namedtuple('PickResult', ['node', 'mesh', 'primitive', 'triangle', 'barycentrics', 'distance', 'point',
+                                       'instance'])
+PickResult.__doc__ = """
+The nearest intersection of a ray with the triangles of a scene: the id (GLTF 1.0) or index (GLTF 2.0) of the
+node and mesh, the index of the primitive (within the mesh) and triangle (within the primitive), the
+barycentric coordinates of the intersection within the triangle, its distance (along the ray, in world
+units) and position (in world space), and the index of the instance of the node, if it uses
+:code:`EXT_mesh_gpu_instancing` (else :code:`None`).
+"""
+
+
+def triangulate(indices, mode=gl.GL_TRIANGLES):
+    """
+    Returns the array of shape :code:`(M, 3)` of the vertex indices of the triangles of a primitive,
+    given its (flat) array of indices and its mode (triangles, triangle strip or triangle fan).
+    """
+    indices = np.asarray(indices).ravel()
+    if mode == gl.GL_TRIANGLES:
+        return indices[:len(indices) // 3 * 3].reshape(-1, 3)
+    num_triangles = max(len(indices) - 2, 0)
+    if mode == gl.GL_TRIANGLE_STRIP:
+        return np.stack([indices[:num_triangles], indices[1:num_triangles+1], indices[2:num_triangles+2]], axis=1)
+    if mode == gl.GL_TRIANGLE_FAN:
+        return np.stack([np.repeat(indices[:1], num_triangles), indices[1:num_triangles+1],
+                         indices[2:num_triangles+2]], axis=1)
+    raise Exception('unhandled primitive mode for triangulation: %s' % mode)
+
+
+def intersect_triangles(origin, direction, vertices):
+    """
+    Intersects a ray with triangles (an array of shape :code:`(M, 3, 3)` of their vertices), from both sides.
+    Returns the array of the distances (in units of the length of :code:`direction`) of the intersections
+    (:code:`inf` for triangles which the ray does not intersect), and the array of shape :code:`(M, 3)`
+    of their barycentric coordinates.
+    """
+    v0 = vertices[:,0]
+    edges1 = vertices[:,1] - v0
+    edges2 = vertices[:,2] - v0
+    p = np.cross(direction, edges2)
+    determinants = (edges1 * p).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_determinants = 1.0 / determinants
+        t = origin - v0
+        u = (t * p).sum(axis=1) * inv_determinants
+        q = np.cross(t, edges1)
+        v = (q * direction).sum(axis=1) * inv_determinants
+        distances = (q * edges2).sum(axis=1) * inv_determinants
+        hit = (determinants != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (distances >= 0)
+    return np.where(hit, distances, np.inf), np.stack([1 - u - v, u, v], axis=1)
+
+
+def _intersect_boxes(origins, directions, bounds):
+    # (slab test of rays against a box, returning the distance along each ray at which it enters the box,
+    # or inf if it misses it)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t0 = (bounds[0] - origins) / directions
+        t1 = (bounds[1] - origins) / directions
+    t0, t1 = np.fmin(t0, t1), np.fmax(t0, t1)
+    t_enter = np.maximum(t0.max(axis=1), 0.0)
+    t_exit = t1.min(axis=1)
+    return np.where(t_enter <= t_exit, t_enter, np.inf)
+
+
+class MeshTriangles(object):
+    """
+    The triangles of all (triangle-based) primitives of a mesh, and a BVH of their bounds.
+
+    :param gltf: the gltf dict
+    :param mesh_name: id (GLTF 1.0) or index (GLTF 2.0) of the mesh
+    :param uri_path: path used to resolve the URIs of buffers which have not been loaded
+    """
+    def __init__(self, gltf, mesh_name, uri_path=None):
+        vertices = []
+        primitives = []
+        triangles = []
+        for i_primitive, primitive in enumerate(gltf['meshes'][mesh_name]['primitives']):
+            mode = primitive.get('mode', gl.GL_TRIANGLES)
+            if mode not in (gl.GL_TRIANGLES, gl.GL_TRIANGLE_STRIP, gl.GL_TRIANGLE_FAN):
+                continue
+            if 'POSITION' not in primitive.get('attributes', {}):
+                continue
+            positions = get_accessor_array(gltf, primitive['attributes']['POSITION'],
+                                           uri_path=uri_path, normalize=True)
+            positions = positions.reshape(len(positions), -1)[:,:3]
+            if 'indices' in primitive:
+                indices = get_accessor_array(gltf, primitive['indices'], uri_path=uri_path)
+            else:
+                indices = np.arange(len(positions))
+            primitive_triangles = triangulate(indices, mode)
+            vertices.append(positions[primitive_triangles].astype(np.float64))
+            primitives.append(np.full(len(primitive_triangles), i_primitive, dtype=np.int64))
+            triangles.append(np.arange(len(primitive_triangles)))
+        self.vertices = np.concatenate(vertices) if vertices else np.zeros((0, 3, 3))
+        self.primitives = np.concatenate(primitives) if primitives else np.zeros(0, dtype=np.int64)
+        self.triangles = np.concatenate(triangles) if triangles else np.zeros(0, dtype=np.int64)
+        bounds = np.stack([self.vertices.min(axis=1), self.vertices.max(axis=1)], axis=1)
+        self.bvh = BVH(bounds, max_leaf_size=8, sah=False)
+        _logger.debug('built triangle BVH of mesh %s: %d triangles', mesh_name, len(self.vertices))
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def raycast(self, origin, direction, max_distance=np.inf):
+        """
+        Returns :code:`(distance, index, barycentrics)` of the nearest intersection of a ray (in the
+        local space of the mesh) with the triangles, or :code:`None` if there is none.
+        """
+        vertices = self.vertices
+        def intersect_items(items):
+            return intersect_triangles(origin, direction, vertices[items])
+        return self.bvh.raycast(origin, direction, intersect_items, max_distance=max_distance)
+
+
+class Picker(object):
+    """
+    :param draw_list: the :code:`DrawList` of the scene whose nodes are picked
+    :param uri_path: path used to resolve the URIs of buffers which have not been loaded
+    """
+    def __init__(self, draw_list, uri_path=None):
+        self.draw_list = draw_list
+        self.gltf = draw_list.gltf
+        self.uri_path = uri_path
+        self._mesh_triangles = {}
+
+    def get_mesh_triangles(self, mesh_name):
+        """Returns the (cached) :code:`MeshTriangles` of a mesh."""
+        if mesh_name not in self._mesh_triangles:
+            self._mesh_triangles[mesh_name] = MeshTriangles(self.gltf, mesh_name, uri_path=self.uri_path)
+        return self._mesh_triangles[mesh_name]
+
+    def pick(self, ray_origin, ray_dir):
+        """
+        Returns the :code:`PickResult` of the nearest intersection of a ray (in world space)
+        with the triangles of the scene, or :code:`None` if the ray does not hit any.
+        """
+        ray_origin = np.asarray(ray_origin, dtype=np.float64).reshape(3)
+        ray_dir = np.asarray(ray_dir, dtype=np.float64).reshape(3)
+        draw_list = self.draw_list
+        bvh = draw_list.get_bvh()
+        node_slots = draw_list.bvh_node_slots
+        def intersect_nodes(items):
+            distances = np.full(len(items), np.inf)
+            hits = [None] * len(items)
+            for j, item in enumerate(items.tolist()):
+                node_slot = node_slots[item]
+                node = draw_list.nodes[node_slot]
+                model_matrix = gltfu.get_model_matrix(node, self.gltf).astype(np.float64)
+                instance_matrices = draw_list.instance_matrices.get(node_slot)
+                if instance_matrices is None:
+                    matrices = model_matrix[None]
+                    candidates = [(0.0, None)]
+                else:
+                    # (the instances of a node which uses EXT_mesh_gpu_instancing are each tested in their local
+                    # space, nearest first, those whose (local) mesh bounds the ray misses being skipped)
+                    matrices = np.matmul(instance_matrices.astype(np.float64), model_matrix)
+                # (the ray in the local space of the node / instances, distances along it are the same as in world space)
+                inverse_matrices = np.linalg.inv(matrices)
+                origins = np.append(ray_origin, 1.0).dot(inverse_matrices)[:,:3]
+                directions = np.einsum('i,nij->nj', ray_dir, inverse_matrices[:,:3,:3])
+                if instance_matrices is not None:
+                    entry_distances = _intersect_boxes(origins, directions, draw_list.mesh_bounds[node_slot])
+                    instances = np.flatnonzero(entry_distances < np.inf)
+                    instances = instances[np.argsort(entry_distances[instances], kind='stable')]
+                    candidates = zip(entry_distances[instances].tolist(), instances.tolist())
+                for entry_distance, instance in candidates:
+                    if entry_distance >= distances[j]:
+                        break
+                    k = 0 if instance is None else instance
+                    for mesh_name in node.get('meshes', [node['mesh']] if 'mesh' in node else []):
+                        mesh_triangles = self.get_mesh_triangles(mesh_name)
+                        hit = mesh_triangles.raycast(origins[k], directions[k], max_distance=distances[j])
+                        if hit is not None:
+                            distances[j], index, barycentrics = hit
+                            hits[j] = (draw_list.node_names[node_slot], mesh_name,
+                                       int(mesh_triangles.primitives[index]), int(mesh_triangles.triangles[index]),
+                                       barycentrics, instance)
+            return distances, hits
+        hit = bvh.raycast(ray_origin, ray_dir, intersect_nodes)
+        if hit is None:
+            return None
+        t, _, (node_name, mesh_name, primitive, triangle, barycentrics, instance) = hit
+        return PickResult(node_name, mesh_name, primitive, triangle, barycentrics,
+                          t * np.linalg.norm(ray_dir), ray_origin + t * ray_dir, instance)
+
+
+def calc_pick_ray(x, y, window_size, projection_matrix, camera_matrix):
+    """
+    Returns the origin and (unit) direction, in world space, of the ray through the point :code:`(x, y)`
+    (in window coordinates, with the origin at the top left) of the view with the given projection and
+    camera (i.e. inverse view) matrices.
+    """
+    ndc_x = 2.0 * x / window_size[0] - 1.0
+    ndc_y = 1.0 - 2.0 * y / window_size[1]
+    inverse_view_projection = np.linalg.inv(projection_matrix.astype(np.float64)).dot(camera_matrix)
+    near, far = np.array([[ndc_x, ndc_y, -1.0, 1.0],
+                          [ndc_x, ndc_y, 1.0, 1.0]]).dot(inverse_view_projection)
+    near = near[:3] / near[3]
+    far = far[:3] / far[3]
+    direction = far - near
+    return near, direction / np.linalg.norm(direction)
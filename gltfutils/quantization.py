@@ -0,0 +1,164 @@
+"""
+Load-time quantization of the float vertex attributes of GLTF 2.0 meshes (in the style of the
+:code:`KHR_mesh_quantization` extension).
+
+The attributes are converted, with vectorized NumPy, into a new buffer of smaller (normalized) integer types:
+
+- POSITION: normalized 16-bit integers, relative to the bounds of the mesh.  The dequantization (a uniform scale
+  and an offset, so that the directions of normals are unchanged) is stored as the
+  :code:`'dequantization_matrix'` of the mesh, which precedes the world matrix of each node of the mesh wherever
+  its model matrix is formed (see :func:`gltfutils.gltfutils.get_model_matrix`).
+- NORMAL and TANGENT: normalized 8-bit integers.
+- TEXCOORD_n: normalized unsigned 16-bit integers if they are within [0, 1], else half floats if they are small
+  enough (within :data:`HALF_FLOAT_TEXCOORD_MAX`) to be represented with sufficient precision.
+- COLOR_n: normalized unsigned 8-bit integers (if they are within [0, 1]).
+
+Each attribute is padded to a multiple of 4 bytes per vertex.  Positions of meshes which are deformed (by skins
+or morph targets), or which are instanced with :code:`EXT_mesh_gpu_instancing` (whose instance transforms would
+have to follow the dequantization), or which are shared by several meshes, are not quantized.
+
+As elsewhere in gltfutils, matrices are stored transposed (i.e. they transform row vectors).
+"""
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+from gltfutils.accessors import Accessor
+from gltfutils.transforms import EXT_MESH_GPU_INSTANCING
+
+
+_logger = logging.getLogger(__name__)
+
+
+# texture coordinates outside of [0, 1] are quantized to half floats only within [-max, max]:
+HALF_FLOAT_TEXCOORD_MAX = 2.0
+
+GL_HALF_FLOAT = 5131
+
+
+def _quantize_normalized(values, dtype, num_components):
+    # converts values in [-1, 1] (or [0, 1] for unsigned types) to normalized integers, padded to num_components:
+    info = np.iinfo(dtype)
+    quantized = np.zeros((len(values), num_components), dtype=dtype)
+    quantized[:,:values.shape[1]] = np.round(np.clip(values, -1.0 if info.min else 0.0, 1.0) * info.max)
+    return quantized
+
+
+def quantize_attribute(semantic, values):
+    """
+    Returns :code:`(data, componentType, normalized)` of the quantized vertex data (an array padded to a multiple
+    of 4 bytes per vertex) of the values (an array of shape :code:`(V, n)` of floats) of an attribute,
+    or :code:`None` if the attribute is not quantized.  POSITION values must be within [-1, 1].
+    """
+    if semantic == 'POSITION':
+        return _quantize_normalized(values, np.int16, 4), gl.GL_SHORT, True
+    if semantic in ('NORMAL', 'TANGENT'):
+        return _quantize_normalized(values, np.int8, 4), gl.GL_BYTE, True
+    if semantic.startswith('TEXCOORD_'):
+        if values.min() >= 0.0 and values.max() <= 1.0:
+            return _quantize_normalized(values, np.uint16, 2), gl.GL_UNSIGNED_SHORT, True
+        if np.abs(values).max() <= HALF_FLOAT_TEXCOORD_MAX:
+            return values.astype(np.float16), GL_HALF_FLOAT, False
+        return None
+    if semantic.startswith('COLOR_') and values.min() >= 0.0 and values.max() <= 1.0:
+        return _quantize_normalized(values, np.uint8, 4), gl.GL_UNSIGNED_BYTE, True
+    return None
+
+
+def calc_dequantization_matrix(bounds):
+    """
+    Returns the (transposed) dequantization matrix which maps [-1, 1] to the bounds :code:`[min, max]`
+    (enlarged to a cube, so that the scale is uniform) of positions.
+    """
+    center = 0.5 * (bounds[0] + bounds[1])
+    scale = 0.5 * float((bounds[1] - bounds[0]).max()) or 1.0
+    matrix = np.eye(4, dtype=np.float32)
+    matrix[:3,:3] *= scale
+    matrix[3,:3] = center
+    return matrix
+
+
+def quantize_attributes(gltf, uri_path=None):
+    """
+    Quantizes the float vertex attributes of the meshes of a GLTF 2.0 gltf dict (in place, before its buffers
+    are uploaded): the quantized data is stored in a new buffer, and the accessors of the attributes are updated
+    to refer to it.  The bufferViews which are then no longer referenced by any accessor are marked as
+    :code:`'unreferenced'` (and are not uploaded by :func:`gltfutils.gltfutils.setup_buffers_v2`).
+    """
+    meshes = gltf.get('meshes', [])
+    accessors = gltf.get('accessors', [])
+    # the meshes whose positions are not quantized, and the meshes of each POSITION accessor:
+    deformed_meshes = {node['mesh'] for node in gltf.get('nodes', [])
+                       if 'mesh' in node and ('skin' in node or EXT_MESH_GPU_INSTANCING in node.get('extensions', {}))}
+    position_meshes = {}
+    for i_mesh, mesh in enumerate(meshes):
+        for primitive in mesh['primitives']:
+            if 'POSITION' in primitive.get('attributes', {}):
+                position_meshes.setdefault(primitive['attributes']['POSITION'], set()).add(i_mesh)
+    def is_quantizable(accessor_name, type):
+        accessor = accessors[accessor_name]
+        return (accessor['componentType'] == gl.GL_FLOAT and accessor['type'] == type and
+                'sparse' not in accessor and 'bufferView' in accessor and accessor['count'] > 0)
+    referenced_before = {accessor['bufferView'] for accessor in accessors if 'bufferView' in accessor}
+    chunks = []
+    byte_length = 0
+    quantized = {}
+    num_bytes = [0, 0]
+    def add_quantized(accessor_name, semantic, values):
+        nonlocal byte_length
+        result = quantize_attribute(semantic, values)
+        if result is None:
+            return
+        data, component_type, normalized = result
+        accessor = accessors[accessor_name]
+        num_bytes[0] += Accessor(gltf, accessor_name).array.nbytes
+        num_bytes[1] += data.nbytes
+        gltf['bufferViews'].append({'buffer': len(gltf['buffers']), 'byteOffset': byte_length,
+                                    'byteLength': data.nbytes, 'byteStride': data.strides[0],
+                                    'target': gl.GL_ARRAY_BUFFER})
+        chunks.append(data.tobytes())
+        byte_length += data.nbytes
+        accessor.update(bufferView=len(gltf['bufferViews']) - 1, byteOffset=0, componentType=component_type,
+                        min=data.min(axis=0)[:values.shape[1]].tolist(),
+                        max=data.max(axis=0)[:values.shape[1]].tolist())
+        if normalized:
+            accessor['normalized'] = True
+        else:
+            accessor.pop('normalized', None)
+        quantized[accessor_name] = semantic
+    for i_mesh, mesh in enumerate(meshes):
+        primitives = mesh['primitives']
+        position_names = {primitive['attributes']['POSITION'] for primitive in primitives
+                          if 'POSITION' in primitive.get('attributes', {})}
+        if position_names and i_mesh not in deformed_meshes and \
+           not any(primitive.get('targets') for primitive in primitives) and \
+           all(is_quantizable(name, 'VEC3') and position_meshes[name] == {i_mesh} for name in position_names):
+            positions = {name: Accessor(gltf, name, uri_path=uri_path).array for name in position_names}
+            bounds = np.array([np.min([p.min(axis=0) for p in positions.values()], axis=0),
+                               np.max([p.max(axis=0) for p in positions.values()], axis=0)], dtype=np.float64)
+            matrix = calc_dequantization_matrix(bounds)
+            inverse_matrix = np.linalg.inv(matrix.astype(np.float64))
+            for name, array in positions.items():
+                add_quantized(name, 'POSITION', array.dot(inverse_matrix[:3,:3]) + inverse_matrix[3,:3])
+            mesh['dequantization_matrix'] = matrix
+        for primitive in primitives:
+            for semantic, accessor_name in primitive.get('attributes', {}).items():
+                if semantic == 'POSITION' or accessor_name in quantized or \
+                   not is_quantizable(accessor_name, accessors[accessor_name]['type']):
+                    continue
+                array = Accessor(gltf, accessor_name, uri_path=uri_path).array
+                add_quantized(accessor_name, semantic, array.reshape(len(array), -1))
+    if not quantized:
+        return
+    data = bytearray(b''.join(chunks))
+    gltf['buffers'].append({'byteLength': len(data), 'data': memoryview(data)})
+    referenced_after = {accessor['bufferView'] for accessor in accessors if 'bufferView' in accessor} | \
+                       {accessor['sparse'][key]['bufferView'] for accessor in accessors if 'sparse' in accessor
+                        for key in ('indices', 'values')} | \
+                       {image['bufferView'] for image in gltf.get('images', []) if 'bufferView' in image}
+    for i in referenced_before - referenced_after:
+        gltf['bufferViews'][i]['unreferenced'] = True
+    _logger.info('quantized %d vertex attribute accessors (including the positions of %d meshes): '
+                 '%d bytes -> %d bytes', len(quantized), sum('dequantization_matrix' in mesh for mesh in meshes),
+                 num_bytes[0], num_bytes[1])
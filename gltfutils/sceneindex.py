@@ -0,0 +1,64 @@
+"""
+Precomputed traversal order of the node hierarchy of a scene.
+
+The hierarchy is walked once (without recursion, so arbitrarily deep hierarchies are supported),
+recording the nodes in depth-first pre-order along with the parent and depth of each node and the
+range of positions spanned by its subtree.  Parents precede their children, and the subtree of the
+node at position :code:`i` occupies positions :code:`i` up to (but not including) :code:`subtree_ends[i]`.
+"""
+import logging
+
+import numpy as np
+
+
+_logger = logging.getLogger(__name__)
+
+
+class SceneIndex(object):
+    """
+    :param gltf: the gltf dict
+    :param root_nodes: ids (GLTF 1.0) or indices (GLTF 2.0) of the root nodes of the scene
+    """
+    def __init__(self, gltf, root_nodes):
+        all_nodes = gltf['nodes']
+        names = []
+        parents = []
+        depths = []
+        subtree_ends = []
+        self.index = {}
+        # stack of (name, parent position, depth), or of the position of a node whose subtree is complete
+        # (marked by a negative value):
+        stack = [(n, -1, 0) for n in reversed(list(root_nodes))]
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, tuple):
+                subtree_ends[-item - 1] = len(names)
+                continue
+            name, parent, depth = item
+            if name in self.index:
+                _logger.warning('node %s has more than one parent, ignoring all but the first', name)
+                continue
+            i = len(names)
+            self.index[name] = i
+            names.append(name)
+            parents.append(parent)
+            depths.append(depth)
+            subtree_ends.append(i + 1)
+            stack.append(-i - 1)
+            stack.extend((child, i, depth + 1) for child in reversed(all_nodes[name].get('children', [])))
+        self.names = names
+        self.nodes = [all_nodes[name] for name in names]
+        self.parents = np.array(parents, dtype=np.int64)
+        self.depths = np.array(depths, dtype=np.int64)
+        self.subtree_ends = np.array(subtree_ends, dtype=np.int64)
+        self.mesh_nodes = [node for node in self.nodes if 'mesh' in node or node.get('meshes')]
+        _logger.debug('scene index: %d nodes (%d with meshes), maximum depth %d',
+                      len(names), len(self.mesh_nodes), self.depths.max() if names else 0)
+
+    def __len__(self):
+        return len(self.names)
+
+    def subtree(self, name):
+        """Returns the list of nodes of the subtree rooted at the given node (in pre-order)."""
+        i = self.index[name]
+        return self.nodes[i:self.subtree_ends[i]]
@@ -13,6 +13,9 @@
 //     https://www.cs.virginia.edu/~jdl/bib/appearance/analytic%20models/schlick94b.pdf
 #extension GL_EXT_shader_texture_lod: enable
 #extension GL_OES_standard_derivatives : enable
+#ifdef USE_UBO
+#extension GL_ARB_uniform_buffer_object : require
+#endif
 
 precision highp float;
 
@@ -34,17 +37,35 @@ uniform sampler2D u_BaseColorSampler;
 #endif
 #ifdef HAS_NORMALMAP
 uniform sampler2D u_NormalSampler;
-uniform float u_NormalScale;
 #endif
 #ifdef HAS_EMISSIVEMAP
 uniform sampler2D u_EmissiveSampler;
-uniform vec3 u_EmissiveFactor;
 #endif
 #ifdef HAS_METALROUGHNESSMAP
 uniform sampler2D u_MetallicRoughnessSampler;
 #endif
 #ifdef HAS_OCCLUSIONMAP
 uniform sampler2D u_OcclusionSampler;
+#endif
+
+#ifdef USE_UBO
+// material factors, one instance of the block per material:
+layout(std140) uniform MaterialBlock {
+  vec4 u_BaseColorFactor;
+  vec3 u_EmissiveFactor;
+  float u_MetallicFactor;
+  float u_RoughnessFactor;
+  float u_NormalScale;
+  float u_OcclusionStrength;
+};
+#else
+#ifdef HAS_NORMALMAP
+uniform float u_NormalScale;
+#endif
+#ifdef HAS_EMISSIVEMAP
+uniform vec3 u_EmissiveFactor;
+#endif
+#ifdef HAS_OCCLUSIONMAP
 uniform float u_OcclusionStrength;
 #endif
 
@@ -52,6 +73,7 @@ uniform float u_OcclusionStrength;
 uniform float u_MetallicFactor;
 uniform float u_RoughnessFactor;
 uniform vec4 u_BaseColorFactor;
+#endif
 
 // debugging flags used for shader output of intermediate PBR variables
 //uniform vec4 u_ScaleDiffBaseMR;
@@ -1,3 +1,6 @@
+#ifdef USE_UBO
+#extension GL_ARB_uniform_buffer_object : require
+#endif
 precision highp float;
 attribute vec4 a_Position;
 
@@ -10,11 +13,30 @@ attribute vec4 a_Tangent;
 #ifdef HAS_UV
 attribute vec2 a_UV;
 #endif
+#ifdef USE_INSTANCING
+// per-instance model matrix (attribute divisor 1):
+attribute mat4 a_ModelMatrix;
+#endif
 
 //uniform mat4 u_MVPMatrix;
+#ifdef USE_UBO
+// per-frame uniforms, shared by all programs:
+layout(std140) uniform FrameBlock {
+  mat4 u_ViewMatrix;
+  mat4 u_ProjectionMatrix;
+  mat4 u_CameraMatrix;
+  vec4 u_Viewport;
+};
+#else
 uniform mat4 u_ProjectionMatrix;
+#ifdef USE_INSTANCING
+uniform mat4 u_ViewMatrix;
+#endif
+#endif
 //uniform mat4 u_ModelMatrix;
+#ifndef USE_INSTANCING
 uniform mat4 u_ModelViewMatrix;
+#endif
 
 varying vec3 v_Position;
 varying vec2 v_UV;
@@ -30,19 +52,24 @@ varying vec3 v_Normal;
 
 void main()
 {
-  vec4 pos = u_ModelViewMatrix * a_Position;
+  #ifdef USE_INSTANCING
+  mat4 modelViewMatrix = u_ViewMatrix * a_ModelMatrix;
+  #else
+  mat4 modelViewMatrix = u_ModelViewMatrix;
+  #endif
+  vec4 pos = modelViewMatrix * a_Position;
   v_Position = pos.xyz / pos.w;
 
   #ifdef HAS_NORMALS
   #ifdef HAS_TANGENTS
-  vec3 normalW = normalize(vec3(u_ModelViewMatrix * vec4(a_Normal.xyz, 0.0)));
-  vec3 tangentW = normalize(vec3(u_ModelViewMatrix * vec4(a_Tangent.xyz, 0.0)));
+  vec3 normalW = normalize(vec3(modelViewMatrix * vec4(a_Normal.xyz, 0.0)));
+  vec3 tangentW = normalize(vec3(modelViewMatrix * vec4(a_Tangent.xyz, 0.0)));
   //vec3 normalW = normalize(u_NormalMatrix * a_Normal.xyz);
   //vec3 tangentW = normalize(u_NormalMatrix * a_Tangent.xyz);
   vec3 bitangentW = cross(normalW, tangentW) * a_Tangent.w;
   v_TBN = mat3(tangentW, bitangentW, normalW);
   #else // HAS_TANGENTS != 1
-  v_Normal = normalize(vec3(u_ModelViewMatrix * vec4(a_Normal.xyz, 0.0)));
+  v_Normal = normalize(vec3(modelViewMatrix * vec4(a_Normal.xyz, 0.0)));
   //v_Normal = normalize(u_NormalMatrix * a_Normal.xyz);
   #endif
   #endif
@@ -54,5 +81,5 @@ void main()
   #endif
 
   // gl_Position = u_MVPMatrix * a_Position; // needs w for proper perspective correction
-  gl_Position = u_ProjectionMatrix * (u_ModelViewMatrix * vec4(a_Position.xyz, 1.0));
+  gl_Position = u_ProjectionMatrix * (modelViewMatrix * vec4(a_Position.xyz, 1.0));
 }
@@ -0,0 +1,209 @@
+"""
+Progressive streaming of texture data to GL.
+
+Textures are created immediately with a 1x1 placeholder image, so that the scene can be rendered
+before any of its images have been decoded.  Once per frame, :meth:`TextureStreamer.update` uploads
+the pixel data of images which have finished loading, through a pixel buffer object and limited to a
+budget of bytes per frame, so that the frame time stays steady while the textures arrive.
+
+Mip chains loaded from an :code:`AssetCache` are streamed smallest level first, so that a low
+resolution version of the texture is rendered while the larger levels are uploaded.
+
+Textures whose images fail to load (or decode) keep their placeholder images.
+"""
+from ctypes import c_void_p
+from concurrent.futures import Future
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+from gltfutils.textureutils import (prepare_image, get_swap_bytes, get_unpack_alignment, set_swizzle,
+                                    get_mip_level_sizes, read_texture_levels)
+from gltfutils.assetcache import CachedTexture, CACHE_KEY_INFO
+
+
+_logger = logging.getLogger(__name__)
+
+
+DEFAULT_BYTES_PER_FRAME = 4 * 2**20
+DEFAULT_PLACEHOLDER_COLOR = (255, 255, 255, 255)
+NORMAL_MAP_PLACEHOLDER_COLOR = (128, 128, 255, 255)
+
+
+class _StreamingTexture(object):
+    def __init__(self, texture, image, internal_format=None, cache=None, name=None):
+        self.texture = texture
+        self.name = name
+        self.image = image
+        self.internal_format = internal_format
+        self.cache = cache
+        self.texture_id = None
+        self.image_format = None
+        self.levels = None # list of (level, width, height, pixels) remaining to be uploaded, last one first
+        self.row = 0
+        self.swap_bytes = False
+        self.generate_mipmap = False
+        self.cache_key = None
+        self.size = None
+
+    def ready(self):
+        if isinstance(self.image, Future):
+            if not self.image.done():
+                return False
+            self.image = self.image.result()
+        return True
+
+
+class TextureStreamer(object):
+    """
+    :param bytes_per_frame: maximum number of bytes of pixel data uploaded per call to :meth:`update`
+                            (at least one row of a texture level is uploaded per call)
+    """
+    def __init__(self, bytes_per_frame=DEFAULT_BYTES_PER_FRAME):
+        self.bytes_per_frame = bytes_per_frame
+        self.num_bytes_uploaded = 0
+        self._pending = []
+        self._pbo = None
+
+    @property
+    def num_pending(self):
+        """The number of textures which have not yet been completely uploaded."""
+        return len(self._pending)
+
+    def add(self, texture, image, internal_format=None, cache=None,
+            placeholder_color=DEFAULT_PLACEHOLDER_COLOR, name=None):
+        """
+        Fills the texture object of a GLTF texture (:code:`texture['id']`) with a 1x1 placeholder image,
+        and queues the upload of the given image to the texture.
+
+        :param image: the PIL.Image or :code:`CachedTexture` to upload,
+                      or a :code:`Future` of either (which is not waited on)
+        :param cache: optional :code:`AssetCache` in which the completed texture is stored
+        :param name: optional name of the texture (e.g. its id or index), used in log messages
+        """
+        target = texture['target']
+        gl.glBindTexture(target, texture['id'])
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+        gl.glTexImage2D(target, 0, gl.GL_RGBA8, 1, 1, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE,
+                        np.array(placeholder_color, dtype=np.ubyte))
+        self._pending.append(_StreamingTexture(texture, image, internal_format=internal_format, cache=cache,
+                                               name=name))
+
+    def update(self):
+        """
+        Uploads pending texture data to GL, up to the per-frame budget.
+        Should be called once per frame (from the GL context thread).
+        Returns the number of bytes uploaded.
+        """
+        if not self._pending:
+            return 0
+        num_bytes = 0
+        for job in list(self._pending):
+            if num_bytes >= self.bytes_per_frame:
+                break
+            if job.levels is None:
+                try:
+                    if not job.ready():
+                        continue
+                    self._start(job)
+                except Exception as err:
+                    # (e.g. the image could not be decoded, by a worker or by prepare_image)
+                    _logger.error('failed to load the image of texture %s, keeping its placeholder: %s',
+                                  job.name if job.name is not None else job.texture['id'], err)
+                    if job.texture_id is not None:
+                        gl.glDeleteTextures([job.texture_id])
+                    job.image = None
+                    self._pending.remove(job)
+                    continue
+            while job.levels and num_bytes < self.bytes_per_frame:
+                num_bytes += self._upload_rows(job, self.bytes_per_frame - num_bytes)
+            if not job.levels:
+                self._finish(job)
+                self._pending.remove(job)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+        self.num_bytes_uploaded += num_bytes
+        if not self._pending:
+            _logger.info('finished streaming textures (%d bytes uploaded)', self.num_bytes_uploaded)
+            if self._pbo is not None:
+                gl.glDeleteBuffers(1, [self._pbo])
+                self._pbo = None
+        return num_bytes
+
+    def _start(self, job):
+        target = job.texture['target']
+        image = job.image
+        job.texture_id = gl.glGenTextures(1)
+        gl.glBindTexture(target, job.texture_id)
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+        if isinstance(image, CachedTexture):
+            job.image_format = image.image_format
+            job.size = image.width, image.height
+            sizes = get_mip_level_sizes(image.width, image.height)[:len(image.levels)]
+            job.levels = [(level, width, height, np.frombuffer(pixels, dtype=np.ubyte))
+                          for level, ((width, height), pixels) in enumerate(zip(sizes, image.levels))]
+            gl.glTexParameteri(target, gl.GL_TEXTURE_MAX_LEVEL, len(job.levels) - 1)
+        else:
+            pixels, job.image_format = prepare_image(image)
+            job.size = image.size
+            job.levels = [(0, image.width, image.height, np.frombuffer(pixels, dtype=np.ubyte))]
+            job.swap_bytes = get_swap_bytes(image, job.image_format)
+            job.generate_mipmap = True
+            job.cache_key = image.info.get(CACHE_KEY_INFO)
+        internal_format = job.internal_format
+        if internal_format is None:
+            internal_format = job.image_format.internal_format
+        # allocate storage for all levels to be uploaded:
+        for level, width, height, _ in job.levels:
+            gl.glTexImage2D(target, level, internal_format, width, height, 0,
+                            job.image_format.format, job.image_format.type, None)
+        set_swizzle(target, job.image_format)
+        if self._pbo is None:
+            self._pbo = gl.glGenBuffers(1)
+
+    def _upload_rows(self, job, max_bytes):
+        target = job.texture['target']
+        level, width, height, pixels = job.levels[-1]
+        row_bytes = width * job.image_format.bytes_per_pixel
+        num_rows = min(height - job.row, max(1, max_bytes // row_bytes))
+        chunk = pixels[job.row * row_bytes:(job.row + num_rows) * row_bytes]
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, self._pbo)
+        gl.glBufferData(gl.GL_PIXEL_UNPACK_BUFFER, chunk.nbytes, chunk, gl.GL_STREAM_DRAW)
+        gl.glBindTexture(target, job.texture_id)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, get_unpack_alignment(row_bytes))
+        if job.swap_bytes:
+            gl.glPixelStorei(gl.GL_UNPACK_SWAP_BYTES, gl.GL_TRUE)
+        gl.glTexSubImage2D(target, level, 0, job.row, width, num_rows,
+                           job.image_format.format, job.image_format.type, c_void_p(0))
+        if job.swap_bytes:
+            gl.glPixelStorei(gl.GL_UNPACK_SWAP_BYTES, gl.GL_FALSE)
+        job.row += num_rows
+        if job.row == height:
+            job.levels.pop()
+            job.row = 0
+            if not job.generate_mipmap:
+                # the levels are uploaded smallest first, so the texture can be rendered
+                # using the levels which are complete so far:
+                gl.glTexParameteri(target, gl.GL_TEXTURE_BASE_LEVEL, level)
+                self._swap_in(job)
+        return chunk.nbytes
+
+    def _swap_in(self, job):
+        texture = job.texture
+        if texture['id'] != job.texture_id:
+            gl.glDeleteTextures([texture['id']])
+            texture['id'] = job.texture_id
+
+    def _finish(self, job):
+        target = job.texture['target']
+        gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+        gl.glBindTexture(target, job.texture_id)
+        if job.generate_mipmap:
+            gl.glGenerateMipmap(target)
+            if job.cache is not None and job.cache_key is not None:
+                width, height = job.size
+                job.cache.put_texture(job.cache_key, width, height, job.image_format,
+                                      read_texture_levels(target, job.image_format, width, height))
+        self._swap_in(job)
+        job.image = None
+        _logger.debug('finished streaming texture %s (%dx%d)', job.texture_id, *job.size)
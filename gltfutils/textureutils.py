@@ -0,0 +1,164 @@
+"""
+Uploading of PIL images to GL textures.
+
+The image's raw pixel buffer is handed directly to :code:`glTexImage2D` (with the pixel format,
+component type and unpack alignment chosen to match the image mode), rather than being
+converted to an array element by element.
+"""
+import sys
+from collections import namedtuple
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+_logger = logging.getLogger(__name__)
+
+
+ImageFormat = namedtuple('ImageFormat', ['format', 'type', 'internal_format', 'bytes_per_pixel', 'swizzle'])
+
+
+_LUMINANCE_SWIZZLE = (gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_ONE)
+_LUMINANCE_ALPHA_SWIZZLE = (gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_GREEN)
+
+
+IMAGE_MODE_FORMATS = {
+    'L':     ImageFormat(gl.GL_RED,  gl.GL_UNSIGNED_BYTE,  gl.GL_R8,    1, _LUMINANCE_SWIZZLE),
+    'LA':    ImageFormat(gl.GL_RG,   gl.GL_UNSIGNED_BYTE,  gl.GL_RG8,   2, _LUMINANCE_ALPHA_SWIZZLE),
+    'RGB':   ImageFormat(gl.GL_RGB,  gl.GL_UNSIGNED_BYTE,  gl.GL_RGB8,  3, None),
+    'RGBA':  ImageFormat(gl.GL_RGBA, gl.GL_UNSIGNED_BYTE,  gl.GL_RGBA8, 4, None),
+    'RGBX':  ImageFormat(gl.GL_RGBA, gl.GL_UNSIGNED_BYTE,  gl.GL_RGB8,  4, None),
+    'I;16':  ImageFormat(gl.GL_RED,  gl.GL_UNSIGNED_SHORT, gl.GL_R16,   2, _LUMINANCE_SWIZZLE),
+    'I;16L': ImageFormat(gl.GL_RED,  gl.GL_UNSIGNED_SHORT, gl.GL_R16,   2, _LUMINANCE_SWIZZLE),
+    'I;16B': ImageFormat(gl.GL_RED,  gl.GL_UNSIGNED_SHORT, gl.GL_R16,   2, _LUMINANCE_SWIZZLE),
+    'F':     ImageFormat(gl.GL_RED,  gl.GL_FLOAT,          gl.GL_R32F,  4, _LUMINANCE_SWIZZLE)
+}
+
+
+# modes which are not stored in a layout that GL can read directly, and the mode they are converted to:
+_CONVERTED_MODES = {
+    '1': 'L',
+    'P': None, # converted to the mode of the palette
+    'PA': 'RGBA',
+    'La': 'LA',
+    'RGBa': 'RGBA',
+    'CMYK': 'RGB',
+    'YCbCr': 'RGB',
+    'LAB': 'RGB',
+    'HSV': 'RGB'
+}
+
+
+_BIG_ENDIAN_MODES = ('I;16B',)
+
+
+def get_unpack_alignment(row_bytes):
+    """Returns the largest valid GL_UNPACK_ALIGNMENT which evenly divides the given row length (in bytes)."""
+    for alignment in (8, 4, 2):
+        if row_bytes % alignment == 0:
+            return alignment
+    return 1
+
+
+def prepare_image(pil_image):
+    """
+    Returns a tuple :code:`(pixels, image_format)` of the raw pixel data of the image
+    (tightly packed rows, first row first) and the :code:`ImageFormat` describing it.
+
+    Images in modes which GL can not read directly are converted first
+    (e.g. palette images are expanded, 32-bit integer images are clamped to 16 bits).
+    """
+    mode = pil_image.mode
+    if mode in _CONVERTED_MODES:
+        if mode == 'P':
+            pil_image = pil_image.convert(pil_image.palette.mode)
+        else:
+            pil_image = pil_image.convert(_CONVERTED_MODES[mode])
+        mode = pil_image.mode
+    if mode == 'I':
+        pixels = np.clip(np.asarray(pil_image), 0, 0xffff).astype('<u2').tobytes()
+        return pixels, IMAGE_MODE_FORMATS['I;16']
+    if mode not in IMAGE_MODE_FORMATS:
+        _logger.warning('unhandled image mode "%s", converting to RGBA', mode)
+        pil_image = pil_image.convert('RGBA')
+        mode = pil_image.mode
+    return pil_image.tobytes(), IMAGE_MODE_FORMATS[mode]
+
+
+def upload_image(target, pil_image, level=0, internal_format=None, texture_target=None):
+    """
+    Uploads a PIL image as one level of the texture currently bound to :code:`target`
+    (via :code:`glTexImage2D`), returning the :code:`ImageFormat` used.
+
+    :param target: the texture target, or for cube maps, the cube map face target
+    :param internal_format: the internal format of the texture, by default one matching the image mode
+    :param texture_target: target to set texture parameters (the swizzle for luminance images) on,
+                           if it differs from :code:`target` (i.e. :code:`GL_TEXTURE_CUBE_MAP`)
+    """
+    pixels, image_format = prepare_image(pil_image)
+    width, height = pil_image.size
+    upload_pixels(target, pixels, image_format, width, height, level=level,
+                  internal_format=internal_format, texture_target=texture_target,
+                  swap_bytes=get_swap_bytes(pil_image, image_format))
+    return image_format
+
+
+def get_swap_bytes(pil_image, image_format):
+    """Returns True if the pixel data of the image (as returned by :func:`prepare_image`) is not in native byte order."""
+    return (image_format.type == gl.GL_UNSIGNED_SHORT and
+            (pil_image.mode in _BIG_ENDIAN_MODES) == (sys.byteorder == 'little'))
+
+
+def upload_pixels(target, pixels, image_format, width, height, level=0,
+                  internal_format=None, texture_target=None, swap_bytes=False):
+    """
+    Uploads tightly packed pixel data described by an :code:`ImageFormat` as one level of the
+    texture currently bound to :code:`target`.  Parameters are as for :func:`upload_image`.
+    """
+    if internal_format is None:
+        internal_format = image_format.internal_format
+    gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, get_unpack_alignment(width * image_format.bytes_per_pixel))
+    if swap_bytes:
+        gl.glPixelStorei(gl.GL_UNPACK_SWAP_BYTES, gl.GL_TRUE)
+    gl.glTexImage2D(target, level, internal_format,
+                    width, height, 0,
+                    image_format.format, image_format.type,
+                    pixels)
+    if swap_bytes:
+        gl.glPixelStorei(gl.GL_UNPACK_SWAP_BYTES, gl.GL_FALSE)
+    if level == 0:
+        set_swizzle(target if texture_target is None else texture_target, image_format)
+
+
+def set_swizzle(texture_target, image_format):
+    """Sets the texture swizzle of the texture currently bound to :code:`texture_target` required by the :code:`ImageFormat` (if any)."""
+    if image_format.swizzle is None:
+        return
+    for pname, swizzle in zip((gl.GL_TEXTURE_SWIZZLE_R, gl.GL_TEXTURE_SWIZZLE_G,
+                               gl.GL_TEXTURE_SWIZZLE_B, gl.GL_TEXTURE_SWIZZLE_A),
+                              image_format.swizzle):
+        gl.glTexParameteri(texture_target, pname, swizzle)
+
+
+def get_mip_level_sizes(width, height):
+    """Returns the list of :code:`(width, height)` of each level of a full mip chain."""
+    sizes = [(width, height)]
+    while width > 1 or height > 1:
+        width, height = max(1, width >> 1), max(1, height >> 1)
+        sizes.append((width, height))
+    return sizes
+
+
+def read_texture_levels(target, image_format, width, height):
+    """
+    Reads back (via :code:`glGetTexImage`) all mip levels of the texture currently bound to :code:`target`,
+    returning a list of the tightly packed pixel data of each level as :code:`ndarray` s of bytes.
+    """
+    gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+    levels = []
+    for level, (w, h) in enumerate(get_mip_level_sizes(width, height)):
+        pixels = np.empty(w * h * image_format.bytes_per_pixel, dtype=np.ubyte)
+        gl.glGetTexImage(target, level, image_format.format, image_format.type, pixels)
+        levels.append(pixels)
+    return levels
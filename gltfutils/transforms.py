@@ -0,0 +1,199 @@
+"""
+Array-backed (structure of arrays) storage of the transform hierarchy of a scene.
+
+The local translation, rotation and scale (or matrix) of every node are held in flat arrays,
+along with the index of each node's parent.  Nodes are ordered by depth, so that the world matrices
+of all nodes at one level of the hierarchy are computed with a single batched matrix product from
+those of the level above.  The world matrices of all nodes are held in one contiguous
+:code:`(N, 4, 4)` float32 array, and each node's :code:`'world_matrix'` is a view into it.
+
+As elsewhere in gltfutils, matrices are stored transposed (i.e. they transform row vectors).
+"""
+import logging
+
+import numpy as np
+
+from gltfutils.accessors import get_accessor_array
+from gltfutils.sceneindex import SceneIndex
+
+
+_logger = logging.getLogger(__name__)
+
+
+EXT_MESH_GPU_INSTANCING = 'EXT_mesh_gpu_instancing'
+
+
+def set_matrices_from_quaternions(quats, out=None):
+    """
+    Batched version of :func:`gltfutils.gl_rendering.set_matrix_from_quaternion`:
+    sets the values of an array of shape :code:`(N, 3, 3)` to those of the rotation matrices of
+    an array of shape :code:`(N, 4)` of quaternions (with components in the same order).
+    """
+    quats = np.asarray(quats, dtype=np.float32)
+    if out is None:
+        out = np.empty((len(quats), 3, 3), dtype=np.float32)
+    w, x, y, z = quats.T
+    y2 = y**2
+    x2 = x**2
+    z2 = z**2
+    xy = x * y
+    xz = x * z
+    yz = y * z
+    wx = w * x
+    wy = w * y
+    wz = w * z
+    out[:,0,0] = 1.0 - 2.0 * (y2 + z2)
+    out[:,0,1] = 2.0 * (xy - wz)
+    out[:,0,2] = 2.0 * (xz + wy)
+    out[:,1,0] = 2.0 * (xy + wz)
+    out[:,1,1] = 1.0 - 2.0 * (x2 + z2)
+    out[:,1,2] = 2.0 * (yz - wx)
+    out[:,2,0] = 2.0 * (xz - wy)
+    out[:,2,1] = 2.0 * (yz + wx)
+    out[:,2,2] = 1.0 - 2.0 * (x2 + y2)
+    return out
+
+
+def compose_matrices(translations, rotations, scales, out=None, transpose_rotations=False):
+    """
+    Returns the array of shape :code:`(N, 4, 4)` of the (transposed) matrices of arrays of shape :code:`(N, 3)`
+    of translations and scales and an array of shape :code:`(N, 4)` of quaternions
+    (with components in the order of :func:`set_matrices_from_quaternions`).
+
+    :param transpose_rotations: if True, the transposed rotation matrices are stored (i.e. the matrices rotate
+                                row vectors by the quaternions), as for :func:`get_instance_matrices`.  If False,
+                                the rotation matrices are stored as :func:`set_matrix_from_quaternion` computes them,
+                                which is how :class:`TransformStore` (like :func:`gltfutils.gltfutils.update_world_matrices`)
+                                has always stored the rotations of nodes, whose quaternions it also reads in
+                                (w, x, y, z) order.  The two conventions must be kept separate: changing this
+                                function for one caller changes the rotations of the other.
+    """
+    if out is None:
+        out = np.empty((len(translations), 4, 4), dtype=np.float32)
+    out[:,:3,3] = 0.0
+    out[:,3,3] = 1.0
+    set_matrices_from_quaternions(rotations, out=out[:,:3,:3])
+    if transpose_rotations:
+        out[:,:3,:3] = np.swapaxes(out[:,:3,:3], 1, 2).copy()
+    out[:,:3,:3] *= scales[:,:,None]
+    out[:,3,:3] = translations
+    return out
+
+
+def get_instance_matrices(gltf, node, uri_path=None):
+    """
+    Returns the array of shape :code:`(K, 4, 4)` of the (transposed) local matrices, relative to the node,
+    of the instances of a node which uses the :code:`EXT_mesh_gpu_instancing` extension
+    (or :code:`None` if it does not), from its TRANSLATION / ROTATION / SCALE accessors.
+    """
+    extension = node.get('extensions', {}).get(EXT_MESH_GPU_INSTANCING)
+    if extension is None:
+        return None
+    arrays = {semantic: get_accessor_array(gltf, accessor_name, uri_path=uri_path, normalize=True).astype(np.float32)
+              for semantic, accessor_name in extension.get('attributes', {}).items()
+              if semantic in ('TRANSLATION', 'ROTATION', 'SCALE')}
+    count = len(next(iter(arrays.values()))) if arrays else 0
+    translations = arrays.get('TRANSLATION', np.zeros((count, 3), dtype=np.float32)).reshape(count, 3)
+    rotations = np.zeros((count, 4), dtype=np.float32)
+    rotations[:,0] = 1.0
+    if 'ROTATION' in arrays:
+        # (the components of the extension's quaternions are in (x, y, z, w) order)
+        rotations[:] = arrays['ROTATION'].reshape(count, 4)[:,[3, 0, 1, 2]]
+    scales = arrays.get('SCALE', np.ones((count, 3), dtype=np.float32)).reshape(count, 3)
+    # (the matrices are transposed, so their rotations must be too)
+    return compose_matrices(translations, rotations, scales, transpose_rotations=True)
+
+
+class TransformStore(object):
+    """
+    The transforms of all nodes of a scene hierarchy.
+
+    After the local transform arrays (:attr:`translations`, :attr:`rotations`, :attr:`scales`,
+    :attr:`matrices`) have been modified, :meth:`update` recomputes the world matrices in place
+    (and increments :attr:`version`, so that values derived from them may be recomputed only as needed).
+
+    :param gltf: the gltf dict
+    :param root_nodes: ids (GLTF 1.0) or indices (GLTF 2.0) of the root nodes of the hierarchy
+    :param scene_index: optional :code:`SceneIndex` of the hierarchy (constructed if not given)
+    """
+    def __init__(self, gltf, root_nodes, scene_index=None):
+        self.gltf = gltf
+        all_nodes = gltf['nodes']
+        if scene_index is None:
+            scene_index = SceneIndex(gltf, root_nodes)
+        # order the nodes by depth (stably, so that each level is in the order of the scene index):
+        order = np.argsort(scene_index.depths, kind='stable')
+        names = [scene_index.names[i] for i in order]
+        self.index = {name: i for i, name in enumerate(names)}
+        positions = np.empty(len(order), dtype=np.int64)
+        positions[order] = np.arange(len(order))
+        parents = scene_index.parents[order]
+        self.parents = np.where(parents < 0, -1, positions[parents])
+        depths = scene_index.depths[order]
+        num_levels = depths[-1] + 1 if len(depths) else 0
+        # (the nodes at depth d are at positions level_offsets[d] up to level_offsets[d+1]):
+        self.level_offsets = np.searchsorted(depths, np.arange(num_levels + 1)).tolist()
+        self.names = names
+        n = len(names)
+        self.translations = np.zeros((n, 3), dtype=np.float32)
+        self.rotations = np.zeros((n, 4), dtype=np.float32)
+        self.rotations[:,0] = 1.0
+        self.scales = np.ones((n, 3), dtype=np.float32)
+        self.matrices = np.zeros((n, 4, 4), dtype=np.float32)
+        self.has_matrix = np.zeros(n, dtype=bool)
+        self.local_matrices = np.zeros((n, 4, 4), dtype=np.float32)
+        self.world_matrices = np.zeros((n, 4, 4), dtype=np.float32)
+        self.version = 0
+        self.read_nodes()
+        for name, world_matrix in zip(names, self.world_matrices):
+            all_nodes[name]['world_matrix'] = world_matrix
+        self.update()
+        _logger.debug('transform store: %d nodes, %d levels', n, len(self.level_offsets) - 1)
+
+    def __len__(self):
+        return len(self.names)
+
+    def read_nodes(self):
+        """Reads the local transforms of all nodes from their :code:`matrix` or TRS properties."""
+        all_nodes = self.gltf['nodes']
+        # gather the values of each property, then copy them into the arrays at once:
+        properties = {'matrix': ([], []), 'translation': ([], []), 'rotation': ([], []), 'scale': ([], [])}
+        for i, name in enumerate(self.names):
+            node = all_nodes[name]
+            if 'matrix' in node:
+                matrix = node['matrix']
+                if not isinstance(matrix, np.ndarray):
+                    matrix = np.array(matrix, dtype=np.float32).reshape((4, 4))
+                    # (column-major, as update_world_matrices stores it)
+                    node['matrix'] = np.ascontiguousarray(matrix.T)
+                else:
+                    matrix = matrix.T
+                properties['matrix'][0].append(i)
+                properties['matrix'][1].append(matrix)
+                continue
+            for key in ('translation', 'rotation', 'scale'):
+                if key in node:
+                    properties[key][0].append(i)
+                    properties[key][1].append(node[key])
+        self.has_matrix[:] = False
+        for key, array in (('matrix', self.matrices), ('translation', self.translations),
+                           ('rotation', self.rotations), ('scale', self.scales)):
+            indices, values = properties[key]
+            if indices:
+                array[indices] = values
+        self.has_matrix[properties['matrix'][0]] = True
+
+    def update(self):
+        """Recomputes the local and world matrices of all nodes."""
+        self.version += 1
+        # (the rotations of nodes are stored as they always have been, see compose_matrices)
+        local_matrices = compose_matrices(self.translations, self.rotations, self.scales, out=self.local_matrices)
+        local_matrices[self.has_matrix] = self.matrices[self.has_matrix]
+        world_matrices = self.world_matrices
+        offsets = self.level_offsets
+        if len(offsets) < 2:
+            return
+        world_matrices[:offsets[1]] = local_matrices[:offsets[1]]
+        for start, end in zip(offsets[1:-1], offsets[2:]):
+            np.matmul(local_matrices[start:end], world_matrices[self.parents[start:end]],
+                      out=world_matrices[start:end])
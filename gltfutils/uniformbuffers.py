@@ -0,0 +1,181 @@
+"""
+Uniform buffer objects for per-frame and per-material uniform data.
+
+Programs which declare the uniform blocks :code:`FrameBlock` and / or :code:`MaterialBlock` (e.g. the PBRMR
+programs, when set up with :code:`use_ubo=True`) read their per-frame uniforms (view, projection and camera
+matrices, viewport) from a single buffer which is updated once per frame, and their material uniforms from
+a buffer holding one instance of the block for each material, which is built once at load time and bound
+(with :code:`glBindBufferRange`) when the material changes.
+
+The layouts of the blocks are queried from GL when the programs are linked, so any layout
+(e.g. :code:`std140`) and any members of the supported types may be declared.
+"""
+from collections import namedtuple
+import logging
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+_logger = logging.getLogger(__name__)
+
+
+FRAME_BLOCK_NAME = 'FrameBlock'
+MATERIAL_BLOCK_NAME = 'MaterialBlock'
+FRAME_BLOCK_BINDING = 0
+MATERIAL_BLOCK_BINDING = 1
+_BLOCK_BINDINGS = {FRAME_BLOCK_NAME: FRAME_BLOCK_BINDING,
+                   MATERIAL_BLOCK_NAME: MATERIAL_BLOCK_BINDING}
+
+# the members of the frame block, and the semantic of the value of each:
+FRAME_BLOCK_SEMANTICS = {'u_ViewMatrix': 'VIEW',
+                         'u_ProjectionMatrix': 'PROJECTION',
+                         'u_CameraMatrix': 'VIEWINVERSE',
+                         'u_Viewport': 'VIEWPORT'}
+
+# the (number of columns, number of rows) of the supported types of block members:
+_UNIFORM_TYPE_SHAPES = {
+    gl.GL_FLOAT: (1, 1),
+    gl.GL_FLOAT_VEC2: (1, 2),
+    gl.GL_FLOAT_VEC3: (1, 3),
+    gl.GL_FLOAT_VEC4: (1, 4),
+    gl.GL_FLOAT_MAT2: (2, 2),
+    gl.GL_FLOAT_MAT3: (3, 3),
+    gl.GL_FLOAT_MAT4: (4, 4)
+}
+_UNIFORM_TYPE_SHAPES.update({int(k): v for k, v in _UNIFORM_TYPE_SHAPES.items()})
+
+
+BlockMember = namedtuple('BlockMember', ['name', 'type', 'offset', 'matrix_stride'])
+UniformBlock = namedtuple('UniformBlock', ['name', 'index', 'binding', 'size', 'members'])
+
+
+def get_uniform_blocks(program_id):
+    """
+    Queries the layouts of the uniform blocks of a linked program which are bound to the frame / material
+    binding points, returning a dict mapping block name to :code:`UniformBlock`
+    (whose :code:`members` maps member name to :code:`BlockMember`).
+    Also sets the binding point of each block.
+    """
+    blocks = {}
+    if not gl.glGetProgramiv(program_id, gl.GL_ACTIVE_UNIFORM_BLOCKS):
+        return blocks
+    for name, binding in _BLOCK_BINDINGS.items():
+        block_index = gl.glGetUniformBlockIndex(program_id, name)
+        if block_index == gl.GL_INVALID_INDEX:
+            continue
+        params = np.zeros(2, dtype=np.int32)
+        gl.glGetActiveUniformBlockiv(program_id, block_index, gl.GL_UNIFORM_BLOCK_DATA_SIZE, params[:1])
+        gl.glGetActiveUniformBlockiv(program_id, block_index, gl.GL_UNIFORM_BLOCK_ACTIVE_UNIFORMS, params[1:])
+        size, num_members = params.tolist()
+        indices = np.zeros(num_members, dtype=np.uint32)
+        gl.glGetActiveUniformBlockiv(program_id, block_index, gl.GL_UNIFORM_BLOCK_ACTIVE_UNIFORM_INDICES,
+                                     indices.view(np.int32))
+        types, offsets, matrix_strides = (np.zeros(num_members, dtype=np.int32) for _ in range(3))
+        for pname, values in ((gl.GL_UNIFORM_TYPE, types), (gl.GL_UNIFORM_OFFSET, offsets),
+                              (gl.GL_UNIFORM_MATRIX_STRIDE, matrix_strides)):
+            gl.glGetActiveUniformsiv(program_id, num_members, indices, pname, values)
+        members = {}
+        for uniform_index, uniform_type, offset, matrix_stride in zip(indices.tolist(), types.tolist(),
+                                                                      offsets.tolist(), matrix_strides.tolist()):
+            member_name = gl.glGetActiveUniform(program_id, uniform_index)[0]
+            if isinstance(member_name, bytes):
+                member_name = member_name.decode()
+            members[member_name] = BlockMember(member_name, uniform_type, offset, matrix_stride)
+        gl.glUniformBlockBinding(program_id, block_index, binding)
+        blocks[name] = UniformBlock(name, block_index, binding, int(size), members)
+    return blocks
+
+
+def pack_block_member(data, member, value):
+    """
+    Writes a value into the data (a :code:`uint8` array) of a uniform block.
+    Matrices are written as GL would read them from :code:`glUniformMatrix*fv` without transposition.
+    """
+    num_columns, num_rows = _UNIFORM_TYPE_SHAPES[member.type]
+    value = np.asarray(value, dtype=np.float32)
+    if num_columns == 1:
+        data[member.offset:member.offset + 4*num_rows] = value.reshape(-1)[:num_rows].view(np.uint8)
+    else:
+        columns = value.reshape(num_columns, num_rows)
+        for i, column in enumerate(columns):
+            offset = member.offset + i * member.matrix_stride
+            data[offset:offset + 4*num_rows] = column.view(np.uint8)
+
+
+class FrameUniformBuffer(object):
+    """
+    A uniform buffer holding the frame block (shared by all programs), bound to its binding point.
+
+    :param block: the :code:`UniformBlock` of the frame block (of any of the programs which declare it)
+    """
+    def __init__(self, block):
+        self.block = block
+        self.data = np.zeros(block.size, dtype=np.uint8)
+        self.buffer_id = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.buffer_id)
+        gl.glBufferData(gl.GL_UNIFORM_BUFFER, block.size, None, gl.GL_DYNAMIC_DRAW)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, 0)
+        gl.glBindBufferBase(gl.GL_UNIFORM_BUFFER, block.binding, self.buffer_id)
+
+    def update(self, values):
+        """Writes the per-frame values of a :code:`SemanticUniformValues` (after its :code:`set_frame`) to the buffer."""
+        from gltfutils.gltfutils import UNIFORM_SEMANTICS
+        for name, member in self.block.members.items():
+            if name in FRAME_BLOCK_SEMANTICS:
+                pack_block_member(self.data, member,
+                                  values.values[UNIFORM_SEMANTICS.index(FRAME_BLOCK_SEMANTICS[name])])
+        gl.glBindBufferBase(gl.GL_UNIFORM_BUFFER, self.block.binding, self.buffer_id)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.buffer_id)
+        gl.glBufferSubData(gl.GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+        gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, 0)
+
+
+class MaterialUniformBuffer(object):
+    """
+    A uniform buffer holding an instance of the material block of each of the given materials
+    (which is filled with the values of the material's uniforms), at offsets aligned for binding.
+
+    :param gltf: the gltf dict
+    :param materials: ids (GLTF 1.0) or indices (GLTF 2.0) of the materials
+    """
+    def __init__(self, gltf, materials):
+        from gltfutils.gltfutils import get_material_value
+        alignment = int(gl.glGetIntegerv(gl.GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT))
+        self.ranges = []
+        chunks = []
+        offset = 0
+        for material_name in materials:
+            material = gltf['materials'][material_name]
+            technique = gltf['techniques'][material['technique']]
+            block = gltf['programs'][technique['program']].get('uniform_blocks', {}).get(MATERIAL_BLOCK_NAME)
+            if block is None:
+                self.ranges.append(None)
+                continue
+            parameter_names = {uniform_name: parameter_name
+                               for uniform_name, parameter_name in technique.get('uniforms', {}).items()}
+            data = np.zeros(-(-block.size // alignment) * alignment, dtype=np.uint8)
+            for name, member in block.members.items():
+                if name in parameter_names:
+                    value = get_material_value(material_name, parameter_names[name], gltf)
+                else:
+                    value = np.ones(16, dtype=np.float32)
+                pack_block_member(data, member, value)
+            self.ranges.append((offset, block.size))
+            chunks.append(data)
+            offset += len(data)
+        self.buffer_id = None
+        if chunks:
+            data = np.concatenate(chunks)
+            self.buffer_id = gl.glGenBuffers(1)
+            gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, self.buffer_id)
+            gl.glBufferData(gl.GL_UNIFORM_BUFFER, data.nbytes, data, gl.GL_STATIC_DRAW)
+            gl.glBindBuffer(gl.GL_UNIFORM_BUFFER, 0)
+            _logger.debug('created material uniform buffer: %d materials, %d bytes', len(chunks), data.nbytes)
+
+    def bind(self, material_slot):
+        """Binds the material block of the material with the given position (in the list of materials)."""
+        material_range = self.ranges[material_slot]
+        if material_range is not None:
+            gl.glBindBufferRange(gl.GL_UNIFORM_BUFFER, MATERIAL_BLOCK_BINDING, self.buffer_id,
+                                 material_range[0], material_range[1])
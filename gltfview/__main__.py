@@ -1,6 +1,5 @@
 from sys import exit
 import os.path
-import json
 import argparse
 import logging
 _logger = logging.getLogger(__name__)
@@ -11,7 +10,7 @@ _DEBUG_LOGGING_FORMAT = '%(asctime).19s [%(levelname)s]%(name)s.%(funcName)s:%(l
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('filename',
-                        help='path of glTF file to view')
+                        help='path of glTF (.gltf or .glb) file to view')
     parser.add_argument("-v", '--verbose',
                         help="enable verbose logging",
                         action="store_true")
@@ -42,6 +41,49 @@ def parse_args():
     parser.add_argument('--display-fps',
                         help='display realtime FPS',
                         action='store_true')
+    parser.add_argument('--load-workers', metavar='N',
+                        help='decode images and read buffers using a pool of N workers (by default, loading is done serially)',
+                        type=int, default=None)
+    parser.add_argument('--load-processes',
+                        help='use a pool of processes rather than threads for decoding images (requires --load-workers)',
+                        action='store_true')
+    parser.add_argument('--cache',
+                        help='cache decoded textures (including their mipmaps), linked shader programs and optimized indices on disk, to speed up subsequent loading of the same assets',
+                        action='store_true')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='directory of the cache (implies --cache, defaults to ~/.cache/gltfview)',
+                        default=None)
+    parser.add_argument('--cache-size', metavar='MB',
+                        help='maximum size of the cache in megabytes (least recently used entries are evicted, default 1024)',
+                        type=int, default=1024)
+    parser.add_argument('--stream-textures',
+                        help='render the first frames with placeholder textures, uploading images progressively as they load',
+                        action='store_true')
+    parser.add_argument('--texture-upload-budget', metavar='KB',
+                        help='maximum amount of texture data (in kilobytes) uploaded per frame when streaming textures (default 4096)',
+                        type=int, default=4096)
+    parser.add_argument('--uniform-buffers',
+                        help='use uniform buffer objects for the per-frame and material uniforms of GLTF 2.0 (PBRMR) materials',
+                        action='store_true')
+    parser.add_argument('--occlusion-culling',
+                        help='cull occluded nodes using occlusion queries of their bounding boxes (from the previous frame): '
+                             '"skip" skips their draws, "conditional" renders them conditionally on the query results',
+                        choices=['skip', 'conditional'], default=None)
+    parser.add_argument('--instancing',
+                        help='draw GLTF 2.0 meshes which are shared by many nodes with instanced draw calls',
+                        action='store_true')
+    parser.add_argument('--optimize-indices',
+                        help='reorder the indices (and vertices) of triangle meshes for the vertex cache and to reduce '
+                             'overdraw when loading them (the results are cached, if --cache is given)',
+                        action='store_true')
+    parser.add_argument('--quantize-attributes',
+                        help='quantize the float vertex attributes of GLTF 2.0 meshes (positions and texture coordinates '
+                             'to 16 bits, normals, tangents and colors to 8 bits) when loading them',
+                        action='store_true')
+    parser.add_argument('--batch-static',
+                        help='merge the primitives of (static) nodes with the same material and attribute layout into '
+                             'batches which are each drawn with a single draw call',
+                        action='store_true')
     args = parser.parse_args()
     if args.uri_prefix is None:
         args.uri_prefix = os.path.dirname(args.filename)
@@ -79,11 +121,20 @@ def main():
     if args.openvr:
         _logger.info('will try viewing using OpenVR...')
     try:
-        gltf = json.loads(open(args.filename).read())
+        from gltfutils.glbutils import load_gltf
+        gltf = load_gltf(args.filename)
         _logger.info('loaded "%s"', args.filename)
     except Exception as err:
         _logger.error('failed to load "%s":\n%s', args.filename, err)
         exit(1)
+    cache = None
+    if args.cache or args.cache_dir is not None:
+        from gltfutils.assetcache import AssetCache
+        try:
+            cache = AssetCache(args.cache_dir, max_size=args.cache_size * 2**20)
+            _logger.info('using cache: %s', cache.cache_dir)
+        except OSError as err:
+            _logger.warning('failed to create cache, continuing without it:\n%s', err)
     from gltfutils.glfwutils import view_gltf
     view_gltf(gltf, args.uri_prefix,
               openvr=args.openvr,
@@ -94,7 +145,18 @@ def main():
               camera_rotation=args.camera_rotation,
               window_title='gltfview - %s' % os.path.split(args.filename)[-1],
               screen_capture_prefix=os.path.splitext(os.path.split(args.filename)[-1])[0],
-              display_fps=args.display_fps)
+              display_fps=args.display_fps,
+              load_workers=args.load_workers,
+              load_processes=args.load_processes,
+              cache=cache,
+              stream_textures=args.stream_textures,
+              texture_upload_budget=args.texture_upload_budget * 1024,
+              use_ubo=args.uniform_buffers,
+              occlusion_culling=args.occlusion_culling,
+              instancing=args.instancing,
+              batch_static=args.batch_static,
+              optimize_indices=args.optimize_indices,
+              quantize_attributes=args.quantize_attributes)
 
 
 if __name__ == "__main__":
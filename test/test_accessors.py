@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from gltfutils.accessors import Accessor, get_accessor_array
+
+
+def _make_gltf(data, bufferViews, accessors):
+    data = bytearray(data)
+    return {'buffers': [{'byteLength': len(data), 'data': memoryview(data)}],
+            'bufferViews': bufferViews, 'accessors': accessors}
+
+
+def test_strided():
+    # VEC3 floats interleaved with a VEC2 (a stride of 20 bytes), within a bufferView at an offset:
+    positions = np.arange(12, dtype=np.float32).reshape(4, 3)
+    interleaved = np.zeros((4, 5), dtype=np.float32)
+    interleaved[:,:3] = positions
+    interleaved[:,3:] = -1
+    gltf = _make_gltf(b'\0' * 8 + interleaved.tobytes(),
+                      [{'buffer': 0, 'byteOffset': 8, 'byteLength': interleaved.nbytes, 'byteStride': 20}],
+                      [{'bufferView': 0, 'byteOffset': 0, 'componentType': 5126, 'count': 4, 'type': 'VEC3'},
+                       {'bufferView': 0, 'byteOffset': 12, 'componentType': 5126, 'count': 4, 'type': 'VEC2'}])
+    accessor = Accessor(gltf, 0)
+    assert accessor.shape == (4, 3)
+    np.testing.assert_array_equal(accessor.array, positions)
+    np.testing.assert_array_equal(get_accessor_array(gltf, 1), -np.ones((4, 2)))
+    # (the array is a view of the buffer data)
+    assert np.shares_memory(accessor.array, np.frombuffer(gltf['buffers'][0]['data'], dtype=np.uint8))
+
+
+def test_strided_v1():
+    # GLTF 1.0: dicts keyed by id, and the byteStride of the accessor:
+    data = np.arange(8, dtype='<u2')
+    gltf = {'buffers': {'b': {'data': memoryview(bytearray(data.tobytes()))}},
+            'bufferViews': {'v': {'buffer': 'b', 'byteLength': data.nbytes}},
+            'accessors': {'a': {'bufferView': 'v', 'byteOffset': 2, 'byteStride': 4, 'componentType': 5123,
+                                'count': 3, 'type': 'SCALAR'}}}
+    np.testing.assert_array_equal(get_accessor_array(gltf, 'a'), [1, 3, 5])
+
+
+def test_normalized():
+    data = np.array([0, 127, -127, -128], dtype=np.int8).tobytes() + np.array([0, 255], dtype=np.uint8).tobytes()
+    gltf = _make_gltf(data, [{'buffer': 0, 'byteLength': len(data)}],
+                      [{'bufferView': 0, 'componentType': 5120, 'count': 4, 'type': 'SCALAR', 'normalized': True},
+                       {'bufferView': 0, 'byteOffset': 4, 'componentType': 5121, 'count': 2, 'type': 'SCALAR',
+                        'normalized': True}])
+    assert get_accessor_array(gltf, 0).dtype == np.int8
+    np.testing.assert_allclose(get_accessor_array(gltf, 0, normalize=True), [0.0, 1.0, -1.0, -1.0])
+    values = get_accessor_array(gltf, 1, normalize=True)
+    assert values.dtype == np.float32
+    np.testing.assert_allclose(values, [0.0, 1.0])
+
+
+def test_sparse():
+    base = np.arange(6, dtype=np.float32)
+    indices = np.array([1, 4], dtype='<u2')
+    values = np.array([10.0, 40.0], dtype=np.float32)
+    data = base.tobytes() + indices.tobytes() + values.tobytes()
+    sparse = {'count': 2, 'indices': {'bufferView': 1, 'componentType': 5123}, 'values': {'bufferView': 2}}
+    gltf = _make_gltf(data, [{'buffer': 0, 'byteLength': base.nbytes},
+                             {'buffer': 0, 'byteOffset': base.nbytes, 'byteLength': indices.nbytes},
+                             {'buffer': 0, 'byteOffset': base.nbytes + indices.nbytes, 'byteLength': values.nbytes}],
+                      [{'bufferView': 0, 'componentType': 5126, 'count': 6, 'type': 'SCALAR', 'sparse': sparse},
+                       {'componentType': 5126, 'count': 6, 'type': 'SCALAR', 'sparse': sparse}])
+    np.testing.assert_array_equal(get_accessor_array(gltf, 0), [0, 10, 2, 3, 40, 5])
+    # (the base data is not modified)
+    np.testing.assert_array_equal(np.frombuffer(gltf['buffers'][0]['data'], dtype=np.float32, count=6), base)
+    # (accessors without a bufferView are initialized with zeros)
+    np.testing.assert_array_equal(get_accessor_array(gltf, 1), [0, 10, 0, 0, 40, 0])
+
+
+def test_matrix_column_alignment():
+    # MAT2 of bytes: each column of 2 bytes is padded to 4 bytes
+    data = bytes([1, 2, 0, 0, 3, 4, 0, 0,
+                  5, 6, 0, 0, 7, 8, 0, 0])
+    gltf = _make_gltf(data, [{'buffer': 0, 'byteLength': len(data)}],
+                      [{'bufferView': 0, 'componentType': 5121, 'count': 2, 'type': 'MAT2'}])
+    array = get_accessor_array(gltf, 0)
+    assert array.shape == (2, 2, 2)
+    # (indexed [column, row])
+    np.testing.assert_array_equal(array[0], [[1, 2], [3, 4]])
+    np.testing.assert_array_equal(array[1], [[5, 6], [7, 8]])
+    # MAT3 of shorts: each column of 6 bytes is padded to 8 bytes
+    matrix = np.zeros((3, 4), dtype='<i2')
+    matrix[:,:3] = np.arange(9).reshape(3, 3)
+    gltf = _make_gltf(matrix.tobytes(), [{'buffer': 0, 'byteLength': matrix.nbytes}],
+                      [{'bufferView': 0, 'componentType': 5122, 'count': 1, 'type': 'MAT3'}])
+    np.testing.assert_array_equal(get_accessor_array(gltf, 0)[0], np.arange(9).reshape(3, 3))
+
+
+def test_out_of_range():
+    gltf = _make_gltf(b'\0' * 24, [{'buffer': 0, 'byteLength': 24}],
+                      [{'bufferView': 0, 'byteOffset': 4, 'componentType': 5126, 'count': 2, 'type': 'VEC3'}])
+    with pytest.raises(Exception):
+        get_accessor_array(gltf, 0)
@@ -0,0 +1,13 @@
+import OpenGL.GL as gl
+
+from gltfutils.assetcache import AssetCache
+
+
+def test_image_key_internal_format(tmp_path):
+    cache = AssetCache(str(tmp_path))
+    source = b'\x89PNG not really an image'
+    key = cache.image_key(source)
+    assert cache.image_key(source) == key
+    assert cache.image_key(source, internal_format=gl.GL_RGB) != key
+    assert cache.image_key(source, internal_format=gl.GL_RGB) != cache.image_key(source, internal_format=gl.GL_RGBA)
+    assert cache.image_key(b'another image') != key
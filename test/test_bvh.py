@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from gltfutils.bvh import BVH
+from gltfutils.culling import cull_boxes
+
+
+def _random_bounds(rng, n):
+    centers = rng.uniform(-50.0, 50.0, (n, 3))
+    extents = rng.uniform(0.0, 3.0, (n, 3))
+    return np.stack([centers - extents, centers + extents], axis=1).astype(np.float32)
+
+
+def _box_distances(bounds, point):
+    return np.linalg.norm(np.maximum(np.maximum(bounds[:,0] - point, point - bounds[:,1]), 0.0), axis=1)
+
+
+def _check_queries(rng, bvh, bounds):
+    for _ in range(20):
+        box = np.sort(rng.uniform(-60.0, 60.0, (2, 3)), axis=0).astype(np.float32)
+        expected = ((bounds[:,0] <= box[1]) & (bounds[:,1] >= box[0])).all(axis=1)
+        np.testing.assert_array_equal(bvh.query_box(box), expected)
+        center = rng.uniform(-60.0, 60.0, 3).astype(np.float32)
+        radius = rng.uniform(0.0, 40.0)
+        np.testing.assert_array_equal(bvh.query_sphere(center, radius), _box_distances(bounds, center) <= radius)
+        # (random planes, pointing into a convex region around a random point)
+        normals = rng.normal(size=(6, 3))
+        normals /= np.linalg.norm(normals, axis=1)[:,None]
+        offsets = rng.uniform(0.0, 40.0, 6) - normals.dot(center)
+        planes = np.concatenate([normals, offsets[:,None]], axis=1).astype(np.float32)
+        np.testing.assert_array_equal(bvh.query_frustum(planes), cull_boxes(planes[None], bounds)[0])
+        point = rng.uniform(-80.0, 80.0, 3).astype(np.float32)
+        item, distance = bvh.nearest(point)
+        distances = _box_distances(bounds, point)
+        assert distance == pytest.approx(distances.min(), abs=1e-4)
+        assert distances[item] == pytest.approx(distances.min(), abs=1e-4)
+        origin = rng.uniform(-80.0, 80.0, 3)
+        direction = rng.uniform(-60.0, 60.0, 3) - origin
+        def entry_distances(items):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t0 = (bounds[items,0] - origin) / direction
+                t1 = (bounds[items,1] - origin) / direction
+            t_enter = np.maximum(np.fmin(t0, t1).max(axis=1), 0.0)
+            t_exit = np.fmax(t0, t1).min(axis=1)
+            distances = np.where(t_enter <= t_exit, t_enter, np.inf)
+            return distances, distances
+        expected = entry_distances(np.arange(len(bounds)))[0].min()
+        hit = bvh.raycast(origin, direction, entry_distances)
+        if np.isinf(expected):
+            assert hit is None
+        else:
+            assert hit[0] == pytest.approx(expected, rel=1e-5)
+
+
+@pytest.mark.parametrize('sah', [True, False])
+@pytest.mark.parametrize('num_items,max_leaf_size', [(1, 4), (7, 4), (300, 4), (1000, 8)])
+def test_bvh_queries(sah, num_items, max_leaf_size):
+    rng = np.random.RandomState(num_items)
+    bounds = _random_bounds(rng, num_items)
+    bvh = BVH(bounds, max_leaf_size=max_leaf_size, sah=sah)
+    assert sorted(bvh.item_indices.tolist()) == list(range(num_items))
+    _check_queries(rng, bvh, bounds)
+    # (refit to moved bounds, without rebuilding the tree)
+    bounds = bounds + rng.uniform(-20.0, 20.0, (num_items, 1, 3)).astype(np.float32)
+    bvh.refit(bounds)
+    _check_queries(rng, bvh, bounds)
+
+
+def test_empty_bvh():
+    bvh = BVH(np.zeros((0, 2, 3)))
+    assert len(bvh) == 0
+    assert not bvh.query_box([[0, 0, 0], [1, 1, 1]]).any()
+    assert bvh.nearest([0, 0, 0]) == (None, np.inf)
@@ -0,0 +1,64 @@
+import base64
+import json
+
+import numpy as np
+
+import gltfutils.datauri as datauri
+from gltfutils.datauri import (DataURI, decode_base64, decode_data_uri, get_decoded_length, is_data_uri,
+                               load_gltf_json)
+
+
+PAYLOAD = bytes(np.random.RandomState(0).randint(0, 256, 1000, dtype=np.uint8))
+
+
+def test_decode_base64():
+    encoded = base64.b64encode(PAYLOAD)
+    assert get_decoded_length(encoded) == len(PAYLOAD)
+    assert decode_base64(encoded) == PAYLOAD
+    assert decode_base64(encoded.decode()) == PAYLOAD
+    # (URL-safe alphabet, without padding)
+    urlsafe = base64.urlsafe_b64encode(PAYLOAD[:998]).rstrip(b'=')
+    assert get_decoded_length(urlsafe) == 998
+    assert decode_base64(urlsafe) == PAYLOAD[:998]
+
+
+def test_decode_base64_chunked(monkeypatch):
+    monkeypatch.setattr(datauri, 'DECODE_CHUNK_SIZE', 16)
+    encoded = base64.b64encode(PAYLOAD[:997])
+    chunks = []
+    assert decode_base64(encoded, chunk_decoded=lambda start, end: chunks.append((start, end))) == PAYLOAD[:997]
+    assert chunks[0] == (0, 16) and chunks[-1][1] == len(encoded)
+    assert all(end == start for (_, end), (start, _) in zip(chunks[:-1], chunks[1:]))
+
+
+def test_data_uri_str():
+    uri = 'data:application/octet-stream;base64,' + base64.b64encode(PAYLOAD).decode()
+    assert is_data_uri(uri)
+    assert not is_data_uri('box.bin')
+    assert bytes(decode_data_uri(uri)) == PAYLOAD
+
+
+def test_load_gltf_json(tmp_path, monkeypatch):
+    # (small chunks, so that payloads are scanned and decoded over several chunks)
+    monkeypatch.setattr(datauri, 'DECODE_CHUNK_SIZE', 64)
+    encoded = base64.b64encode(PAYLOAD).decode()
+    gltf = {'buffers': [{'byteLength': len(PAYLOAD), 'uri': 'data:application/octet-stream;base64,' + encoded},
+                        {'byteLength': len(PAYLOAD), 'uri': 'data:application/gltf-buffer;base64,' + encoded}],
+            'images': [{'uri': 'data:image/png;base64,' + encoded}, {'uri': 'image.png'}],
+            'asset': {'version': '2.0'}}
+    text = json.dumps(gltf)
+    # (JSON escapes in a payload, which is then left to the JSON decoder)
+    index = text.index('gltf-buffer;base64,') + len('gltf-buffer;base64,')
+    escaped_payload = text[index:index+len(encoded)].replace('/', '\\/')
+    text = text[:index] + escaped_payload + text[index+len(encoded):]
+    filename = tmp_path / 'data.gltf'
+    filename.write_text(text)
+    loaded = load_gltf_json(str(filename))
+    first, second = (buffer['uri'] for buffer in loaded['buffers'])
+    assert isinstance(first, DataURI) and first.media_type == 'application/octet-stream'
+    assert '/' in encoded and isinstance(second, str)
+    for uri in (first, second, loaded['images'][0]['uri']):
+        assert is_data_uri(uri)
+        assert bytes(decode_data_uri(uri)) == PAYLOAD
+    assert loaded['images'][1]['uri'] == 'image.png'
+    assert loaded['asset'] == {'version': '2.0'}
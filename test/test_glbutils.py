@@ -0,0 +1,70 @@
+import json
+import struct
+
+import pytest
+
+from gltfutils.glbutils import attach_bin_chunk, load_gltf, read_glb
+
+
+def _make_glb(gltf, bin_data=None, extra_chunks=()):
+    json_data = json.dumps(gltf).encode()
+    json_data += b' ' * (-len(json_data) % 4)
+    chunks = [(b'JSON', json_data)] + list(extra_chunks)
+    if bin_data is not None:
+        chunks.append((b'BIN\x00', bin_data + b'\0' * (-len(bin_data) % 4)))
+    body = b''.join(struct.pack('<I4s', len(data), chunk_type) + data for chunk_type, data in chunks)
+    return struct.pack('<4sII', b'glTF', 2, 12 + len(body)) + body
+
+
+def test_read_glb():
+    gltf = {'asset': {'version': '2.0'}, 'buffers': [{'byteLength': 5}]}
+    glb = _make_glb(gltf, b'abcde', extra_chunks=[(b'XTRA', b'1234')])
+    loaded, bin_chunk = read_glb(glb)
+    assert loaded == gltf
+    assert bytes(bin_chunk) == b'abcde\0\0\0'
+    attach_bin_chunk(loaded, bin_chunk)
+    assert bytes(loaded['buffers'][0]['data']) == b'abcde'
+
+
+def test_read_glb_without_bin_chunk():
+    loaded, bin_chunk = read_glb(_make_glb({'asset': {'version': '2.0'}}))
+    assert bin_chunk is None
+
+
+def test_read_khr_binary_gltf():
+    gltf = {'buffers': {'binary_glTF': {'byteLength': 3}}}
+    content = json.dumps(gltf).encode()
+    data = struct.pack('<4sIIII', b'glTF', 1, 20 + len(content) + 3, len(content), 0) + content + b'xyz'
+    loaded, bin_chunk = read_glb(data)
+    assert loaded == gltf
+    attach_bin_chunk(loaded, bin_chunk)
+    assert bytes(loaded['buffers']['binary_glTF']['data']) == b'xyz'
+
+
+def test_invalid_glb():
+    glb = _make_glb({'buffers': [{'byteLength': 16}]}, b'abcd')
+    with pytest.raises(Exception):
+        read_glb(b'glTF')
+    with pytest.raises(Exception):
+        read_glb(b'glTB' + glb[4:])
+    with pytest.raises(Exception):
+        # (the header length is larger than the data)
+        read_glb(glb[:-1])
+    with pytest.raises(Exception):
+        # (a chunk extends past the end of the data)
+        read_glb(glb[:8] + struct.pack('<I', len(glb) - 4) + glb[12:-4])
+    loaded, bin_chunk = read_glb(glb)
+    with pytest.raises(Exception):
+        # (the buffer is larger than the binary chunk)
+        attach_bin_chunk(loaded, bin_chunk)
+
+
+def test_load_gltf(tmp_path):
+    gltf = {'asset': {'version': '2.0'}, 'buffers': [{'byteLength': 4}]}
+    filename = tmp_path / 'model.glb'
+    filename.write_bytes(_make_glb(gltf, b'data'))
+    loaded = load_gltf(str(filename))
+    assert bytes(loaded['buffers'][0]['data']) == b'data'
+    filename = tmp_path / 'model.gltf'
+    filename.write_text(json.dumps(gltf))
+    assert load_gltf(str(filename)) == gltf
@@ -0,0 +1,44 @@
+import numpy as np
+
+from gltfutils.accessors import get_accessor_array
+from gltfutils.meshopt import optimize_mesh_indices, optimize_triangles
+
+
+def _make_grid(n):
+    # the positions and triangles of an n x n grid of quads, in a shuffled order:
+    rng = np.random.RandomState(0)
+    x, y = np.meshgrid(np.arange(n + 1), np.arange(n + 1))
+    positions = np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1).astype(np.float32)
+    corners = (np.arange(n)[:,None] * (n + 1) + np.arange(n)[None]).ravel()
+    triangles = np.concatenate([np.stack([corners, corners + 1, corners + n + 2], axis=1),
+                                np.stack([corners, corners + n + 2, corners + n + 1], axis=1)])
+    return positions, triangles[rng.permutation(len(triangles))]
+
+
+def test_optimize_triangles_permutation():
+    positions, triangles = _make_grid(12)
+    optimized = optimize_triangles(triangles, positions)
+    assert optimized.shape == triangles.shape
+    assert sorted(map(tuple, optimized.tolist())) == sorted(map(tuple, triangles.tolist()))
+
+
+def test_shared_vertices_of_non_indexed_primitive():
+    positions, triangles = _make_grid(12)
+    indices = triangles.astype(np.uint16).ravel()
+    data = bytearray(positions.tobytes() + indices.tobytes())
+    gltf = {'buffers': [{'byteLength': len(data), 'data': memoryview(data)}],
+            'bufferViews': [{'buffer': 0, 'byteOffset': 0, 'byteLength': positions.nbytes, 'target': 34962},
+                            {'buffer': 0, 'byteOffset': positions.nbytes, 'byteLength': indices.nbytes,
+                             'target': 34963}],
+            'accessors': [{'bufferView': 0, 'byteOffset': 0, 'componentType': 5126, 'count': len(positions),
+                           'type': 'VEC3'},
+                          {'bufferView': 1, 'byteOffset': 0, 'componentType': 5123, 'count': len(indices),
+                           'type': 'SCALAR'}],
+            # (the POSITION data is shared by an indexed primitive and a non-indexed one)
+            'meshes': [{'primitives': [{'attributes': {'POSITION': 0}, 'indices': 1},
+                                       {'attributes': {'POSITION': 0}, 'mode': 0}]}]}
+    optimize_mesh_indices(gltf)
+    np.testing.assert_array_equal(get_accessor_array(gltf, 0), positions)
+    optimized = get_accessor_array(gltf, 1).reshape(-1, 3).astype(np.int64)
+    assert not np.array_equal(optimized, triangles)
+    assert sorted(map(tuple, optimized.tolist())) == sorted(map(tuple, triangles.tolist()))
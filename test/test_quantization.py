@@ -0,0 +1,41 @@
+import numpy as np
+
+from gltfutils.accessors import get_accessor_array
+from gltfutils.gltfutils import get_accessor_bounds, transform_bounds
+from gltfutils.quantization import quantize_attributes
+
+
+def _make_gltf(positions):
+    data = bytearray(positions.tobytes())
+    return {'buffers': [{'byteLength': len(data), 'data': memoryview(data)}],
+            'bufferViews': [{'buffer': 0, 'byteOffset': 0, 'byteLength': len(data), 'target': 34962}],
+            'accessors': [{'bufferView': 0, 'byteOffset': 0, 'componentType': 5126, 'count': len(positions),
+                           'type': 'VEC3', 'min': positions.min(axis=0).tolist(),
+                           'max': positions.max(axis=0).tolist()}],
+            'meshes': [{'primitives': [{'attributes': {'POSITION': 0}}]}],
+            'nodes': [{'mesh': 0}]}
+
+
+def test_quantize_positions_round_trip():
+    rng = np.random.RandomState(0)
+    positions = (rng.uniform(-1.0, 1.0, (100, 3)) * [3.0, 0.5, 10.0] + [100.0, -2.0, 7.0]).astype(np.float32)
+    gltf = _make_gltf(positions)
+    quantize_attributes(gltf)
+    accessor = gltf['accessors'][0]
+    assert accessor['componentType'] == 5122 and accessor['normalized']
+    assert gltf['bufferViews'][0].get('unreferenced')
+    dequantization_matrix = gltf['meshes'][0]['dequantization_matrix'].astype(np.float64)
+    # (one step of the int16 values, in the units of the original positions)
+    step = dequantization_matrix[0,0] / 32767
+    values = get_accessor_array(gltf, 0, normalize=True).reshape(-1, 3).astype(np.float64)
+    dequantized = values.dot(dequantization_matrix[:3,:3]) + dequantization_matrix[3,:3]
+    assert np.abs(dequantized - positions).max() <= step
+    # the world bounds from the quantized accessor bounds and the dequantization matrix:
+    world_matrix = np.eye(4)
+    world_matrix[:3,:3] = [[0.0, 2.0, 0.0], [-2.0, 0.0, 0.0], [0.0, 0.0, 2.0]]
+    world_matrix[3,:3] = [1.0, 2.0, 3.0]
+    bounds = get_accessor_bounds(gltf, 0)
+    world_bounds = transform_bounds(bounds[None], dequantization_matrix.dot(world_matrix)[None])[0]
+    original_bounds = np.array([positions.min(axis=0), positions.max(axis=0)])
+    expected_bounds = transform_bounds(original_bounds[None], world_matrix[None])[0]
+    assert np.abs(world_bounds - expected_bounds).max() <= 2.0 * step * (1 + 1e-4)
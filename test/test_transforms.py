@@ -0,0 +1,30 @@
+import numpy as np
+
+from gltfutils.transforms import compose_matrices, get_instance_matrices, set_matrices_from_quaternions
+
+
+def test_instance_rotation():
+    # EXT_mesh_gpu_instancing instance rotated by +90 degrees about Z, quaternion (x, y, z, w):
+    quat = np.array([0.0, 0.0, np.sqrt(0.5), np.sqrt(0.5)], dtype=np.float32)
+    data = bytearray(quat.tobytes())
+    gltf = {'buffers': [{'byteLength': len(data), 'data': memoryview(data)}],
+            'bufferViews': [{'buffer': 0, 'byteOffset': 0, 'byteLength': len(data)}],
+            'accessors': [{'bufferView': 0, 'byteOffset': 0, 'componentType': 5126, 'count': 1, 'type': 'VEC4'}]}
+    node = {'mesh': 0, 'extensions': {'EXT_mesh_gpu_instancing': {'attributes': {'ROTATION': 0}}}}
+    matrices = get_instance_matrices(gltf, node)
+    assert matrices.shape == (1, 4, 4)
+    # (the matrices are transposed: they transform row vectors)
+    np.testing.assert_allclose(np.array([1.0, 0.0, 0.0, 1.0]).dot(matrices[0]), [0.0, 1.0, 0.0, 1.0], atol=1e-6)
+
+
+def test_compose_matrices_transpose_rotations():
+    translations = np.array([[1.0, 2.0, 3.0]], dtype=np.float32)
+    rotations = np.array([[np.sqrt(0.5), 0.0, 0.0, np.sqrt(0.5)]], dtype=np.float32)
+    scales = np.array([[2.0, 3.0, 4.0]], dtype=np.float32)
+    rotation = set_matrices_from_quaternions(rotations)[0]
+    matrix = compose_matrices(translations, rotations, scales)[0]
+    transposed = compose_matrices(translations, rotations, scales, transpose_rotations=True)[0]
+    # (the rows are scaled, i.e. the scale is applied before the rotation)
+    np.testing.assert_allclose(matrix[:3,:3], np.diag(scales[0]).dot(rotation), atol=1e-6)
+    np.testing.assert_allclose(transposed[:3,:3], np.diag(scales[0]).dot(rotation.T), atol=1e-6)
+    np.testing.assert_allclose(transposed[3], [1.0, 2.0, 3.0, 1.0])